@@ -1,134 +1,85 @@
 """
 Vercel Serverless Function for SpareRoom Monitor Cron Job
 This function is triggered by Vercel Cron
+
+GET /api/cron triggers a run and answers 202 with its run ID straight away.
+With CRON_ASYNC=true the run starts in the background of this process
+(409 if another run is in progress). Vercel freezes a function once it has
+responded, so there CRON_ASYNC defaults to false and the trigger only
+queues the run (or reuses the one already queued).
+
+GET /api/cron/work is the worker, called by Vercel Cron: it runs the
+oldest queued run, or a new one if none is queued, and returns its result
+(409 if another run is in progress). Its request stays open for the run,
+bounded by the function's maximum duration.
+
+GET /api/cron/status?run_id=... reports a run's progress from the
+database, so any instance can answer it.
 """
 
 import os
 import sys
 import json
+import threading
+import time
 from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
 
 # Add parent directory to path so we can import src modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.config import config
-from src.database import db
-from src.scraper import scraper, get_new_ads
-from src.email_service import email_service
 from src.models import CronResult
 from src.logger import logger
-import time
-
-
-def process_user(user, result: CronResult) -> None:
-    """Process a single user's subscription"""
-    result.processed += 1
-
-    try:
-        # Skip users without a Spareroom URL
-        if not user.spareroom_url:
-            logger.warning(f"⚠️  User {user.email} has no Spareroom URL, skipping")
-            result.failed += 1
-            result.errors.append(f"{user.email}: No Spareroom URL")
-            return
-
-        logger.info(f"🔍 Checking listings for {user.email}...")
-
-        # Fetch all ads from the user's Spareroom URL
-        all_ads = scraper.fetch_ads(user.spareroom_url)
-        logger.info(f"   Found {len(all_ads)} total ads")
-
-        if len(all_ads) == 0:
-            logger.info(f"   No ads found for {user.email}")
-            result.successful += 1
-            return
-
-        # Find new ads since last check
-        new_ads = get_new_ads(all_ads, user.last_checked_ad_id)
-
-        if len(new_ads) == 0:
-            logger.info(f"   No new ads for {user.email}")
-
-            # Update last checked ad ID to current newest (no email needed)
-            newest_ad_id = all_ads[0].id
-            db.update_last_checked_ad_id(user.id, newest_ad_id)
-            logger.info(f"   Updated last_checked_ad_id to {newest_ad_id}")
-
-            result.successful += 1
-        else:
-            logger.info(f"   🆕 {len(new_ads)} new ad(s) for {user.email}")
-
-            # Send email notification
-            try:
-                email_service.send_new_listings_email(user.email, new_ads)
-                result.notifications += 1
-
-                # Only update last_checked_ad_id if email was sent successfully
-                newest_ad_id = all_ads[0].id
-                db.update_last_checked_ad_id(user.id, newest_ad_id)
-                logger.info(f"   Updated last_checked_ad_id to {newest_ad_id}")
-
-                result.successful += 1
-
-            except Exception as email_error:
-                logger.error(f"   ❌ Failed to send email to {user.email}: {email_error}")
-                result.errors.append(f"{user.email}: Email failed")
-                result.failed += 1
-                logger.warning(f"   ⚠️  Keeping last_checked_ad_id for retry")
-                return
-
-    except Exception as error:
-        logger.error(f"❌ Error processing user {user.email}: {error}")
-        result.failed += 1
-        result.errors.append(f"{user.email}: {str(error)}")
-
-
-def run_cron_job() -> dict:
+from src.profiling import profile_run, should_profile
+from src.run_history import record_run
+from src.runner import execute_run
+from src.run_status import (
+    RunLockHeld,
+    RunTracker,
+    claim_run,
+    load_status,
+    new_run_id,
+    queue_run,
+    release_run_lock,
+)
+
+
+def run_cron_job(tracker: RunTracker = None) -> dict:
     """Main cron job execution"""
     from datetime import datetime
 
     logger.info(f"🔄 Cron job started at {datetime.now().isoformat()}")
 
     result = CronResult()
+    run_id = tracker.run_id if tracker else new_run_id()
+    started_at = time.time()
 
     try:
-        # Validate configuration
-        config.validate()
-
-        # Get all active subscribers
-        active_users = db.get_active_users()
-
-        if len(active_users) == 0:
-            logger.info("No active users to process")
-            return {
-                "success": True,
-                "message": "No active users to process",
-                "timestamp": datetime.now().isoformat(),
-                **result.to_dict(),
-            }
-
-        # Process each user
-        for i, user in enumerate(active_users):
-            process_user(user, result)
-
-            # Add a small delay between users to avoid rate limiting
-            if i < len(active_users) - 1:
-                time.sleep(config.DELAY_BETWEEN_USERS)
-
-        logger.info("✅ Cron job completed")
-        logger.info(f"   Processed: {result.processed}")
-        logger.info(f"   Successful: {result.successful}")
-        logger.info(f"   Failed: {result.failed}")
-        logger.info(f"   Notifications sent: {result.notifications}")
-
-        return {
+        # PROFILE_SAMPLE_RATE profiles that fraction of triggered runs
+        with profile_run(run_id, enabled=should_profile()) as profiler:
+            execute_run(result, tracker)
+        if profiler:
+            result.stats["profile"] = profiler.summary
+        if tracker:
+            tracker.finish(result)
+        record_run(run_id, "api", "completed", started_at, result)
+
+        response = {
             "success": True,
             "timestamp": datetime.now().isoformat(),
             **result.to_dict(),
         }
+        if result.processed == 0:
+            response["message"] = "No active users to process"
+        return response
 
     except Exception as error:
         logger.error(f"❌ Cron job failed: {error}")
+        if tracker:
+            tracker.fail(error)
+        result.add_error("fatal", f"Fatal error: {error}")
+        record_run(run_id, "api", "failed", started_at, result)
         return {
             "success": False,
             "error": str(error),
@@ -136,11 +87,19 @@ def run_cron_job() -> dict:
         }
 
 
+def run_locked(tracker: RunTracker) -> dict:
+    """Run the job, then release the run lock taken for it"""
+    try:
+        return run_cron_job(tracker)
+    finally:
+        release_run_lock(tracker.run_id)
+
+
 class handler(BaseHTTPRequestHandler):
     """Vercel serverless function handler"""
 
     def do_GET(self):
-        """Handle GET requests from Vercel Cron"""
+        """Handle GET requests from Vercel Cron and status queries"""
 
         # Verify this request is from Vercel Cron or authorized manually
         user_agent = self.headers.get('user-agent', '')
@@ -154,29 +113,92 @@ class handler(BaseHTTPRequestHandler):
         is_authorized = auth_header == f'Bearer {cron_secret}' if cron_secret else False
 
         if not is_vercel_cron and not is_authorized:
-            self.send_response(401)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Unauthorized"}).encode())
+            self.send_json(401, {"error": "Unauthorized"})
+            return
+
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        if path.endswith('/status'):
+            self.send_status(parse_qs(url.query).get('run_id', [None])[0])
             return
 
         try:
-            # Run the cron job
-            result = run_cron_job()
+            if path.endswith('/work'):
+                self.run_worker()
+                return
 
-            # Send response
-            status_code = 200 if result.get("success") else 500
-            self.send_response(status_code)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(result, indent=2).encode())
+            if not config.CRON_ASYNC:
+                # Serverless: leave the run to the next worker invocation
+                run_id = queue_run()
+                logger.info(f"📥 Run {run_id} queued")
+                self.send_json(202, {
+                    "success": True,
+                    "run_id": run_id,
+                    "queued": True,
+                    "status_url": f"/api/cron/status?run_id={run_id}",
+                })
+                return
+
+            tracker = self.claim()
+            if tracker is None:
+                return
+
+            # Start the run, answer the trigger, then stay in the handler until
+            # the run is done (a long-lived server; see the module docstring)
+            worker = threading.Thread(target=run_locked, args=(tracker,), name=f"run-{tracker.run_id}")
+            worker.start()
+            self.send_json(202, {
+                "success": True,
+                "run_id": tracker.run_id,
+                "status_url": f"/api/cron/status?run_id={tracker.run_id}",
+            }, close=True)
+            worker.join()
 
         except Exception as e:
             logger.error(f"Handler error: {e}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({
+            self.send_json(500, {
                 "success": False,
                 "error": str(e)
-            }).encode())
+            })
+
+    def run_worker(self):
+        """Run the queued (or a new) run here and respond with its result"""
+        tracker = self.claim()
+        if tracker is not None:
+            result = run_locked(tracker)
+            self.send_json(200 if result.get("success") else 500, {"run_id": tracker.run_id, **result})
+
+    def claim(self):
+        """Claim the next run, or answer 409 and return None while one is in progress"""
+        try:
+            return claim_run()
+        except RunLockHeld as held:
+            logger.warning(f"⏭️  Trigger ignored: {held}")
+            record_run(new_run_id(), "api", "skipped", time.time(), CronResult())
+            self.send_json(409, {
+                "success": False,
+                "error": "A run is already in progress",
+                "run_id": held.owner,
+                "status_url": f"/api/cron/status?run_id={held.owner}",
+            })
+            return None
+
+    def send_status(self, run_id):
+        """Respond with the status of ``run_id`` (or the latest run)"""
+        status = load_status(run_id)
+        if status is None:
+            self.send_json(404, {"error": f"Unknown run {run_id}" if run_id else "No runs yet"})
+        else:
+            self.send_json(200, status)
+
+    def send_json(self, status_code, body, close=False):
+        """Send a complete JSON response"""
+        payload = json.dumps(body, indent=2).encode()
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if close:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(payload)
+        self.wfile.flush()
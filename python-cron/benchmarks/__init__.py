@@ -0,0 +1 @@
+"""Benchmark scripts for SpareRoom Monitor (run with ``python -m benchmarks.<name>``)"""
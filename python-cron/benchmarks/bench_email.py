@@ -0,0 +1,79 @@
+"""New-listings email: payload bytes and render time, full vs compact rendering
+
+    python -m benchmarks.bench_email [--ads 5,20,60] [--repeat 200]
+
+Renders the HTML and text parts of one email for each ad count in ``--ads``
+both ways: ``full`` (inline styles on every card, every ad) and ``compact``
+(one shared stylesheet, minified, within ``EMAIL_MAX_BYTES`` and
+``EMAIL_MAX_ADS``). Reports the bytes that would be uploaded to Resend and
+the time to build each email.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pages import AREAS, TYPES
+from src.email_render import compact_html, full_html, text_email
+from src.models import SpareRoomAd
+
+SEARCH_URL = "https://www.spareroom.co.uk/flatshare/?search_id=1234567890&mode=list"
+
+
+def make_ads(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    ads = []
+    for n in range(count):
+        area, district = rng.choice(AREAS)
+        ad_id = 17_000_000 + n
+        ads.append(
+            SpareRoomAd(
+                id=str(ad_id),
+                url=f"https://www.spareroom.co.uk/flatshare/flatshare_detail.pl?flatshare_id={ad_id}&search_id=1",
+                title=f"Bright {rng.choice(TYPES).lower()} close to the station in {area}",
+                price=f"£{rng.randrange(500, 1500, 25):,} pcm",
+                location=f"{area} ({district})",
+                property_type=rng.choice(TYPES),
+                availability="Available Now",
+                bills_included=rng.random() < 0.4,
+                min_term=f"{rng.choice([1, 3, 6, 12])} months",
+                max_term=rng.choice([None, "12 months", "24 months"]),
+            )
+        )
+    return ads
+
+
+def render(mode: str, ads):
+    if mode == "full":
+        html, shown = full_html(ads)
+    else:
+        html, shown = compact_html(ads, SEARCH_URL)
+    return html, text_email(ads, SEARCH_URL, shown), shown
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ads", default="5,20,60", help="comma-separated ad counts")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'ads':>4} {'mode':<8} {'shown':>5} {'html bytes':>11} {'text bytes':>11} {'render us':>10}")
+    for count in (int(value) for value in args.ads.split(",")):
+        ads = make_ads(count)
+        for mode in ("full", "compact"):
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                html, text, shown = render(mode, ads)
+            elapsed = (time.perf_counter() - started) / args.repeat
+            print(
+                f"{count:>4} {mode:<8} {shown:>5} {len(html.encode()):>11,} {len(text.encode()):>11,} "
+                f"{elapsed * 1e6:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
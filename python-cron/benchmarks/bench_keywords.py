@@ -0,0 +1,113 @@
+"""Keyword filters: a Python loop per user per ad vs phrase lookups in the FTS5 index
+
+    python -m benchmarks.bench_keywords [--users 2000] [--new 5]
+
+Simulates one run: ``--users`` users, each with two or three include or
+exclude rules, look at a page of 30 ads from the run's 3000 listings, ``--new``
+of which are new to them. The loop version matches every user's compiled
+word patterns against the text of each of their new ads; the FTS version
+indexes each page as the diff stage does and filters through
+``KeywordIndex``, which looks each distinct phrase up once for the rows
+added since it was last asked.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pages import AREAS, TYPES
+from src.keyword_filter import KeywordIndex
+from src.models import SpareRoomAd, User
+
+WORDS = ["garden", "balcony", "couples", "ensuite", "parking", "pets", "students", "furnished", "gym", "bike"]
+
+
+def make_ads(count: int, first_id: int, seed: int = 0):
+    rng = random.Random(seed)
+    ads = []
+    for n in range(count):
+        area, district = rng.choice(AREAS)
+        title = f"Bright {rng.choice(TYPES).lower()} in {area}"
+        # The feature list a results page shows, as in ``pages.listing_html``
+        features = " ".join(f"Feature {k} detail text {k}" for k in range(rng.randint(8, 16)))
+        ads.append(
+            SpareRoomAd(
+                id=str(first_id + n),
+                url="",
+                title=title,
+                raw_text=f"{title} £{rng.randrange(500, 1500, 25)} pcm {area} ({district}) "
+                f"{' '.join(rng.sample(WORDS, 3))} {features}",
+            )
+        )
+    return ads
+
+
+def make_users(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    users = []
+    for n in range(count):
+        words = rng.sample(WORDS, rng.randint(2, 3))
+        rules = ", ".join([words[0]] + [f"-{word}" for word in words[1:]])
+        users.append(User(id=n, email=f"user{n}@example.com", spareroom_url=None, last_checked_ad_id=None,
+                          active=True, keyword_filters=rules))
+    return users
+
+
+def python_loop(users, runs):
+    kept = 0
+    for user, (_, new_ads) in zip(users, runs):
+        terms = [term.strip() for term in user.keyword_filters.split(",")]
+        required = [re.compile(rf"\b{re.escape(term)}\b", re.IGNORECASE) for term in terms if not term.startswith("-")]
+        excluded = [re.compile(rf"\b{re.escape(term[1:])}\b", re.IGNORECASE) for term in terms if term.startswith("-")]
+        for ad in new_ads:
+            text = f"{ad.title} {ad.raw_text}"
+            if all(p.search(text) for p in required) and not any(p.search(text) for p in excluded):
+                kept += 1
+    return kept
+
+
+def fts(index: KeywordIndex, users, runs):
+    index.start(users)
+    kept = 0
+    for user, (page, new_ads) in zip(users, runs):
+        index.observe(page)
+        kept += len(index.filter(user, new_ads))
+    return kept, index.finish()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--new", type=int, default=5)
+    args = parser.parse_args()
+
+    listings = make_ads(3000, 10_000_000, seed=1)
+    users = make_users(args.users)
+    rng = random.Random(2)
+    runs = []
+    for _ in users:
+        page = rng.sample(listings, 30)
+        runs.append((page, page[: args.new]))
+    print(f"{args.users:,} users x {args.new} new ads from 3,000 listings")
+
+    started = time.perf_counter()
+    slow = python_loop(users, runs)
+    print(f"python loop (regex per ad)   {time.perf_counter() - started:8.3f}s  {slow:,} kept")
+
+    index = KeywordIndex()
+    started = time.perf_counter()
+    fast, stats = fts(index, users, runs)
+    elapsed = time.perf_counter() - started
+    print(
+        f"fts5 phrases (index + filter) {elapsed:7.3f}s  {fast:,} kept, filtering {stats['filter_ms']:.0f} ms, "
+        f"{stats['phrase_lookups']:,} phrase lookups, {stats['indexed']:,} rows indexed"
+    )
+
+
+if __name__ == "__main__":
+    main()
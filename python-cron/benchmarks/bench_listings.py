@@ -0,0 +1,128 @@
+"""Listing analytics: SpareRoomAd rows with re-parsed strings vs the columnar store
+
+    python -m benchmarks.bench_listings [--ads 200000] [--sightings 3]
+
+Builds ``--ads`` synthetic ads, each seen ``--sightings`` times a few days
+apart, then answers the same two questions both ways: median monthly rent
+per district for bills-included double rooms seen in the last 30 days, and
+median days on the market per district. The row-by-row version parses the
+price and location strings of every ad, as analytics over the scraped
+objects would; the columnar one appends normalised rows once and queries
+the memory-mapped columns with NumPy.
+"""
+
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pages import AREAS, TYPES
+from src.listings_store import Listings, ListingsStore
+from src.models import SpareRoomAd
+
+PRICE = re.compile(r"£([\d,]+)\s*(pcm|pw)")
+DISTRICT = re.compile(r"\(([A-Z]{1,2}\d{1,2}[A-Z]?)\)")
+
+
+def make_sightings(ads: int, sightings: int, now: float, seed: int = 0):
+    """(seen_at, ad) pairs, oldest first"""
+    rng = random.Random(seed)
+    rows = []
+    for n in range(ads):
+        area, district = rng.choice(AREAS)
+        weekly = rng.random() < 0.2
+        amount = rng.randrange(120, 350, 5) if weekly else rng.randrange(500, 1500, 25)
+        ad = SpareRoomAd(
+            id=str(10_000_000 + n),
+            url=f"https://www.spareroom.co.uk/flatshare/flatshare_detail.pl?flatshare_id={10_000_000 + n}",
+            title=f"Room in {area}",
+            price=f"£{amount:,} {'pw' if weekly else 'pcm'}",
+            location=f"{area} ({district})",
+            property_type=rng.choice(TYPES),
+            availability="Available Now",
+            bills_included=rng.random() < 0.4,
+            min_term=f"{rng.choice([1, 3, 6, 12])} months",
+        )
+        first = now - rng.uniform(0, 60) * 86400
+        for k in range(sightings):
+            rows.append((first + k * rng.uniform(1, 5) * 86400, ad))
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+
+def row_by_row(rows, since: float):
+    rents = defaultdict(list)
+    first_seen, last_seen, where = {}, {}, {}
+    for seen_at, ad in rows:
+        district = DISTRICT.search(ad.location).group(1)
+        first_seen.setdefault(ad.id, seen_at)
+        last_seen[ad.id] = seen_at
+        where[ad.id] = district
+        if seen_at >= since and ad.bills_included and ad.property_type == "Double room":
+            match = PRICE.search(ad.price)
+            amount = int(match.group(1).replace(",", ""))
+            rents[district].append(amount * 52 / 12 if match.group(2) == "pw" else amount)
+    days = defaultdict(list)
+    for ad_id, first in first_seen.items():
+        days[where[ad_id]].append((last_seen[ad_id] - first) / 86400)
+    return {d: statistics.median(v) for d, v in rents.items()}, {d: statistics.median(v) for d, v in days.items()}
+
+
+def columnar(store: ListingsStore, since: float):
+    listings = store.read()
+    rents = listings.where(seen_at=(since, None), bills_included=1, property_type=1)
+    rent = rents.group_by("district", "price_pence", "median")
+    latest = listings.latest()
+    _, days = listings.time_to_let()
+    on_market = Listings({"district": latest["district"], "days": days}).group_by("district", "days", "median")
+    return {d: v / 100 for d, v in rent.items()}, on_market
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ads", type=int, default=200_000)
+    parser.add_argument("--sightings", type=int, default=3)
+    args = parser.parse_args()
+
+    now = time.time()
+    since = now - 30 * 86400
+    rows = make_sightings(args.ads, args.sightings, now)
+    print(f"{len(rows):,} sightings of {args.ads:,} ads")
+
+    started = time.perf_counter()
+    slow_rent, slow_days = row_by_row(rows, since)
+    print(f"row by row, re-parsing strings   {time.perf_counter() - started:8.3f}s")
+
+    with tempfile.TemporaryDirectory() as path:
+        store = ListingsStore(path)
+        started = time.perf_counter()
+        # One append per hour of sightings, as hourly runs would write them
+        by_run = defaultdict(list)
+        for seen_at, ad in rows:
+            by_run[int(seen_at // 3600)].append(ad)
+        for hour, ads in by_run.items():
+            store.append(ads, hour * 3600.0)
+        ingest = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        print(f"columnar ingest (normalise once) {ingest:8.3f}s  {size / 1024 / 1024:.1f} MiB on disk")
+
+        started = time.perf_counter()
+        fast_rent, fast_days = columnar(store, since)
+        print(f"columnar query (memory-mapped)   {time.perf_counter() - started:8.3f}s")
+
+    for district in sorted(slow_rent):
+        print(
+            f"  {district:<5} rent £{slow_rent[district]:,.0f} vs £{fast_rent.get(district, 0):,.0f}   "
+            f"days on market {slow_days[district]:.1f} vs {fast_days.get(district, 0):.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
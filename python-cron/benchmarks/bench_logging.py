@@ -0,0 +1,107 @@
+"""Logging overhead per user: eager f-strings vs lazy arguments, sync vs background
+
+    python -m benchmarks.bench_logging [--users 20000] [--sink-latency-us 20]
+
+Replays the five per-user lines a run logs (fetch, parse, diff, notify,
+persist) for ``--users`` users into a sink that blocks for
+``--sink-latency-us`` per write, like a pipe to a slow log shipper. Reports
+the time the calling thread spends logging per user, the total until every
+line is written, and lines dropped because the log queue was full.
+"""
+
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.logger import _handlers, search_key, setup_logger
+
+
+class SlowSink(io.TextIOBase):
+    """Discards writes after blocking (without the GIL) for a fixed delay"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        if self.latency:
+            time.sleep(self.latency)
+        self.lines += 1
+        return len(text)
+
+
+def eager(logger: logging.Logger, user_id: int, email: str, url: str) -> None:
+    logger.info(f"🔍 Checked listings for {email}")
+    logger.info(f"   Found {20} total ads for {email}")
+    logger.info(f"   🆕 {3} new ad(s) for {email}")
+    logger.info(f"   📥 Queued {3} ad(s) for {email}'s digest")
+    logger.info(f"   Updated last_checked_ad_id to {user_id + 1000} for {email}")
+
+
+def lazy(logger: logging.Logger, user_id: int, email: str, url: str, structured: bool = False) -> None:
+    def fields(stage, duration=None):
+        # As in the runner, fields are only built for JSON output
+        if not structured:
+            return None
+        return {"user_id": user_id, "search": search_key(url), "stage": stage, "duration": duration}
+
+    logger.info("🔍 Checked listings for %s", email, extra=fields("fetch", 0.31))
+    logger.info("   Found %d total ads for %s", 20, email, extra=fields("parse", 0.004))
+    logger.info("   🆕 %d new ad(s) for %s", 3, email, extra=fields("diff"))
+    logger.info("   📥 Queued %d ad(s) for %s's digest", 3, email, extra=fields("notify"))
+    logger.info("   Updated last_checked_ad_id to %s for %s", user_id + 1000, email, extra=fields("persist"))
+
+
+def structured(logger: logging.Logger, user_id: int, email: str, url: str) -> None:
+    lazy(logger, user_id, email, url, structured=True)
+
+
+def run(label: str, emit, users: int, latency: float, **options) -> None:
+    sink = SlowSink(latency)
+    logger = setup_logger(f"bench.{label}", stream=sink, **options)
+    handler = logger.handlers[0]
+
+    started = time.perf_counter()
+    for user_id in range(users):
+        emit(logger, user_id, f"user{user_id}@example.com", f"https://www.spareroom.co.uk/flatshare/?search_id={user_id}")
+    caller = time.perf_counter() - started
+
+    dropped = 0
+    if handler in _handlers:
+        # Wait for the listener to write everything out
+        _handlers.remove(handler)
+        handler.listener.stop()
+        dropped = handler.dropped
+    total = time.perf_counter() - started
+    logger.handlers = []
+
+    print(
+        f"{label:<32} caller {caller / users * 1e6:7.1f} µs/user  total {total / users * 1e6:7.1f} µs/user  "
+        f"{sink.lines:>7} written {dropped:>6} dropped"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--sink-latency-us", type=float, default=20)
+    args = parser.parse_args()
+    latency = args.sink_latency_us / 1e6
+
+    common = {"users": args.users, "latency": latency}
+    run("f-strings, sync", eager, background=False, sample_rate=0, **common)
+    run("lazy, sync", lazy, background=False, sample_rate=0, **common)
+    run("lazy, background", lazy, background=True, sample_rate=0, **common)
+    run("lazy, background, json", structured, background=True, sample_rate=0, fmt="json", **common)
+    run("lazy, background, sampled 50/s", lazy, background=True, sample_rate=50, **common)
+    run("f-strings, level WARNING", eager, level="WARNING", background=True, sample_rate=0, **common)
+    run("lazy, level WARNING", lazy, level="WARNING", background=True, sample_rate=0, **common)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Area-feed matching: inverted index vs checking every subscriber's filter
+
+    python -m benchmarks.bench_matcher [--ads 300] [--users 1000 10000 50000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pages import AREAS, results_page
+from src.area_feed import SubscriberIndex, parse_search_url
+from src.models import User
+from src.parsing import parse_listings
+
+DISTRICTS = [district for _, district in AREAS] + ["E1", "SE15", "W2", "N7", "NW3", "SW9", "E17", "N16"]
+
+
+def random_url(rng: random.Random) -> str:
+    params = [f"where={'+'.join(rng.sample(DISTRICTS, rng.randint(1, 3)))}"]
+    if rng.random() < 0.8:
+        params.append(f"max_rent={rng.randrange(600, 1600, 50)}")
+    if rng.random() < 0.3:
+        params.append(f"min_rent={rng.randrange(300, 700, 50)}")
+    if rng.random() < 0.5:
+        params.append(f"room_types={rng.choice(['double', 'single', 'studio', 'double,studio'])}")
+    if rng.random() < 0.3:
+        params.append("bills_inc=yes")
+    return "https://www.spareroom.co.uk/flatshare/?" + "&".join(params)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ads", type=int, default=300)
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    ads = parse_listings(results_page(10_000_000, args.ads))
+    rng = random.Random(0)
+
+    for count in args.users:
+        users = [
+            User(id=i, email=f"u{i}@example.com", spareroom_url=random_url(rng), last_checked_ad_id=None, active=True)
+            for i in range(count)
+        ]
+        filters = [(user, parse_search_url(user.spareroom_url)) for user in users]
+
+        started = time.perf_counter()
+        index = SubscriberIndex()
+        for user, search in filters:
+            index.add(user, search)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        indexed = sum(len(list(index.match(ad))) for ad in ads)
+        via_index = time.perf_counter() - started
+
+        started = time.perf_counter()
+        scanned = sum(1 for ad in ads for _, search in filters if search.matches(ad))
+        via_scan = time.perf_counter() - started
+
+        assert indexed == scanned, (indexed, scanned)
+        print(
+            f"{count:>7} users: build {build * 1000:7.1f} ms  "
+            f"index {via_index / len(ads) * 1e6:8.1f} µs/ad  scan {via_scan / len(ads) * 1e6:9.1f} µs/ad  "
+            f"({indexed / len(ads):.0f} matches/ad)"
+        )
+
+
+if __name__ == "__main__":
+    main()
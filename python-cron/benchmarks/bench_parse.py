@@ -0,0 +1,50 @@
+"""Parsing throughput: inline vs the process pool at 1, 2, 4 and 8 workers
+
+    python -m benchmarks.bench_parse [--pages 64] [--listings 30]
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pages import results_pages
+from src.parse_pool import ParsePool
+from src.parsing import parse_listings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=64)
+    parser.add_argument("--listings", type=int, default=30)
+    parser.add_argument("--chunk-size", type=int, default=4)
+    args = parser.parse_args()
+
+    pages = results_pages(args.pages, args.listings)
+    size_kb = sum(len(p) for p in pages) / len(pages) / 1024
+    print(f"{args.pages} pages, {args.listings} listings, {size_kb:.0f} KiB each, {os.cpu_count()} CPU(s)")
+
+    ads = parse_listings(pages[0])
+    as_objects = len(pickle.dumps(ads))
+    as_records = len(pickle.dumps([ad.to_record() for ad in ads]))
+    print(f"IPC payload per page: {as_objects} B as dataclasses, {as_records} B as records")
+
+    started = time.perf_counter()
+    for html in pages:
+        parse_listings(html)
+    baseline = time.perf_counter() - started
+    print(f"{'inline':>10}: {args.pages / baseline:7.1f} pages/s")
+
+    for workers in (1, 2, 4, 8):
+        with ParsePool(workers=workers, chunk_size=args.chunk_size, inline_below=0) as pool:
+            started = time.perf_counter()
+            pool.parse_many(pages)
+            elapsed = time.perf_counter() - started
+        print(f"{workers:>2} worker(s): {args.pages / elapsed:7.1f} pages/s  ({baseline / elapsed:.2f}x inline)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Transport behaviour against a local slow/stalling server
+
+    python -m benchmarks.bench_transport [--requests 200] [--slow-rate 0.04] [--check]
+
+Starts a throwaway HTTP server on 127.0.0.1 that compresses a synthetic
+results page (brotli or gzip, whichever the client prefers), delays a
+fraction of responses, and has endpoints that stall half way through the
+body or before sending headers. Reports latency percentiles and bytes on the
+wire with hedging off and on, and checks the total deadline cuts off both
+stalls. With ``--check`` only the checks run, and the script exits non-zero
+if brotli is not negotiated or a stalled fetch outlives the deadline.
+"""
+
+import argparse
+import gzip
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pages import results_page
+from src.transport import DeadlineExceeded, Transport
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PAGE = results_page(10_000_000).encode()
+PAGE_GZ = gzip.compress(PAGE)
+PAGE_BR = brotli.compress(PAGE) if brotli else None
+
+
+def make_handler(slow_rate: float, slow_seconds: float):
+    rng = random.Random(1)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Send headers and body in one write so delayed ACKs don't skew latency
+        wbufsize = 1 << 16
+
+        def do_GET(self):
+            if self.path.startswith("/stall"):
+                # Headers and half the body, then nothing for a long time
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(PAGE)))
+                self.end_headers()
+                self.wfile.write(PAGE[: len(PAGE) // 2])
+                self.wfile.flush()
+                for _ in range(12):
+                    time.sleep(0.25)
+                    self.wfile.write(b" ")
+                    self.wfile.flush()
+                return
+            if self.path.startswith("/hold"):
+                # Nothing at all for three seconds, then the page
+                time.sleep(3)
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(PAGE)))
+                self.end_headers()
+                self.wfile.write(PAGE)
+                return
+
+            with lock:
+                slow = rng.random() < slow_rate
+            if slow:
+                time.sleep(slow_seconds)
+
+            accepted = self.headers.get("Accept-Encoding", "")
+            if PAGE_BR and "br" in accepted:
+                encoding, body = "br", PAGE_BR
+            elif "gzip" in accepted:
+                encoding, body = "gzip", PAGE_GZ
+            else:
+                encoding, body = None, PAGE
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class Server(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients hanging up on a stall is the point of the checks
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def run(transport: Transport, url: str, count: int) -> list:
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        transport.get(url)
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+def pct(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def check_brotli(base: str) -> bool:
+    """The transport offers brotli and decodes a brotli body"""
+    result = Transport().get(f"{base}/page")
+    ok = result.headers.get("Content-Encoding") == "br" and result.text == PAGE.decode()
+    print(f"brotli: {'negotiated' if ok else 'NOT negotiated'} "
+          f"({result.headers.get('Content-Encoding') or 'identity'}, {result.wire_bytes} B on the wire)")
+    return ok
+
+
+def check_stall(base: str, path: str = "/stall", total_timeout: float = 1.0) -> bool:
+    """A fetch that stalls past the total deadline (but never trips the read timeout) is aborted at it"""
+    transport = Transport(read_timeout=5, total_timeout=total_timeout)
+    started = time.perf_counter()
+    try:
+        transport.get(f"{base}{path}")
+        print(f"{path}: completed after {time.perf_counter() - started:.2f}s (deadline NOT enforced)")
+        return False
+    except DeadlineExceeded:
+        elapsed = time.perf_counter() - started
+        print(f"{path}: cut off by the total deadline after {elapsed:.2f}s")
+        return elapsed < total_timeout + 0.5 and transport.stats()["deadline_exceeded"] == 1
+    except requests.RequestException as error:
+        print(f"{path}: failed after {time.perf_counter() - started:.2f}s without the deadline ({error!r})")
+        return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--slow-rate", type=float, default=0.04)
+    parser.add_argument("--slow-seconds", type=float, default=0.5)
+    parser.add_argument("--check", action="store_true", help="only run the brotli and deadline checks")
+    args = parser.parse_args()
+
+    server = Server(("127.0.0.1", 0), make_handler(args.slow_rate, args.slow_seconds))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    if args.check:
+        ok = check_brotli(base)
+        ok = check_stall(base) and ok
+        ok = check_stall(base, "/hold") and ok
+        server.shutdown()
+        sys.exit(0 if ok else 1)
+
+    print(
+        f"page: {len(PAGE)} B raw, {len(PAGE_GZ)} B gzip, "
+        f"{f'{len(PAGE_BR)} B brotli' if PAGE_BR else 'no brotli'}; "
+        f"{args.slow_rate:.0%} of responses +{args.slow_seconds}s"
+    )
+
+    for hedge in (False, True):
+        transport = Transport(pool_size=4, hedge=hedge, hedge_min_samples=20, hedge_budget=0.2)
+        latencies = run(transport, f"{base}/page", args.requests)
+        stats = transport.stats()
+        print(
+            f"hedging {'on ' if hedge else 'off'}: p50 {pct(latencies, 0.5) * 1000:6.1f} ms  "
+            f"p95 {pct(latencies, 0.95) * 1000:6.1f} ms  p99 {pct(latencies, 0.99) * 1000:6.1f} ms  "
+            f"wire {stats['wire_bytes'] / stats['requests']:.0f} B/fetch  "
+            f"decoded {stats['body_bytes'] / stats['requests']:.0f} B/fetch  "
+            f"hedges {stats['hedges']} (won {stats['hedge_wins']})"
+        )
+
+    check_stall(base)
+    check_stall(base, "/hold")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Synthetic SpareRoom pages shared by the benchmarks"""
+
+import random
+from typing import List
+
+AREAS = [("Camden", "NW1"), ("Islington", "N1"), ("Clapham", "SW4"), ("Hackney", "E8"), ("Brixton", "SW2")]
+TYPES = ["Double room", "Single room", "Studio", "2 bed flat"]
+
+
+def listing_html(ad_id: int, rng: random.Random) -> str:
+    """One search-result ``<li>`` with the snippets the scraper extracts"""
+    area, district = rng.choice(AREAS)
+    price = rng.randrange(500, 1500, 25)
+    bills = " (bills included)" if rng.random() < 0.4 else ""
+    filler = "".join(
+        f'<div class="listing-feature"><span>Feature {n}</span><em>detail text {n}</em></div>'
+        for n in range(rng.randint(8, 16))
+    )
+    return (
+        f'<li class="listing-result">'
+        f'<a href="/flatshare/flatshare_detail.pl?flatshare_id={ad_id}&search_id=1">'
+        f"Bright {rng.choice(TYPES).lower()} close to the station in {area}</a>"
+        f"<strong>£{price:,} pcm{bills}</strong>"
+        f"<p>{area} ({district})</p><p>{rng.choice(TYPES)}</p><p>Available Now</p>"
+        f"<p>Min term: {rng.choice([1, 3, 6, 12])} months</p>{filler}</li>"
+    )
+
+
+def results_page(first_id: int, listings: int = 30, seed: int = 0) -> str:
+    """A results page with ``listings`` ads, newest first"""
+    rng = random.Random(seed)
+    items = "".join(listing_html(first_id - i, rng) for i in range(listings))
+    header = "".join(f'<li class="nav"><a href="/nav/{n}">Nav {n}</a></li>' for n in range(40))
+    return f"<html><head><title>Results</title></head><body><ul>{header}</ul><ul>{items}</ul></body></html>"
+
+
+def results_pages(count: int, listings: int = 30) -> List[str]:
+    """``count`` distinct pages"""
+    return [results_page(10_000_000 + i * 100, listings, seed=i) for i in range(count)]
@@ -4,126 +4,159 @@ SpareRoom Monitor - Cron Job
 Checks for new SpareRoom listings and notifies subscribers
 """
 
+import argparse
+import json
 import sys
 import time
-from datetime import datetime
 
-from src.config import config
-from src.database import db
-from src.scraper import scraper, get_new_ads
-from src.email_service import email_service
-from src.models import CronResult
 from src.logger import logger
 
 
-def process_user(user, result: CronResult) -> None:
-    """Process a single user's subscription"""
-    result.processed += 1
-
-    try:
-        # Skip users without a Spareroom URL
-        if not user.spareroom_url:
-            logger.warning(f"⚠️  User {user.email} has no Spareroom URL, skipping")
-            result.failed += 1
-            result.errors.append(f"{user.email}: No Spareroom URL")
-            return
-
-        logger.info(f"🔍 Checking listings for {user.email}...")
-
-        # Fetch all ads from the user's Spareroom URL
-        all_ads = scraper.fetch_ads(user.spareroom_url)
-        logger.info(f"   Found {len(all_ads)} total ads")
-
-        if len(all_ads) == 0:
-            logger.info(f"   No ads found for {user.email}")
-            result.successful += 1
-            return
-
-        # Find new ads since last check
-        new_ads = get_new_ads(all_ads, user.last_checked_ad_id)
-
-        if len(new_ads) == 0:
-            logger.info(f"   No new ads for {user.email}")
-
-            # Update last checked ad ID to current newest (no email needed)
-            newest_ad_id = all_ads[0].id
-            db.update_last_checked_ad_id(user.id, newest_ad_id)
-            logger.info(f"   Updated last_checked_ad_id to {newest_ad_id}")
-
-            result.successful += 1
-        else:
-            logger.info(f"   🆕 {len(new_ads)} new ad(s) for {user.email}")
-
-            # Send email notification
-            try:
-                email_service.send_new_listings_email(user.email, new_ads)
-                result.notifications += 1
-
-                # Only update last_checked_ad_id if email was sent successfully
-                # This ensures we retry failed emails on the next run
-                newest_ad_id = all_ads[0].id
-                db.update_last_checked_ad_id(user.id, newest_ad_id)
-                logger.info(f"   Updated last_checked_ad_id to {newest_ad_id}")
-
-                result.successful += 1
-
-            except Exception as email_error:
-                logger.error(f"   ❌ Failed to send email to {user.email}: {email_error}")
-                result.errors.append(f"{user.email}: Email failed")
-                result.failed += 1
-                # Don't update last_checked_ad_id - we'll retry these ads next time
-                logger.warning(f"   ⚠️  Keeping last_checked_ad_id for retry")
-                return
-
-    except Exception as error:
-        logger.error(f"❌ Error processing user {user.email}: {error}")
-        result.failed += 1
-        result.errors.append(f"{user.email}: {str(error)}")
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="SpareRoom Monitor cron job")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and check searches on an in-process schedule",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        help="seconds between checks of the same search in daemon mode",
+    )
+    parser.add_argument(
+        "--watch",
+        action="append",
+        metavar="URL",
+        default=[],
+        help="also log new ads for a search URL without emailing anyone (daemon mode)",
+    )
+    parser.add_argument(
+        "--no-users",
+        action="store_true",
+        help="only monitor --watch URLs, skip subscribers (daemon mode)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the run (CPU and allocations) and write the results to PROFILE_DIR",
+    )
+    archive = parser.add_mutually_exclusive_group()
+    archive.add_argument(
+        "--record",
+        metavar="ARCHIVE",
+        help="append every fetched page, with headers and timing, to a compressed archive",
+    )
+    archive.add_argument(
+        "--replay",
+        metavar="ARCHIVE",
+        help="serve fetches from a recorded archive instead of the network",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="replay recorded latencies this many times faster (0 for no delay)",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    report = commands.add_parser("report", help="show trends from the run history (cron_runs table)")
+    report.add_argument("--days", type=float, default=7, help="how many days of runs to include")
+    report.add_argument("--top", type=int, default=10, help="number of slowest searches to list")
+    report.add_argument("--json", action="store_true", help="print the report as JSON")
+    listings = commands.add_parser("listings", help="price and time-to-let by district from LISTINGS_STORE_DIR")
+    listings.add_argument("--days", type=float, default=30, help="how many days of listings to include")
+    listings.add_argument("--district", action="append", default=[], help="only these districts (repeatable)")
+    listings.add_argument("--json", action="store_true", help="print the summary as JSON")
+    return parser.parse_args(argv)
+
+
+def run_daemon(args: argparse.Namespace) -> None:
+    """Run the long-lived monitor until SIGTERM/SIGINT"""
+    from src.daemon import MonitorDaemon
+
+    MonitorDaemon(
+        interval=args.interval,
+        watch_urls=args.watch,
+        include_users=not args.no_users,
+    ).run()
+    sys.exit(0)
+
+
+def show_report(args: argparse.Namespace) -> None:
+    """Print run-history trends and exit"""
+    from src.run_history import build_report, format_report
+
+    report = build_report(days=args.days, top=args.top)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    sys.exit(0)
+
+
+def show_listings(args: argparse.Namespace) -> None:
+    """Print median rent, ad counts and time-to-let per district and exit"""
+    from src.config import config
+    from src.listings_store import Listings, ListingsStore
+
+    if not config.LISTINGS_STORE_DIR:
+        print("LISTINGS_STORE_DIR is not set.")
+        sys.exit(1)
 
+    conditions = {"seen_at": (time.time() - args.days * 86400, None)}
+    if args.district:
+        conditions["district"] = [name.upper() for name in args.district]
+    recent = ListingsStore(config.LISTINGS_STORE_DIR).read().where(**conditions)
+    latest = recent.latest()
+    ids, days = recent.time_to_let()
+
+    # Ads not seen for a day have most likely been let
+    gone = latest["seen_at"] < (recent["seen_at"].max() - 86400 if len(recent) else 0)
+    let = Listings({"district": latest["district"][gone], "days": days[gone]})
+
+    prices = latest.group_by("district", "price_pence", "median")
+    to_let = let.group_by("district", "days", "median")
+    summary = {
+        district: {
+            "ads": int(count),
+            "median_monthly_price": prices.get(district, 0) / 100,
+            "median_days_to_let": to_let.get(district),
+        }
+        for district, count in latest.group_by("district", "ad_id", "count").items()
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"🏠 {len(latest)} ad(s) seen in the last {args.days:g} day(s), {int(gone.sum())} no longer listed")
+        print(f"{'district':<9} {'ads':>6} {'median pcm':>11} {'days to let':>12}")
+        for district, row in sorted(summary.items(), key=lambda item: item[1]["ads"], reverse=True):
+            to_let = "-" if row["median_days_to_let"] is None else f"{row['median_days_to_let']:.1f}"
+            print(f"{district:<9} {row['ads']:>6} {'£' + format(row['median_monthly_price'], ',.0f'):>11} {to_let:>12}")
+    sys.exit(0)
 
-def run_cron_job() -> CronResult:
-    """Main cron job execution"""
-    logger.info(f"🔄 Cron job started at {datetime.now().isoformat()}")
 
-    result = CronResult()
+def main():
+    """Entry point for the cron job"""
+    args = parse_args()
 
     try:
-        # Validate configuration
-        config.validate()
-
-        # Get all active subscribers
-        active_users = db.get_active_users()
-
-        if len(active_users) == 0:
-            logger.info("No active users to process")
-            return result
+        # Imported here, not at the top: parse pool workers import this
+        # module too, and must not build the scraper or load an archive
+        from src.runner import run_cron_job
+        from src.scraper import scraper
 
-        # Process each user
-        for i, user in enumerate(active_users):
-            process_user(user, result)
+        if args.command == "report":
+            show_report(args)
+        if args.command == "listings":
+            show_listings(args)
 
-            # Add a small delay between users to avoid rate limiting
-            if i < len(active_users) - 1:
-                time.sleep(config.DELAY_BETWEEN_USERS)
+        if args.record:
+            scraper.record(args.record)
+        elif args.replay:
+            scraper.replay(args.replay, args.replay_speed)
 
-        logger.info("✅ Cron job completed")
-        logger.info(f"   Processed: {result.processed}")
-        logger.info(f"   Successful: {result.successful}")
-        logger.info(f"   Failed: {result.failed}")
-        logger.info(f"   Notifications sent: {result.notifications}")
+        if args.daemon:
+            run_daemon(args)
 
-        return result
-
-    except Exception as error:
-        logger.error(f"❌ Cron job failed: {error}")
-        result.errors.append(f"Fatal error: {str(error)}")
-        return result
-
-
-def main():
-    """Entry point for the cron job"""
-    try:
-        result = run_cron_job()
+        result = run_cron_job(profile=args.profile)
 
         # Exit with error code if any failures occurred
         if result.failed > 0:
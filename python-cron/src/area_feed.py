@@ -0,0 +1,357 @@
+"""Area-feed mode: fetch a few broad searches and match ads to subscribers locally
+
+Instead of one upstream fetch per subscriber, the configured ``AREA_FEEDS``
+(broad SpareRoom searches, e.g. a whole city, newest first) are fetched
+once per run. Each subscriber's ``spareroom_url`` is parsed into a
+``SearchFilter`` (postcode districts, monthly price band, room types, bills
+included), and the filters are compiled into a ``SubscriberIndex``: bitset
+postings per district, room type, bills requirement and price bucket. An
+ad is matched by AND-ing a handful of bitsets and checking only the
+surviving candidates exactly, so the cost per ad barely grows with the
+number of subscribers.
+
+Each feed is paged until it reaches the oldest watermark among the matched
+users (so nothing posted since their last check was pushed off the pages
+read) or runs out, up to ``AREA_FEED_PAGES`` pages. Users whose watermark
+the feeds did not reach within that cap are fetched individually this run
+and their watermarks are left alone, as are subscribers whose URL uses
+options a filter can't express (saved searches, place names, age or gender
+filters, ...).
+"""
+
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from .config import config
+from .models import SpareRoomAd, User, UserJob
+from .parse_cache import parse_cache
+from .rate_limiter import rate_limiter
+from .scraper import scraper, parse_listings
+from .logger import logger
+
+# Query parameters that don't narrow which ads a search returns (a radius
+# or flatshare type does, so those searches are fetched individually)
+IGNORED_PARAMS = {
+    "action", "mode", "offset", "per", "search_id", "search_type", "submit",
+}
+ROOM_TYPES = {"double", "single", "studio", "whole"}
+PRICE_BUCKET = 50
+PRICE_CAP = 10_000
+PAGE_SIZE = 10
+
+_DISTRICT = re.compile(r"^[A-Z]{1,2}\d[A-Z\d]?$")
+_AREA = re.compile(r"^[A-Z]{1,2}$")
+_PRICE = re.compile(r"£([\d,]+)\s*(pcm|pw|per month|per week)", re.IGNORECASE)
+_LOCATION_DISTRICT = re.compile(r"\(([A-Z]{1,2}\d[A-Z\d]?)\)")
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """The part of a SpareRoom search that can be matched locally"""
+    districts: FrozenSet[str] = frozenset()  # postcode districts or areas; empty = anywhere
+    min_price: Optional[int] = None  # £ per month
+    max_price: Optional[int] = None
+    room_types: FrozenSet[str] = frozenset()  # empty = any
+    bills_included: bool = False
+
+    def matches(self, ad: SpareRoomAd, facets: Optional[Tuple] = None) -> bool:
+        """Exact check of one ad against the filter (``facets`` from ``ad_facets``)"""
+        districts, price, room_type = facets or ad_facets(ad)
+        if self.districts and self.districts.isdisjoint(districts):
+            return False
+        if self.room_types and room_type not in self.room_types:
+            return False
+        if self.bills_included and not ad.bills_included:
+            return False
+        if self.min_price is not None or self.max_price is not None:
+            if price is None:
+                return False
+            if self.min_price is not None and price < self.min_price:
+                return False
+            if self.max_price is not None and price > self.max_price:
+                return False
+        return True
+
+
+def parse_search_url(url: Optional[str]) -> Optional[SearchFilter]:
+    """Turn a search URL into a SearchFilter, or None if it can't be expressed"""
+    if not url:
+        return None
+
+    params = dict(parse_qsl(urlparse(url).query))
+    known = {"where", "min_rent", "max_rent", "room_types", "bills_inc"}
+    if set(params) - known - IGNORED_PARAMS or "where" not in params:
+        return None
+
+    districts = set()
+    for token in re.split(r"[\s,+]+", params["where"].strip().upper()):
+        if not token:
+            continue
+        if not (_DISTRICT.match(token) or _AREA.match(token)):
+            return None  # a place name: only SpareRoom knows its boundary
+        districts.add(token)
+    if not districts:
+        return None
+
+    weekly = params.get("per", "pcm").lower() == "pw"
+    try:
+        min_price = _monthly(int(params["min_rent"]), weekly) if params.get("min_rent") else None
+        max_price = _monthly(int(params["max_rent"]), weekly) if params.get("max_rent") else None
+    except ValueError:
+        return None
+
+    room_types = {t.strip().lower() for t in params.get("room_types", "").split(",") if t.strip()}
+    if room_types - ROOM_TYPES:
+        return None
+
+    return SearchFilter(
+        districts=frozenset(districts),
+        min_price=min_price,
+        max_price=max_price,
+        room_types=frozenset(room_types),
+        bills_included=params.get("bills_inc", "").lower() in ("yes", "y", "1", "true"),
+    )
+
+
+def ad_facets(ad: SpareRoomAd) -> Tuple[FrozenSet[str], Optional[int], Optional[str]]:
+    """(district keys, £ per month, room type) of an ad, where known"""
+    match = _LOCATION_DISTRICT.search(ad.location or "")
+    districts = district_keys(match.group(1) if match else None)
+
+    price = None
+    match = _PRICE.search(ad.price or "")
+    if match:
+        price = _monthly(int(match.group(1).replace(",", "")), match.group(2).lower() in ("pw", "per week"))
+
+    kind = (ad.property_type or "").lower()
+    if "double" in kind:
+        room_type = "double"
+    elif "single" in kind:
+        room_type = "single"
+    elif "studio" in kind:
+        room_type = "studio"
+    elif "bed" in kind:
+        room_type = "whole"
+    else:
+        room_type = None
+
+    return districts, price, room_type
+
+
+def district_keys(district: Optional[str]) -> FrozenSet[str]:
+    """Keys a user filter can name to cover ``district``: E1W → E1W, E1, E"""
+    if not district:
+        return frozenset()
+    keys = {district, re.match(r"[A-Z]+", district).group(0)}
+    if district[-1].isalpha():
+        keys.add(district[:-1])
+    return frozenset(keys)
+
+
+def _monthly(amount: int, weekly: bool) -> int:
+    return round(amount * 52 / 12) if weekly else amount
+
+
+class SubscriberIndex:
+    """Inverted index from ad facets to the subscribers whose filter may match
+
+    Subscriber ``i`` is bit ``i`` of every posting, so narrowing the
+    candidates for an ad is a few integer ANDs regardless of how many
+    subscribers there are; only the survivors get the exact check.
+    Postings are collected as lists and turned into bitsets on first use.
+    """
+
+    def __init__(self):
+        self.users: List[User] = []
+        self.filters: List[SearchFilter] = []
+        self._postings: Dict[tuple, List[int]] = defaultdict(list)
+        self._bitsets: Optional[Dict[tuple, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def add(self, user: User, search: SearchFilter) -> None:
+        index = len(self.users)
+        self.users.append(user)
+        self.filters.append(search)
+        self._bitsets = None
+
+        keys = [("district", district) for district in search.districts] or [("any district",)]
+        keys += [("room", room_type) for room_type in search.room_types] or [("any room",)]
+        if not search.bills_included:
+            keys.append(("no bills needed",))
+        if search.min_price is None and search.max_price is None:
+            keys.append(("no price needed",))
+        keys.append(("min price", _bucket(search.min_price or 0)))
+        keys.append(("max price", _bucket(search.max_price if search.max_price is not None else PRICE_CAP)))
+
+        for key in keys:
+            self._postings[key].append(index)
+
+    def _bitset(self, *key) -> int:
+        if self._bitsets is None:
+            size = (len(self.users) + 7) // 8
+            self._bitsets = {}
+            for posting_key, indices in self._postings.items():
+                bitmap = bytearray(size)
+                for index in indices:
+                    bitmap[index >> 3] |= 1 << (index & 7)
+                self._bitsets[posting_key] = int.from_bytes(bitmap, "little")
+
+            # Price bands as running unions, so a price needs two lookups:
+            # min price ≤ its bucket and max price ≥ its bucket
+            at_most = at_least = 0
+            buckets = _bucket(PRICE_CAP) + 1
+            for bucket in range(buckets):
+                at_most |= self._bitsets.get(("min price", bucket), 0)
+                self._bitsets[("min price at most", bucket)] = at_most
+            for bucket in reversed(range(buckets)):
+                at_least |= self._bitsets.get(("max price", bucket), 0)
+                self._bitsets[("max price at least", bucket)] = at_least
+        return self._bitsets.get(key, 0)
+
+    def candidates(self, ad: SpareRoomAd, facets: Optional[Tuple] = None) -> int:
+        """Bitset of subscribers whose filter may match ``ad``"""
+        districts, price, room_type = facets or ad_facets(ad)
+
+        mask = self._bitset("any district")
+        for key in districts:
+            mask |= self._bitset("district", key)
+
+        mask &= self._bitset("any room") | self._bitset("room", room_type)
+        if not ad.bills_included:
+            mask &= self._bitset("no bills needed")
+        if price is None:
+            mask &= self._bitset("no price needed")
+        else:
+            bucket = _bucket(price)
+            mask &= self._bitset("min price at most", bucket) & self._bitset("max price at least", bucket)
+        return mask
+
+    def match(self, ad: SpareRoomAd) -> Iterator[User]:
+        """Subscribers whose filter matches ``ad``"""
+        facets = ad_facets(ad)
+        # One pass over the bitset's digits, least significant bit first;
+        # peeling bits off a big int one at a time would cost O(users) each
+        bits = bin(self.candidates(ad, facets))[:1:-1]
+        index = bits.find("1")
+        while index != -1:
+            if self.filters[index].matches(ad, facets):
+                yield self.users[index]
+            index = bits.find("1", index + 1)
+
+
+def _bucket(price: int) -> int:
+    return min(max(price, 0), PRICE_CAP) // PRICE_BUCKET
+
+
+class AreaFeeds:
+    """Fetches the area feeds and turns them into pre-matched user jobs"""
+
+    def __init__(self, urls: Optional[List[str]] = None, pages: Optional[int] = None):
+        self.urls = urls if urls is not None else config.AREA_FEEDS
+        self.pages = max(1, pages or config.AREA_FEED_PAGES)
+        self.stats: dict = {}
+
+    def fetch(self, stop_id: Optional[int] = None) -> Tuple[List[SpareRoomAd], int]:
+        """Every ad on the feeds, newest first, and the ID they were read down to
+
+        Each feed is paged until an ad at or below ``stop_id`` turns up (the
+        first page only, when None), the feed runs out, or ``self.pages``
+        pages have been read. Every ad newer than the returned ID was on the
+        pages read (0 when every feed was read to its end). Raises if any
+        feed fails.
+        """
+        ads: Dict[str, SpareRoomAd] = {}
+        fetches = 0
+        read_to = 0
+        for url in self.urls:
+            oldest = None
+            for page in range(self.pages):
+                rate_limiter.wait()
+                html = scraper.fetch_html(url if page == 0 else _with_offset(url, page * PAGE_SIZE))
+                fetches += 1
+                page_ads = parse_cache.get(html) if parse_cache else None
+                if page_ads is None:
+                    page_ads = parse_listings(html)
+                    if parse_cache:
+                        parse_cache.put(html, page_ads)
+                if not page_ads:
+                    oldest = 0
+                    break
+                for ad in page_ads:
+                    ads.setdefault(ad.id, ad)
+                page_oldest = min(int(ad.id) for ad in page_ads)
+                oldest = page_oldest if oldest is None else min(oldest, page_oldest)
+                if len(page_ads) < PAGE_SIZE:
+                    oldest = 0  # the last page of the feed
+                    break
+                if stop_id is None or oldest <= stop_id:
+                    break
+            read_to = max(read_to, oldest or 0)
+
+        self.stats.update(fetches=fetches, ads=len(ads))
+        return sorted(ads.values(), key=lambda ad: int(ad.id), reverse=True), read_to
+
+    def plan(self, users: List[User]) -> Tuple[List[UserJob], List[User]]:
+        """Split users into area-matched jobs and users still fetched one by one"""
+        index = SubscriberIndex()
+        fallback = []
+        for user in users:
+            search = parse_search_url(user.spareroom_url)
+            if search is None:
+                fallback.append(user)
+            else:
+                index.add(user, search)
+
+        self.stats = {"feeds": len(self.urls), "matched_users": len(index), "fallback_users": len(fallback)}
+        if not len(index):
+            return [], users
+
+        # Read the feeds back to the oldest watermark, so no ad posted since a
+        # user's last check has been pushed past the pages read
+        watermarks = [int(user.last_checked_ad_id) for user in index.users if user.last_checked_ad_id]
+        try:
+            ads, read_to = self.fetch(min(watermarks) if watermarks else None)
+        except Exception as error:
+            logger.error(f"❌ Area feed fetch failed, checking users individually: {error}")
+            self.stats.update(matched_users=0, fallback_users=len(users), error=str(error))
+            return [], users
+
+        matches: Dict[int, List[SpareRoomAd]] = defaultdict(list)
+        for ad in ads:
+            for user in index.match(ad):
+                matches[user.id].append(ad)
+
+        newest = ads[0].id if ads else None
+        jobs = []
+        gaps = []
+        for user in index.users:
+            if user.last_checked_ad_id and int(user.last_checked_ad_id) < read_to:
+                # The feeds were not read back to this user's last check
+                gaps.append(user)
+            else:
+                jobs.append(UserJob(user=user, ads=matches.get(user.id, []), matched=True, newest_ad_id=newest))
+        fallback += gaps
+        self.stats.update(
+            matched_users=len(jobs),
+            fallback_users=len(fallback),
+            gap_users=len(gaps),
+            matches=sum(len(matches.get(job.user.id, [])) for job in jobs),
+        )
+
+        logger.info(
+            f"🗺️  {self.stats['fetches']} area feed fetch(es), {len(ads)} ad(s) matched to "
+            f"{len(jobs)} user(s) ({self.stats['matches']} match(es)); {len(fallback)} user(s) fetched individually"
+            + (f", {len(gaps)} of them past the {self.pages}-page cap" if gaps else "")
+        )
+        return jobs, fallback
+
+
+def _with_offset(url: str, offset: int) -> str:
+    parts = urlparse(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "offset"] + [("offset", str(offset))]
+    return urlunparse(parts._replace(query=urlencode(query)))
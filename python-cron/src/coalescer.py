@@ -0,0 +1,179 @@
+"""Per-user notification coalescing into digest emails
+
+New ads are not sent straight away. They are queued in the database's
+``pending_notifications`` table, in the same transaction that moves the
+user's watermark past them. A user's pending ads are flushed as one digest
+once any of these holds:
+
+- the oldest has waited the user's digest window (``digest_minutes``, or
+  ``DIGEST_WINDOW_MINUTES``);
+- ``DIGEST_MAX_ADS`` ads are waiting;
+- the user's window is 0 ("immediate").
+
+Each batch claims an ID and is handed to the notification dispatcher,
+which delivers it to the user's channels in the background; the batch is
+deleted only once every channel has accepted it. The channels that did are
+recorded against the batch, and a batch whose delivery failed or was
+interrupted is retried with the same ID, passed on as the idempotency key,
+to the remaining channels only, so no ads are lost and no channel gets a
+batch twice. A user
+has at most one batch in flight; when it is delivered, the next one goes
+out if it is due.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import config
+from .database import db
+from .models import SpareRoomAd, User
+from .notifiers import dispatcher
+from .logger import logger, search_key
+
+# Delivery failures kept for ``take_failures``
+MAX_FAILURES = 1000
+
+
+class NotificationCoalescer:
+    """Queues new ads per user and sends them as digest emails when due"""
+
+    def __init__(self, window_minutes: Optional[float] = None, max_ads: Optional[int] = None):
+        self.window_minutes = config.DIGEST_WINDOW_MINUTES if window_minutes is None else window_minutes
+        self.max_ads = max(1, max_ads or config.DIGEST_MAX_ADS)
+        # Users flushed since the last sweep, which the sweep can skip
+        self._checked: Set[int] = set()
+        # User ID → batch being delivered (None while it is being claimed)
+        self._inflight: Dict[int, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self.delivered = 0
+        # (user ID, category, message) of failed deliveries not yet taken,
+        # capped in case nothing takes them
+        self.failures: Deque[Tuple[int, str, str]] = deque(maxlen=MAX_FAILURES)
+
+    def window_for(self, user: User) -> float:
+        """The user's digest window in seconds (0 = immediate)"""
+        minutes = self.window_minutes if user.digest_minutes is None else user.digest_minutes
+        return max(float(minutes), 0.0) * 60
+
+    def queue(
+        self,
+        user: User,
+        ads: Iterable[SpareRoomAd],
+        newest_ad_id: str,
+        seen_ads: Optional[bytes] = None,
+    ) -> None:
+        """Durably queue ``ads`` for the user, moving their watermark and seen-ad set past them"""
+        db.queue_notifications(user.id, list(ads), newest_ad_id, seen_ads, search_key(user.spareroom_url))
+        user.last_checked_ad_id = newest_ad_id
+
+    def is_due(self, user: User, now: Optional[float] = None) -> bool:
+        """Whether the user's pending ads should be sent now"""
+        count, oldest = db.pending_notification_summary(user.id)
+        if count == 0:
+            return False
+        window = self.window_for(user)
+        now = time.time() if now is None else now
+        return window == 0 or count >= self.max_ads or now - oldest >= window
+
+    def flush(self, user: User, force: bool = False) -> int:
+        """Send the user's pending ads if due; returns batches dispatched (0 or 1)
+
+        Delivery happens in the background, so this never waits on a channel.
+        """
+        self._checked.add(user.id)
+        return self._flush(user, force)
+
+    def _flush(self, user: User, force: bool = False) -> int:
+        with self._lock:
+            if user.id in self._inflight:
+                # Its next batch follows once the current one is delivered
+                return 0
+            self._inflight[user.id] = None
+
+        batch_id = None
+        try:
+            if force or self.is_due(user):
+                batch_id, ads, done = db.claim_notification_batch(user.id, self.max_ads)
+        except Exception:
+            self._release(user)
+            raise
+        if batch_id is None:
+            self._release(user)
+            return 0
+
+        with self._lock:
+            self._inflight[user.id] = batch_id
+        dispatcher.dispatch(
+            user,
+            ads,
+            batch_id,
+            lambda sent, errors: self._delivered(user, batch_id, len(ads), sent, errors, force),
+            skip=done,
+        )
+        return 1
+
+    def _release(self, user: User) -> None:
+        with self._lock:
+            self._inflight.pop(user.id, None)
+
+    def _delivered(
+        self, user: User, batch_id: str, count: int, sent: List[str], errors: Dict[str, str], force: bool
+    ) -> None:
+        """Called by the dispatcher once every channel has finished with a batch"""
+        if errors:
+            # The batch stays queued and is retried with the same ID, to the
+            # channels that failed only
+            try:
+                db.mark_notification_channels_done(batch_id, sent)
+            finally:
+                self._release(user)
+            for channel, error in errors.items():
+                logger.error("   ❌ Failed to notify %s via %s: %s", user.email, channel, error)
+                with self._lock:
+                    self.failures.append((user.id, f"delivery:{channel}", f"{user.email}: {channel} failed: {error}"))
+            return
+
+        try:
+            db.complete_notification_batch(batch_id)
+        finally:
+            self._release(user)
+        with self._lock:
+            self.delivered += 1
+        logger.info("   📬 Sent %d ad(s) to %s", count, user.email, extra={"user_id": user.id, "stage": "deliver"})
+
+        # More ads may be waiting than fit in one batch
+        self._flush(user, force)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait for batches in flight; False if some were still going after ``timeout``"""
+        return dispatcher.drain(timeout)
+
+    def take_failures(self) -> List[Tuple[int, str, str]]:
+        """Delivery failures (user ID, category, message) since the last call"""
+        with self._lock:
+            failures = list(self.failures)
+            self.failures.clear()
+        return failures
+
+    def flush_due(self) -> int:
+        """Flush every user whose digest is due; returns batches dispatched
+
+        Users already flushed since the last sweep (during their own check)
+        are skipped, so a failing send is not retried twice in one run.
+        """
+        checked, self._checked = self._checked, set()
+        sent = 0
+        for user in db.get_users_with_pending_notifications():
+            if user.id in checked:
+                continue
+            try:
+                sent += self._flush(user)
+            except Exception as error:
+                logger.error(f"   ❌ Failed to send digest to {user.email}: {error}")
+        return sent
+
+
+# Singleton instance
+coalescer = NotificationCoalescer()
@@ -1,8 +1,9 @@
 """Configuration management for SpareRoom Monitor"""
 
 import os
+import tempfile
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -29,13 +30,144 @@ class Config:
     REQUEST_TIMEOUT: int = int(os.getenv("REQUEST_TIMEOUT", "30"))
     DELAY_BETWEEN_USERS: float = float(os.getenv("DELAY_BETWEEN_USERS", "1.0"))
 
-    # Logging
+    # HTTP transport (REQUEST_TIMEOUT is the default read and total deadline)
+    CONNECT_TIMEOUT: float = float(os.getenv("CONNECT_TIMEOUT", "5"))
+    READ_TIMEOUT: float = float(os.getenv("READ_TIMEOUT", str(REQUEST_TIMEOUT)))
+    TOTAL_TIMEOUT: float = float(os.getenv("TOTAL_TIMEOUT", str(REQUEST_TIMEOUT)))
+    HEDGE_REQUESTS: bool = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_BUDGET: float = float(os.getenv("HEDGE_BUDGET", "0.1"))
+    # Threads for backup attempts; a hedge is skipped while all are busy
+    HEDGE_WORKERS: int = max(1, int(os.getenv("HEDGE_WORKERS", "1")))
+
+    # Pipeline (worker threads per stage and bounded queue size between stages)
+    PIPELINE_FETCH_WORKERS: int = int(os.getenv("PIPELINE_FETCH_WORKERS", "2"))
+    PIPELINE_PARSE_WORKERS: int = int(os.getenv("PIPELINE_PARSE_WORKERS", "1"))
+    PIPELINE_NOTIFY_WORKERS: int = int(os.getenv("PIPELINE_NOTIFY_WORKERS", "2"))
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+    PARSE_EXECUTOR: str = os.getenv("PARSE_EXECUTOR", "thread").lower()
+    PARSE_CHUNK_SIZE: int = int(os.getenv("PARSE_CHUNK_SIZE", "4"))
+    PARSE_INLINE_BELOW_BYTES: int = int(os.getenv("PARSE_INLINE_BELOW_BYTES", "20000"))
+
+    # Warm start: state carried between runs on a reused instance's temp directory
+    WARM_START: bool = os.getenv("WARM_START", "false").lower() == "true"
+    WARM_START_PATH: str = os.getenv("WARM_START_PATH") or os.path.join(
+        tempfile.gettempdir(), "spareroom-warm.snapshot"
+    )
+    WARM_START_MAX_AGE: float = float(os.getenv("WARM_START_MAX_AGE", "3600"))
+
+    # Shared parse cache (empty path disables it; with warm start it defaults next to the snapshot)
+    PARSE_CACHE_PATH: str = os.getenv("PARSE_CACHE_PATH") or (
+        os.path.join(os.path.dirname(WARM_START_PATH), "spareroom-parse.cache") if WARM_START else ""
+    )
+    PARSE_CACHE_TTL: float = float(os.getenv("PARSE_CACHE_TTL", "900"))
+    PARSE_CACHE_MAX_BYTES: int = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    PARSE_CACHE_SLOTS: int = int(os.getenv("PARSE_CACHE_SLOTS", "8192"))
+
+    # Quarantine of failing searches (QUARANTINE_AFTER=0 disables it)
+    QUARANTINE_AFTER: int = int(os.getenv("QUARANTINE_AFTER", "3"))
+    QUARANTINE_BASE_INTERVAL: float = float(os.getenv("QUARANTINE_BASE_INTERVAL", "900"))
+    QUARANTINE_MAX_INTERVAL: float = float(os.getenv("QUARANTINE_MAX_INTERVAL", "86400"))
+    QUARANTINE_CATEGORIES: List[str] = [
+        name.strip().lower()
+        for name in os.getenv("QUARANTINE_CATEGORIES", "malformed,http_4xx,timeout,no_ads").split(",")
+        if name.strip()
+    ]
+
+    # Ad IDs remembered per user to tell new ads from ones already seen
+    SEEN_ADS_WINDOW: int = int(os.getenv("SEEN_ADS_WINDOW", "1000"))
+
+    # Per-user keyword filters (the run's ads are only indexed when a user has some)
+    KEYWORD_FILTERS: bool = os.getenv("KEYWORD_FILTERS", "true").lower() == "true"
+
+    # Columnar store of captured listings for analytics (empty disables it; needs numpy)
+    LISTINGS_STORE_DIR: str = os.getenv("LISTINGS_STORE_DIR", "")
+    LISTINGS_FLUSH_ROWS: int = int(os.getenv("LISTINGS_FLUSH_ROWS", "5000"))
+
+    # Digest emails (per-user digest_minutes column overrides the window; 0 = immediate)
+    DIGEST_WINDOW_MINUTES: float = float(os.getenv("DIGEST_WINDOW_MINUTES", "0"))
+    DIGEST_MAX_ADS: int = int(os.getenv("DIGEST_MAX_ADS", "20"))
+
+    # Notification channels (email, webhook, file); per-user notify_channels column overrides
+    NOTIFY_CHANNELS: List[str] = [
+        name.strip().lower() for name in os.getenv("NOTIFY_CHANNELS", "email").split(",") if name.strip()
+    ]
+    NOTIFY_TIMEOUT: float = float(os.getenv("NOTIFY_TIMEOUT", "15"))
+    NOTIFY_DRAIN_TIMEOUT: float = float(os.getenv("NOTIFY_DRAIN_TIMEOUT", "60"))
+    EMAIL_TIMEOUT: float = float(os.getenv("EMAIL_TIMEOUT", str(NOTIFY_TIMEOUT)))
+    EMAIL_CONCURRENCY: int = int(os.getenv("EMAIL_CONCURRENCY", "4"))
+    # Email rendering: "full" (inline styles, every ad) or "compact" (shared styles, minified, budgeted)
+    EMAIL_FORMAT: str = os.getenv("EMAIL_FORMAT", "full").strip().lower()
+    EMAIL_MAX_BYTES: int = int(os.getenv("EMAIL_MAX_BYTES", "90000"))
+    EMAIL_MAX_ADS: int = int(os.getenv("EMAIL_MAX_ADS", "20"))
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_TIMEOUT: float = float(os.getenv("WEBHOOK_TIMEOUT", "5"))
+    WEBHOOK_CONCURRENCY: int = int(os.getenv("WEBHOOK_CONCURRENCY", "8"))
+    NOTIFY_FILE_PATH: str = os.getenv("NOTIFY_FILE_PATH", "-")
+
+    # Record/replay of fetched pages: live, record or replay FETCH_ARCHIVE_PATH
+    SCRAPER_MODE: str = os.getenv("SCRAPER_MODE", "live").lower()
+    FETCH_ARCHIVE_PATH: str = os.getenv("FETCH_ARCHIVE_PATH", "fetches.archive.gz")
+    REPLAY_SPEED: float = float(os.getenv("REPLAY_SPEED", "1.0"))
+
+    # Detail-page enrichment of ads about to be emailed
+    ENRICH_DETAILS: bool = os.getenv("ENRICH_DETAILS", "false").lower() == "true"
+    ENRICH_WORKERS: int = int(os.getenv("ENRICH_WORKERS", "4"))
+    ENRICH_CACHE_TTL: float = float(os.getenv("ENRICH_CACHE_TTL", "21600"))
+    ENRICH_CACHE_SIZE: int = int(os.getenv("ENRICH_CACHE_SIZE", "5000"))
+
+    # Area feeds: broad searches matched to subscribers locally (comma-separated
+    # URLs), each paged back to the users' last check, at most AREA_FEED_PAGES pages
+    AREA_FEEDS: List[str] = [url.strip() for url in os.getenv("AREA_FEEDS", "").split(",") if url.strip()]
+    AREA_FEED_PAGES: int = int(os.getenv("AREA_FEED_PAGES", "5"))
+
+    # One pooled connection per fetch worker and per hedge thread
+    HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", str(PIPELINE_FETCH_WORKERS + HEDGE_WORKERS)))
+    # Pages kept for conditional (ETag/Last-Modified) re-fetches; 0 disables
+    HTTP_VALIDATOR_CACHE_SIZE: int = int(os.getenv("HTTP_VALIDATOR_CACHE_SIZE", "500"))
+
+    # Daemon mode
+    DAEMON_INTERVAL: float = float(os.getenv("DAEMON_INTERVAL", "60"))
+    DAEMON_TICK: float = float(os.getenv("DAEMON_TICK", "1.0"))
+    USER_RELOAD_INTERVAL: float = float(os.getenv("USER_RELOAD_INTERVAL", "60"))
+
+    # Incremental user sync (empty snapshot path keeps the snapshot in memory)
+    USER_SNAPSHOT_PATH: str = os.getenv("USER_SNAPSHOT_PATH", "")
+    USER_FULL_SYNC_INTERVAL: float = float(os.getenv("USER_FULL_SYNC_INTERVAL", "3600"))
+
+    # Triggered runs: the endpoint answers 202 and either runs in the background
+    # (CRON_ASYNC, which needs a process that outlives its response: not
+    # Vercel) or queues the run for the next worker invocation
+    CRON_ASYNC: bool = os.getenv("CRON_ASYNC", "false" if os.getenv("VERCEL") else "true").lower() == "true"
+    RUN_LOCK_TTL: float = float(os.getenv("RUN_LOCK_TTL", "900"))
+
+    # Run history (cron_runs table) and `python main.py report`
+    RUN_HISTORY_DAYS: float = float(os.getenv("RUN_HISTORY_DAYS", "90"))
+    CRON_INTERVAL: float = float(os.getenv("CRON_INTERVAL", "300"))
+
+    # Profiling (python main.py --profile, or PROFILE_SAMPLE_RATE for the endpoint)
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR") or os.path.join(
+        tempfile.gettempdir(), "spareroom-profiles"
+    )
+    PROFILE_MODE: str = os.getenv("PROFILE_MODE", "sample")
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_INTERVAL: float = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+    PROFILE_TOP: int = int(os.getenv("PROFILE_TOP", "15"))
+    PROFILE_TRACEMALLOC_FRAMES: int = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1"))
+
+    # Logging (LOG_FORMAT text or json; LOG_SAMPLE_RATE lines/s per message, 0 = no sampling)
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")
+    LOG_ASYNC: bool = os.getenv("LOG_ASYNC", "true").lower() == "true"
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "50"))
+    LOG_SAMPLE_BURST: float = float(os.getenv("LOG_SAMPLE_BURST", "200"))
 
     @classmethod
     def validate(cls) -> bool:
         """Validate that all required configuration is present"""
-        if not cls.RESEND_API_KEY:
+        if "email" in cls.NOTIFY_CHANNELS and not cls.RESEND_API_KEY:
             raise ValueError("RESEND_API_KEY environment variable is required")
         return True
 
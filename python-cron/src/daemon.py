@@ -0,0 +1,210 @@
+"""Long-running monitor that keeps connections warm between searches"""
+
+import signal
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .config import config
+from .database import db
+from .models import CronResult
+from .quarantine import quarantine
+from .scheduler import TimerWheel
+from .scraper import scraper, get_new_ads
+from .user_sync import UserSync
+from .logger import logger
+
+
+class MonitorDaemon:
+    """Runs searches on an in-process schedule instead of one-shot cron runs
+
+    The scraper session and the database connection live for the lifetime of
+    the process, so every check after the first reuses pooled keep-alive
+    connections. Active users are synced incrementally every
+    ``USER_RELOAD_INTERVAL`` seconds and only added, removed or changed
+    subscriptions touch the schedule. Plain ``watch_urls`` are monitored
+    without any subscriber and new ads are only logged, which replaces the
+    old ``check_spareroom.py``.
+    """
+
+    def __init__(
+        self,
+        interval: float = None,
+        tick: float = None,
+        reload_interval: float = None,
+        watch_urls: Optional[List[str]] = None,
+        include_users: bool = True,
+    ):
+        self.interval = interval or config.DAEMON_INTERVAL
+        self.reload_interval = reload_interval or config.USER_RELOAD_INTERVAL
+        self.include_users = include_users
+        self.wheel = TimerWheel(tick or config.DAEMON_TICK)
+        self.user_sync = UserSync()
+        self.watched: Dict[str, Optional[str]] = {url: None for url in watch_urls or []}
+        self.result = CronResult()
+        self._stop = threading.Event()
+        self._next_reload = 0.0
+
+    def stop(self, signum=None, frame=None) -> None:
+        """Request a graceful shutdown after the current search"""
+        if not self._stop.is_set():
+            logger.info("🛑 Shutdown requested, finishing current search...")
+        self._stop.set()
+
+    def run(self) -> CronResult:
+        """Run until stopped by SIGTERM/SIGINT or ``stop()``"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        if self.include_users:
+            config.validate()
+            db.open()
+            if quarantine:
+                quarantine.load()
+
+        logger.info(f"👀 Daemon started, checking each search every {self.interval:.0f}s")
+
+        # Spread searches across the first interval, including users resumed
+        # from an on-disk snapshot that the first sync will not report as new
+        keys = [("watch", url) for url in self.watched]
+        if self.include_users:
+            keys += [("user", user.id) for user in self.user_sync.active_users()]
+        for i, key in enumerate(keys):
+            self.wheel.schedule(key, self._stagger(i, len(keys)))
+
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if self.include_users and now >= self._next_reload:
+                    self._reload_users()
+                    self._take_delivery_failures()
+                    self._flush_digests()
+                    self._flush_listings()
+                    self._next_reload = now + self.reload_interval
+
+                for key in self.wheel.advance(now):
+                    if self._stop.is_set():
+                        break
+                    self._run_search(key)
+                    self.wheel.schedule(key, self.interval)
+
+                self._stop.wait(self.wheel.tick)
+        finally:
+            if self.include_users:
+                from .coalescer import coalescer
+
+                # Let batches in flight finish; unfinished ones stay queued
+                coalescer.drain(config.NOTIFY_DRAIN_TIMEOUT)
+                self._take_delivery_failures()
+                self.user_sync.save()
+                self._flush_listings()
+            db.close()
+            logger.info("👋 Daemon stopped")
+            self._log_stats()
+
+        return self.result
+
+    def _stagger(self, index: int, count: int) -> float:
+        """Initial delay that spreads ``count`` searches over one interval"""
+        return self.interval * index / max(count, 1)
+
+    def _reload_users(self) -> None:
+        """Apply subscription changes without rescheduling unchanged users"""
+        try:
+            changes = self.user_sync.sync()
+        except Exception as error:
+            logger.error(f"❌ Failed to reload users: {error}")
+            return
+
+        for user_id in changes.removed:
+            self.wheel.cancel(("user", user_id))
+
+        for user in changes.url_changed:
+            self.wheel.schedule(("user", user.id), self.wheel.tick)
+
+        for i, user in enumerate(changes.added):
+            self.wheel.schedule(("user", user.id), self._stagger(i, len(changes.added)))
+
+        if changes:
+            self._log_stats()
+
+    def _take_delivery_failures(self) -> None:
+        """Count deliveries that failed since the last tick against their users"""
+        from .coalescer import coalescer
+
+        failures = coalescer.take_failures()
+        for user_id, category, message in failures:
+            self.result.add_error(category, message)
+            self.result.fail_user(user_id)
+        if failures:
+            logger.warning(f"⚠️  {len(failures)} delivery failure(s) since the last check; batches stay queued for retry")
+
+    def _flush_digests(self) -> None:
+        """Send digests whose window has passed since the user's last check"""
+        from .coalescer import coalescer
+
+        try:
+            coalescer.flush_due()
+        except Exception as error:
+            logger.error(f"❌ Failed to flush digests: {error}")
+
+    def _flush_listings(self) -> None:
+        """Write out listings captured since the last flush and start a fresh keyword index"""
+        from .keyword_filter import keyword_index
+        from .listings_store import listings_store
+
+        if listings_store:
+            listings_store.flush()
+        if keyword_index:
+            keyword_index.start(self.user_sync.active_users())
+
+    def _run_search(self, key) -> None:
+        kind, ident = key
+        if kind == "watch":
+            self._check_watched(ident)
+            return
+
+        user = self.user_sync.users.get(ident)
+        if user is None:
+            return
+
+        if quarantine and not quarantine.is_due(user.spareroom_url):
+            # Held back after repeated failures; looked at again on a later turn
+            return
+
+        # Imported lazily so watch-only mode does not need email credentials
+        from .runner import process_user
+
+        # Fetches are spaced by the shared rate limiter
+        process_user(user, self.result)
+
+    def _check_watched(self, url: str) -> None:
+        try:
+            ads = scraper.fetch_ads(url)
+        except Exception as error:
+            logger.error(f"❌ Could not fetch {url}: {error}")
+            return
+
+        if not ads:
+            logger.info(f"   No ads found for {url}")
+            return
+
+        last_ad_id = self.watched[url]
+        if last_ad_id is None:
+            logger.info(f"👀 Monitoring initialized, current newest ad:\n{ads[0].format_for_email()}")
+        else:
+            for ad in reversed(get_new_ads(ads, last_ad_id)):
+                logger.info(f"🚨 NEW AD DETECTED!\n{ad.format_for_email()}")
+
+        self.watched[url] = ads[0].id
+
+    def _log_stats(self) -> None:
+        if self.include_users:
+            from .coalescer import coalescer
+
+            self.result.notifications = coalescer.delivered
+        logger.info(
+            f"📊 Daemon totals: {self.result.processed} checked, "
+            f"{self.result.successful} ok, {self.result.failed} failed, "
+            f"{self.result.notifications} notification(s)"
+        )
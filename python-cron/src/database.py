@@ -1,23 +1,66 @@
 """Database operations for SpareRoom Monitor"""
 
+import json
 import sqlite3
-from typing import List, Optional
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from contextlib import contextmanager
 
 from .config import config
-from .models import User
+from .models import SpareRoomAd, User
 from .logger import logger
 
 
+# Columns every users table has, and optional ones read when present
+USER_COLUMNS = ["id", "email", "spareroom_url", "last_checked_ad_id", "active"]
+OPTIONAL_USER_COLUMNS = ["updated_at", "digest_minutes", "notify_channels", "webhook_url", "keyword_filters"]
+
+
 class Database:
     """Database operations manager"""
 
     def __init__(self, db_path: str = None):
         self.db_path = db_path or config.DATABASE_PATH
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._user_columns: Optional[List[str]] = None
+        self._pending_table_ready = False
+        self._seen_table_ready = False
+        self._runs_table_ready = False
+        self._run_status_ready = False
+        self._quarantine_table_ready = False
+
+    def open(self) -> None:
+        """Keep a single connection open for long-running processes"""
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._conn.row_factory = sqlite3.Row
+                logger.debug(f"Opened persistent connection to {self.db_path}")
+
+    def close(self) -> None:
+        """Close the persistent connection, if any"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
     @contextmanager
     def get_connection(self):
         """Context manager for database connections"""
+        if self._conn is not None:
+            # Reuse the warm connection, serialising access between threads
+            with self._lock:
+                try:
+                    yield self._conn
+                    self._conn.commit()
+                except Exception as e:
+                    self._conn.rollback()
+                    raise e
+            return
+
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         try:
@@ -29,12 +72,39 @@ class Database:
         finally:
             conn.close()
 
+    def user_columns(self) -> List[str]:
+        """Columns to select from the users table, including optional ones present"""
+        if self._user_columns is None:
+            with self.get_connection() as conn:
+                existing = {row["name"] for row in conn.execute("PRAGMA table_info(users)")}
+            self._user_columns = USER_COLUMNS + [
+                column for column in OPTIONAL_USER_COLUMNS if column in existing
+            ]
+        return self._user_columns
+
+    @staticmethod
+    def _row_to_user(row: sqlite3.Row) -> User:
+        """Build a User from a users row, tolerating missing optional columns"""
+        keys = row.keys()
+        return User(
+            id=row["id"],
+            email=row["email"],
+            spareroom_url=row["spareroom_url"],
+            last_checked_ad_id=row["last_checked_ad_id"],
+            active=bool(row["active"]),
+            updated_at=row["updated_at"] if "updated_at" in keys else None,
+            digest_minutes=row["digest_minutes"] if "digest_minutes" in keys else None,
+            notify_channels=row["notify_channels"] if "notify_channels" in keys else None,
+            webhook_url=row["webhook_url"] if "webhook_url" in keys else None,
+            keyword_filters=row["keyword_filters"] if "keyword_filters" in keys else None,
+        )
+
     def get_active_users(self) -> List[User]:
         """Get all active users with subscriptions"""
         with self.get_connection() as conn:
             cursor = conn.execute(
-                """
-                SELECT id, email, spareroom_url, last_checked_ad_id, active
+                f"""
+                SELECT {", ".join(self.user_columns())}
                 FROM users
                 WHERE active = 1
                 ORDER BY id
@@ -42,22 +112,44 @@ class Database:
             )
             rows = cursor.fetchall()
 
-            users = [
-                User(
-                    id=row["id"],
-                    email=row["email"],
-                    spareroom_url=row["spareroom_url"],
-                    last_checked_ad_id=row["last_checked_ad_id"],
-                    active=bool(row["active"]),
-                )
-                for row in rows
-            ]
+            users = [self._row_to_user(row) for row in rows]
 
             logger.info(f"📊 Found {len(users)} active user(s)")
             return users
 
-    def update_last_checked_ad_id(self, user_id: int, ad_id: str) -> None:
-        """Update the last checked ad ID for a user"""
+    def supports_incremental_sync(self) -> bool:
+        """Whether the users table has an updated_at column to sync from"""
+        return "updated_at" in self.user_columns()
+
+    def get_users_changed_since(self, watermark: Optional[str]) -> List[User]:
+        """Get active and inactive users updated at or after the watermark
+
+        The comparison is inclusive so rows written in the same second as the
+        previous watermark are not missed; re-applying them is harmless.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                f"""
+                SELECT {", ".join(self.user_columns())}
+                FROM users
+                WHERE updated_at >= ?
+                ORDER BY updated_at, id
+                """,
+                (watermark or "",),
+            )
+            users = [self._row_to_user(row) for row in cursor.fetchall()]
+
+            logger.debug(f"Found {len(users)} user(s) changed since {watermark}")
+            return users
+
+    def update_last_checked_ad_id(
+        self,
+        user_id: int,
+        ad_id: str,
+        seen_ads: Optional[bytes] = None,
+        search: Optional[str] = None,
+    ) -> None:
+        """Update the last checked ad ID for a user, and their seen-ad set when given"""
         with self.get_connection() as conn:
             conn.execute(
                 """
@@ -67,14 +159,416 @@ class Database:
                 """,
                 (ad_id, user_id),
             )
-            logger.debug(f"Updated last_checked_ad_id to {ad_id} for user {user_id}")
+            if seen_ads is not None:
+                self._store_seen_ads(conn, user_id, seen_ads, search)
+            logger.debug("Updated last_checked_ad_id to %s for user %s", ad_id, user_id)
+
+    def _ensure_seen_table(self, conn: sqlite3.Connection) -> None:
+        if not self._seen_table_ready:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS seen_ads (
+                    user_id INTEGER PRIMARY KEY,
+                    search TEXT,
+                    ids BLOB NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._seen_table_ready = True
+
+    def _store_seen_ads(self, conn: sqlite3.Connection, user_id: int, seen_ads: bytes, search: Optional[str]) -> None:
+        self._ensure_seen_table(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO seen_ads (user_id, search, ids, updated_at) VALUES (?, ?, ?, ?)",
+            (user_id, search, seen_ads, time.time()),
+        )
+
+    def get_seen_ads(self, user_id: int, search: Optional[str] = None) -> Optional[bytes]:
+        """The user's encoded seen-ad set, or None if none was stored for this search"""
+        with self.get_connection() as conn:
+            self._ensure_seen_table(conn)
+            row = conn.execute("SELECT search, ids FROM seen_ads WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None or row["search"] != search:
+                return None
+            return row["ids"]
+
+    def _ensure_pending_table(self, conn: sqlite3.Connection) -> None:
+        if not self._pending_table_ready:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pending_notifications (
+                    user_id INTEGER NOT NULL,
+                    ad_id TEXT NOT NULL,
+                    ad TEXT NOT NULL,
+                    queued_at REAL NOT NULL,
+                    batch_id TEXT,
+                    channels_done TEXT,
+                    PRIMARY KEY (user_id, ad_id)
+                )
+                """
+            )
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(pending_notifications)")}
+            if "channels_done" not in existing:
+                # Tables created before per-channel tracking
+                conn.execute("ALTER TABLE pending_notifications ADD COLUMN channels_done TEXT")
+            self._pending_table_ready = True
+
+    def queue_notifications(
+        self,
+        user_id: int,
+        ads: List[SpareRoomAd],
+        newest_ad_id: str,
+        seen_ads: Optional[bytes] = None,
+        search: Optional[str] = None,
+    ) -> None:
+        """Store new ads for a user's next email and mark them seen, atomically
+
+        The ads, the watermark and the seen-ad set are written in one
+        transaction, so after a crash the ads are either pending (and marked
+        seen) or will be found again. Re-queueing an ad that is already
+        pending is a no-op.
+        """
+        now = time.time()
+        with self.get_connection() as conn:
+            self._ensure_pending_table(conn)
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO pending_notifications (user_id, ad_id, ad, queued_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                [(user_id, ad.id, json.dumps(ad.to_record()), now) for ad in ads],
+            )
+            conn.execute(
+                "UPDATE users SET last_checked_ad_id = ? WHERE id = ?",
+                (newest_ad_id, user_id),
+            )
+            if seen_ads is not None:
+                self._store_seen_ads(conn, user_id, seen_ads, search)
+
+    def pending_notification_summary(self, user_id: int) -> Tuple[int, Optional[float]]:
+        """(number of pending ads, when the oldest was queued) for a user"""
+        with self.get_connection() as conn:
+            self._ensure_pending_table(conn)
+            row = conn.execute(
+                "SELECT COUNT(*) AS n, MIN(queued_at) AS oldest FROM pending_notifications WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            return row["n"], row["oldest"]
+
+    def get_users_with_pending_notifications(self) -> List[User]:
+        """Active users that have ads waiting to be emailed"""
+        with self.get_connection() as conn:
+            self._ensure_pending_table(conn)
+            cursor = conn.execute(
+                f"""
+                SELECT {", ".join(f"u.{column}" for column in self.user_columns())}
+                FROM users u
+                WHERE u.active = 1
+                  AND EXISTS (SELECT 1 FROM pending_notifications p WHERE p.user_id = u.id)
+                ORDER BY u.id
+                """
+            )
+            return [self._row_to_user(row) for row in cursor.fetchall()]
+
+    def claim_notification_batch(
+        self, user_id: int, limit: int
+    ) -> Tuple[Optional[str], List[SpareRoomAd], Set[str]]:
+        """Reserve up to ``limit`` of a user's pending ads (oldest first) for one email
+
+        A batch left behind by a failed or interrupted send is returned again
+        with the same ID, so the retry can be deduplicated downstream, along
+        with the channels that already accepted it.
+        """
+        with self.get_connection() as conn:
+            self._ensure_pending_table(conn)
+            row = conn.execute(
+                "SELECT batch_id FROM pending_notifications WHERE user_id = ? AND batch_id IS NOT NULL LIMIT 1",
+                (user_id,),
+            ).fetchone()
+            if row:
+                batch_id = row["batch_id"]
+            else:
+                batch_id = uuid.uuid4().hex
+                conn.execute(
+                    """
+                    UPDATE pending_notifications SET batch_id = ?
+                    WHERE rowid IN (
+                        SELECT rowid FROM pending_notifications
+                        WHERE user_id = ? AND batch_id IS NULL
+                        ORDER BY queued_at, CAST(ad_id AS INTEGER)
+                        LIMIT ?
+                    )
+                    """,
+                    (batch_id, user_id, limit),
+                )
+
+            rows = conn.execute(
+                """
+                SELECT ad, channels_done FROM pending_notifications
+                WHERE batch_id = ?
+                ORDER BY CAST(ad_id AS INTEGER) DESC
+                """,
+                (batch_id,),
+            ).fetchall()
+
+            if not rows:
+                return None, [], set()
+            done = set(filter(None, (rows[0]["channels_done"] or "").split(",")))
+            return batch_id, [SpareRoomAd.from_record(json.loads(row["ad"])) for row in rows], done
+
+    def mark_notification_channels_done(self, batch_id: str, channels: Iterable[str]) -> None:
+        """Record that ``channels`` accepted a batch, so a retry skips them"""
+        channels = set(channels)
+        if not channels:
+            return
+        with self.get_connection() as conn:
+            self._ensure_pending_table(conn)
+            row = conn.execute(
+                "SELECT channels_done FROM pending_notifications WHERE batch_id = ? LIMIT 1",
+                (batch_id,),
+            ).fetchone()
+            if row is None:
+                return
+            channels |= set(filter(None, (row["channels_done"] or "").split(",")))
+            conn.execute(
+                "UPDATE pending_notifications SET channels_done = ? WHERE batch_id = ?",
+                (",".join(sorted(channels)), batch_id),
+            )
+
+    def complete_notification_batch(self, batch_id: str) -> None:
+        """Drop a batch's ads once every channel has accepted it"""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM pending_notifications WHERE batch_id = ?", (batch_id,))
+
+    def acquire_lock(self, name: str, owner: str, ttl: float) -> Optional[str]:
+        """Take the named lock for ``owner``
+
+        Returns None when the lock was acquired, otherwise the current
+        holder. A lock not released within ``ttl`` seconds (a crashed run)
+        expires and can be taken over.
+        """
+        with self.get_connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cron_locks (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            now = time.time()
+            conn.execute("DELETE FROM cron_locks WHERE name = ? AND expires_at < ?", (name, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cron_locks (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, owner, now + ttl),
+            )
+            if cursor.rowcount == 1:
+                return None
+
+            row = conn.execute("SELECT owner FROM cron_locks WHERE name = ?", (name,)).fetchone()
+            return row["owner"] if row else None
+
+    def release_lock(self, name: str, owner: str) -> None:
+        """Release the named lock if ``owner`` still holds it"""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM cron_locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def renew_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """Push the named lock's expiry ``ttl`` seconds out; False if ``owner`` no longer holds it"""
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "UPDATE cron_locks SET expires_at = ? WHERE name = ? AND owner = ?",
+                (time.time() + ttl, name, owner),
+            )
+            return cursor.rowcount == 1
+
+    def _ensure_run_status_table(self, conn: sqlite3.Connection) -> None:
+        if not self._run_status_ready:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cron_run_status (
+                    run_id TEXT PRIMARY KEY,
+                    updated_at REAL NOT NULL,
+                    status TEXT NOT NULL
+                )
+                """
+            )
+            self._run_status_ready = True
+
+    def save_run_status(self, run_id: str, status: dict) -> None:
+        """Store the live status of a run (as JSON), replacing its previous one"""
+        with self.get_connection() as conn:
+            self._ensure_run_status_table(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO cron_run_status (run_id, updated_at, status) VALUES (?, ?, ?)",
+                (run_id, time.time(), json.dumps(status)),
+            )
+
+    def queue_run(self, run_id: str, status: dict) -> str:
+        """Store ``status`` for a queued run unless one is queued already;
+        return the ID of the queued run"""
+        with self.get_connection() as conn:
+            self._ensure_run_status_table(conn)
+            # One statement, so two triggers cannot both queue a run
+            conn.execute(
+                """
+                INSERT INTO cron_run_status (run_id, updated_at, status)
+                SELECT ?, ?, ? WHERE NOT EXISTS (
+                    SELECT 1 FROM cron_run_status WHERE json_extract(status, '$.state') = 'queued'
+                )
+                """,
+                (run_id, time.time(), json.dumps(status)),
+            )
+            return self._oldest_queued_run(conn)
+
+    def get_queued_run_id(self) -> Optional[str]:
+        """ID of the oldest run still waiting to start, if any"""
+        with self.get_connection() as conn:
+            self._ensure_run_status_table(conn)
+            return self._oldest_queued_run(conn)
+
+    @staticmethod
+    def _oldest_queued_run(conn: sqlite3.Connection) -> Optional[str]:
+        row = conn.execute(
+            "SELECT run_id FROM cron_run_status WHERE json_extract(status, '$.state') = 'queued' "
+            "ORDER BY run_id LIMIT 1"
+        ).fetchone()
+        return row["run_id"] if row else None
+
+    def get_run_status(self, run_id: Optional[str] = None) -> Optional[dict]:
+        """Status of ``run_id``, or of the most recent run when None"""
+        with self.get_connection() as conn:
+            self._ensure_run_status_table(conn)
+            if run_id is None:
+                # Run IDs start with their timestamp, so they sort by age
+                row = conn.execute("SELECT status FROM cron_run_status ORDER BY run_id DESC LIMIT 1").fetchone()
+            else:
+                row = conn.execute("SELECT status FROM cron_run_status WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row["status"]) if row else None
+
+    def prune_run_status(self, keep: int) -> None:
+        """Keep the status of only the ``keep`` most recent runs"""
+        with self.get_connection() as conn:
+            self._ensure_run_status_table(conn)
+            conn.execute(
+                """
+                DELETE FROM cron_run_status WHERE run_id NOT IN (
+                    SELECT run_id FROM cron_run_status ORDER BY run_id DESC LIMIT ?
+                )
+                """,
+                (keep,),
+            )
+
+    def _ensure_runs_table(self, conn: sqlite3.Connection) -> None:
+        if not self._runs_table_ready:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cron_runs (
+                    run_id TEXT PRIMARY KEY,
+                    trigger TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    finished_at REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    processed INTEGER NOT NULL,
+                    successful INTEGER NOT NULL,
+                    failed INTEGER NOT NULL,
+                    notifications INTEGER NOT NULL,
+                    stages TEXT,
+                    errors TEXT,
+                    slowest_searches TEXT
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cron_runs_started_at ON cron_runs (started_at)")
+            self._runs_table_ready = True
+
+    def record_cron_run(self, run: dict, keep_days: float) -> None:
+        """Store one run's summary and drop runs older than ``keep_days``
+
+        ``stages``, ``errors`` and ``slowest_searches`` are stored as JSON.
+        """
+        columns = [
+            "run_id", "trigger", "status", "started_at", "finished_at", "duration",
+            "processed", "successful", "failed", "notifications",
+        ]
+        values = [run[column] for column in columns]
+        for column in ("stages", "errors", "slowest_searches"):
+            columns.append(column)
+            values.append(json.dumps(run.get(column)))
+
+        with self.get_connection() as conn:
+            self._ensure_runs_table(conn)
+            conn.execute(
+                f"INSERT OR REPLACE INTO cron_runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                values,
+            )
+            conn.execute("DELETE FROM cron_runs WHERE started_at < ?", (time.time() - keep_days * 86400,))
+
+    def get_cron_runs(self, since: float) -> List[dict]:
+        """Runs started at or after ``since``, oldest first, with JSON columns decoded"""
+        with self.get_connection() as conn:
+            self._ensure_runs_table(conn)
+            rows = conn.execute(
+                "SELECT * FROM cron_runs WHERE started_at >= ? ORDER BY started_at", (since,)
+            ).fetchall()
+
+        runs = []
+        for row in rows:
+            run = dict(row)
+            for column in ("stages", "errors", "slowest_searches"):
+                run[column] = json.loads(run[column]) if run[column] else None
+            runs.append(run)
+        return runs
+
+    def _ensure_quarantine_table(self, conn: sqlite3.Connection) -> None:
+        if not self._quarantine_table_ready:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS search_quarantine (
+                    url TEXT PRIMARY KEY,
+                    category TEXT NOT NULL,
+                    failures INTEGER NOT NULL,
+                    last_error TEXT,
+                    first_failed_at REAL NOT NULL,
+                    last_failed_at REAL NOT NULL,
+                    retry_at REAL
+                )
+                """
+            )
+            self._quarantine_table_ready = True
+
+    def get_search_failures(self) -> Dict[str, dict]:
+        """Failing searches by URL (``retry_at`` is set once a search is quarantined)"""
+        with self.get_connection() as conn:
+            self._ensure_quarantine_table(conn)
+            rows = conn.execute("SELECT * FROM search_quarantine").fetchall()
+            return {row["url"]: dict(row) for row in rows}
+
+    def record_search_failure(self, entry: dict) -> None:
+        """Insert or update a failing search's row"""
+        columns = ["url", "category", "failures", "last_error", "first_failed_at", "last_failed_at", "retry_at"]
+        with self.get_connection() as conn:
+            self._ensure_quarantine_table(conn)
+            conn.execute(
+                f"INSERT OR REPLACE INTO search_quarantine ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [entry[column] for column in columns],
+            )
+
+    def clear_search_failure(self, url: str) -> None:
+        """Forget a search's failures (it worked again)"""
+        with self.get_connection() as conn:
+            self._ensure_quarantine_table(conn)
+            conn.execute("DELETE FROM search_quarantine WHERE url = ?", (url,))
 
     def get_user_by_email(self, email: str) -> Optional[User]:
         """Get a user by email address"""
         with self.get_connection() as conn:
             cursor = conn.execute(
-                """
-                SELECT id, email, spareroom_url, last_checked_ad_id, active
+                f"""
+                SELECT {", ".join(self.user_columns())}
                 FROM users
                 WHERE email = ?
                 """,
@@ -83,13 +577,7 @@ class Database:
             row = cursor.fetchone()
 
             if row:
-                return User(
-                    id=row["id"],
-                    email=row["email"],
-                    spareroom_url=row["spareroom_url"],
-                    last_checked_ad_id=row["last_checked_ad_id"],
-                    active=bool(row["active"]),
-                )
+                return self._row_to_user(row)
             return None
 
 
@@ -0,0 +1,209 @@
+"""HTML and plain-text bodies of the new-listings email
+
+Two HTML renderings, chosen by ``EMAIL_FORMAT``:
+
+- ``full`` (default): every ad as a card with its styles inlined, as the first
+  version of the email did;
+- ``compact``: the same cards styled by one shared ``<style>``
+  block, without indentation or line breaks, and within a budget of
+  ``EMAIL_MAX_ADS`` cards and ``EMAIL_MAX_BYTES`` of HTML. Ads past the
+  budget are summarised as "…and N more" with a link to the user's search,
+  so a burst of ads never builds a message that mail clients clip (Gmail
+  cuts messages off at 102 KB).
+
+Both return the HTML and the number of ads it shows, so the text part can
+list the same ads.
+"""
+
+from html import escape
+from typing import List, Optional, Tuple
+
+from .config import config
+from .models import SpareRoomAd
+
+FOOTER = "You're receiving this email because you subscribed to SpareRoom Monitor."
+
+# Shared by every card in the compact rendering
+COMPACT_CSS = (
+    "body{font-family:Arial,sans-serif;line-height:1.6;color:#333;max-width:600px;margin:0 auto;padding:20px}"
+    "a{color:#0066cc;text-decoration:none}"
+    ".ad{border:1px solid #ddd;border-radius:8px;padding:16px;margin-bottom:16px;background-color:#f9f9f9}"
+    ".ad h3{margin:0 0 8px 0}"
+    ".ad p{margin:5px 0}"
+    ".pr{font-size:18px;font-weight:bold;color:#2c5f2d}"
+    ".tm{color:#666}"
+    ".bt{display:inline-block;padding:8px 16px;background-color:#0066cc;color:#fff;border-radius:4px}"
+    "hr{border:none;border-top:1px solid #ddd;margin:20px 0}"
+    ".ft{font-size:12px;color:#666}"
+)
+
+
+def _plural(count: int) -> str:
+    return "s" if count != 1 else ""
+
+
+def _price(ad: SpareRoomAd) -> str:
+    price = ad.price or "Price not listed"
+    if ad.bills_included and ad.price:
+        price += " (bills included)"
+    return price
+
+
+def _details(ad: SpareRoomAd) -> List[str]:
+    details = []
+    if ad.location:
+        details.append(f"📍 {ad.location}")
+    if ad.property_type:
+        details.append(f"🏘️ {ad.property_type}")
+    if ad.availability:
+        details.append(f"📅 {ad.availability}")
+    return details
+
+
+def _term(ad: SpareRoomAd) -> Optional[str]:
+    parts = []
+    if ad.min_term:
+        parts.append(f"min {ad.min_term}")
+    if ad.max_term:
+        parts.append(f"max {ad.max_term}")
+    return ", ".join(parts) if parts else None
+
+
+def full_html(ads: List[SpareRoomAd]) -> Tuple[str, int]:
+    """Every ad, each card carrying its own inline styles"""
+    ad_blocks = []
+
+    for ad in ads:
+        price_str = _price(ad)
+        details = _details(ad)
+        details_html = "<br>".join(details) if details else ""
+
+        term = _term(ad)
+        term_html = f"<p style='margin: 5px 0; color: #666;'>Term: {term}</p>" if term else ""
+
+        ad_html = f"""
+            <div style="border: 1px solid #ddd; border-radius: 8px; padding: 16px; margin-bottom: 16px; background-color: #f9f9f9;">
+                <h3 style="margin: 0 0 8px 0;">
+                    <a href="{ad.url}" style="color: #0066cc; text-decoration: none;">{ad.title}</a>
+                </h3>
+                <p style="margin: 5px 0; font-size: 18px; font-weight: bold; color: #2c5f2d;">{price_str}</p>
+                {f'<p style="margin: 5px 0;">{details_html}</p>' if details_html else ''}
+                {term_html}
+                <p style="margin: 10px 0 0 0;">
+                    <a href="{ad.url}" style="display: inline-block; padding: 8px 16px; background-color: #0066cc; color: white; text-decoration: none; border-radius: 4px;">View Listing</a>
+                </p>
+            </div>
+            """
+        ad_blocks.append(ad_html)
+
+    ads_html = "\n".join(ad_blocks)
+
+    html = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        </head>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+            <h2 style="color: #333;">New SpareRoom Listings</h2>
+            <p>We found {len(ads)} new listing{'s' if len(ads) > 1 else ''} matching your search:</p>
+            {ads_html}
+            <hr style="border: none; border-top: 1px solid #ddd; margin: 20px 0;">
+            <p style="font-size: 12px; color: #666;">
+                {FOOTER}
+            </p>
+        </body>
+        </html>
+        """
+    return html, len(ads)
+
+
+def _compact_card(ad: SpareRoomAd) -> str:
+    # Scraped text is escaped here; the full rendering predates that
+    url = escape(ad.url or "")
+    details = _details(ad)
+    term = _term(ad)
+    return (
+        f'<div class="ad"><h3><a href="{url}">{escape(ad.title or "")}</a></h3>'
+        f'<p class="pr">{escape(_price(ad))}</p>'
+        + (f"<p>{'<br>'.join(escape(detail) for detail in details)}</p>" if details else "")
+        + (f'<p class="tm">Term: {escape(term)}</p>' if term else "")
+        + f'<p><a class="bt" href="{url}">View Listing</a></p></div>'
+    )
+
+
+def _more(count: int, search_url: Optional[str]) -> str:
+    text = f"…and {count} more listing{_plural(count)}"
+    if search_url:
+        return f'<p><a href="{escape(search_url)}">{text} on SpareRoom</a></p>'
+    return f"<p>{text} on SpareRoom.</p>"
+
+
+def compact_html(
+    ads: List[SpareRoomAd],
+    search_url: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    max_ads: Optional[int] = None,
+) -> Tuple[str, int]:
+    """Ads in shared-style cards, minified, up to the byte and card budgets"""
+    max_bytes = config.EMAIL_MAX_BYTES if max_bytes is None else max_bytes
+    max_ads = config.EMAIL_MAX_ADS if max_ads is None else max_ads
+
+    head = (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        '<meta name="viewport" content="width=device-width,initial-scale=1">'
+        f"<style>{COMPACT_CSS}</style></head><body><h2>New SpareRoom Listings</h2>"
+        f"<p>We found {len(ads)} new listing{_plural(len(ads))} matching your search:</p>"
+    )
+    tail = f'<hr><p class="ft">{FOOTER}</p></body></html>'
+    # Room for the overflow line however many ads it ends up summarising
+    used = len(head.encode()) + len(tail.encode()) + len(_more(len(ads), search_url).encode())
+
+    cards = []
+    for ad in ads:
+        if max_ads and len(cards) >= max_ads:
+            break
+        card = _compact_card(ad)
+        size = len(card.encode())
+        if cards and max_bytes and used + size > max_bytes:
+            break
+        cards.append(card)
+        used += size
+
+    more = len(ads) - len(cards)
+    return head + "".join(cards) + (_more(more, search_url) if more else "") + tail, len(cards)
+
+
+def render_html(ads: List[SpareRoomAd], search_url: Optional[str] = None) -> Tuple[str, int]:
+    """The HTML body in the configured ``EMAIL_FORMAT``, and how many ads it shows"""
+    if config.EMAIL_FORMAT == "compact":
+        return compact_html(ads, search_url)
+    return full_html(ads)
+
+
+def text_email(ads: List[SpareRoomAd], search_url: Optional[str] = None, shown: Optional[int] = None) -> str:
+    """Plain-text body listing the first ``shown`` ads (all by default)"""
+    shown = len(ads) if shown is None else shown
+    ad_texts = []
+
+    for ad in ads[:shown]:
+        ad_texts.append(ad.format_for_email())
+        ad_texts.append("-" * 50)
+
+    more = len(ads) - shown
+    if more:
+        ad_texts.append(f"...and {more} more listing{_plural(more)}" + (f": {search_url}" if search_url else ""))
+
+    ads_text = "\n\n".join(ad_texts)
+
+    return f"""
+New SpareRoom Listings
+
+We found {len(ads)} new listing{'s' if len(ads) > 1 else ''} matching your search:
+
+{ads_text}
+
+---
+{FOOTER}
+        """.strip()
@@ -0,0 +1,208 @@
+"""Fill in ad details from ``flatshare_detail.pl`` just before ads are sent
+
+Search-result snippets often lack the price, term or availability. The
+detail page has them, but fetching it for every ad seen would multiply
+upstream traffic. The enricher only runs on the batch a notification is
+about to contain:
+
+- detail pages are fetched concurrently by a bounded worker pool, each
+  fetch waiting its turn on the shared rate limiter;
+- results (and short-lived failures) are kept in a TTL cache keyed by
+  ``flatshare_id``, and concurrent requests for the same ad share one
+  fetch. An ad emailed to 200 subscribers costs one detail fetch.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from .config import config
+from .models import SpareRoomAd
+from .parsing import extract_availability, extract_max_term, extract_min_term, extract_property_type
+from .rate_limiter import rate_limiter
+from .scraper import scraper
+from .logger import logger
+
+# How long a failed detail fetch is remembered before it is retried
+FAILURE_TTL = 300
+
+# Detail-page labels (lower case, without punctuation) → ad fields
+_LABELS = {
+    "available": "availability",
+    "available from": "availability",
+    "minimum term": "min_term",
+    "min term": "min_term",
+    "maximum term": "max_term",
+    "max term": "max_term",
+    "bills included": "bills_included",
+    "area": "location",
+    "postcode": "location",
+}
+_TERM = re.compile(r"(\d+)\s+months?", re.IGNORECASE)
+_PRICE = re.compile(r"£[\d,]+\s*(?:pcm|pw|per month|per week)", re.IGNORECASE)
+
+
+def parse_detail_page(html: str) -> Dict[str, object]:
+    """Ad fields found on a detail page (only the ones present)"""
+    soup = BeautifulSoup(html, "html.parser")
+    details: Dict[str, object] = {}
+
+    # Feature lists are <dt>/<dd> pairs; some layouts use <th>/<td> rows
+    pairs = [(dt, dt.find_next_sibling("dd")) for dt in soup.find_all("dt")]
+    pairs += [(th, th.find_next_sibling("td")) for th in soup.find_all("th")]
+    for label_el, value_el in pairs:
+        if value_el is None:
+            continue
+        label = re.sub(r"[^a-z ]", "", label_el.get_text(" ").lower()).strip()
+        value = " ".join(value_el.get_text(" ").split())
+        field = _LABELS.get(label)
+        if not field or not value or field in details:
+            continue
+
+        if field == "bills_included":
+            details[field] = value.lower().startswith("yes")
+        elif field in ("min_term", "max_term"):
+            match = _TERM.search(value)
+            if match:
+                details[field] = f"{match.group(1)} months"
+        elif field == "availability":
+            details[field] = value if value.lower().startswith("available") else f"Available {value}"
+        else:
+            details[field] = value
+
+    text = " ".join(soup.get_text(" ").split())
+    price_el = soup.find(class_=re.compile("price"))
+    price = _PRICE.search(price_el.get_text(" ")) if price_el else None
+    price = price or _PRICE.search(text)
+    if price:
+        details["price"] = " ".join(price.group(0).split())
+
+    # Fall back to the snippet extractors over the whole page
+    for field, extract in (
+        ("availability", extract_availability),
+        ("min_term", extract_min_term),
+        ("max_term", extract_max_term),
+        ("property_type", extract_property_type),
+    ):
+        if field not in details:
+            value = extract(text)
+            if value:
+                details[field] = value
+
+    return details
+
+
+class DetailEnricher:
+    """Concurrent, cached detail-page lookups for ads about to be emailed"""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.workers = max(1, workers or config.ENRICH_WORKERS)
+        self.ttl = config.ENRICH_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or config.ENRICH_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Tuple[float, Optional[dict]]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Start fresh counters (called at the start of each run)"""
+        with self._lock:
+            self.hits = self.fetches = self.failures = self.shared = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "fetches": self.fetches,
+                "failures": self.failures,
+                "shared": self.shared,
+                "cached": len(self._cache),
+            }
+
+    def export_state(self) -> dict:
+        """Live cache entries with their remaining lifetime, for a warm start"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "entries": [
+                    [ad_id, expires - now, details]
+                    for ad_id, (expires, details) in self._cache.items()
+                    if expires > now
+                ]
+            }
+
+    def import_state(self, state: dict) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for ad_id, remaining, details in state.get("entries", [])[-self.max_entries:]:
+                self._cache[ad_id] = (now + min(remaining, self.ttl), details)
+
+    def enrich(self, ads: List[SpareRoomAd]) -> List[SpareRoomAd]:
+        """Copies of ``ads`` with fields from their detail pages filled in"""
+        futures = [self._lookup(ad) for ad in ads]
+        enriched = []
+        for ad, future in zip(ads, futures):
+            details = future.result()
+            enriched.append(replace(ad, **details) if details else ad)
+        return enriched
+
+    def _lookup(self, ad: SpareRoomAd) -> Future:
+        """Future for the ad's details: cached, already in flight, or a new fetch"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(ad.id)
+            if cached is not None and cached[0] > now:
+                self._cache.move_to_end(ad.id)
+                self.hits += 1
+                future: Future = Future()
+                future.set_result(cached[1])
+                return future
+
+            if ad.id in self._inflight:
+                self.shared += 1
+                return self._inflight[ad.id]
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="enrich")
+            future = self._executor.submit(self._fetch, ad)
+            self._inflight[ad.id] = future
+            return future
+
+    def _fetch(self, ad: SpareRoomAd) -> Optional[dict]:
+        details: Optional[dict] = None
+        ttl = self.ttl
+        try:
+            rate_limiter.wait()
+            details = parse_detail_page(scraper.fetch_html(ad.url))
+            with self._lock:
+                self.fetches += 1
+        except Exception as error:
+            # The email still goes out with the snippet's fields
+            logger.debug("Detail fetch failed for ad %s: %s", ad.id, error)
+            ttl = min(ttl, FAILURE_TTL)
+            with self._lock:
+                self.failures += 1
+
+        with self._lock:
+            self._cache[ad.id] = (time.monotonic() + ttl, details)
+            self._cache.move_to_end(ad.id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            self._inflight.pop(ad.id, None)
+        return details
+
+
+# Singleton instance (None unless ENRICH_DETAILS is on)
+enricher = DetailEnricher() if config.ENRICH_DETAILS else None
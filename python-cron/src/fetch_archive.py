@@ -0,0 +1,208 @@
+"""Record fetched pages to an archive and replay them without the network
+
+An archive is an append-only file of gzip members, one per fetch, each
+holding a single JSON record: URL, status, headers, body, timing and sizes
+(or the error the fetch raised, with the status and headers of the
+response it carried, if any). Appending a member never rewrites earlier
+ones, so several processes can record into the same file, and a member cut
+short by a crash only loses that one fetch. ``zcat archive.gz`` shows the
+records as JSON lines.
+
+``RecordingTransport`` fetches live and appends every result;
+``ReplayTransport`` serves fetches from an archive, reproducing the recorded
+latency at ``speed`` times the original (0 for no delay).
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+from typing import Deque, Dict, Iterator, Optional
+
+import requests
+
+from .transport import DeadlineExceeded, FetchResult, Transport, _Attempt
+from .logger import logger
+
+ARCHIVE_VERSION = 1
+
+# Exceptions a recorded failure is replayed as, by recorded class name
+_ERRORS = {
+    "DeadlineExceeded": DeadlineExceeded,
+    "Timeout": requests.Timeout,
+    "ConnectTimeout": requests.ConnectTimeout,
+    "ReadTimeout": requests.ReadTimeout,
+    "ConnectionError": requests.ConnectionError,
+    "HTTPError": requests.HTTPError,
+}
+
+
+class FetchArchive:
+    """Append-only writer for fetch records"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._seq = 0
+
+    def append(self, record: dict) -> None:
+        """Add one record as its own gzip member"""
+        with self._lock:
+            self._seq += 1
+            record = {
+                "v": ARCHIVE_VERSION,
+                "seq": self._seq,
+                "offset": round(time.monotonic() - self._started, 4),
+                "recorded_at": time.time(),
+                **record,
+            }
+            member = gzip.compress(json.dumps(record, separators=(",", ":")).encode(), compresslevel=6)
+            # O_APPEND keeps each member contiguous even with other writers
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, member)
+            finally:
+                os.close(fd)
+
+
+def read_archive(path: str, chunk_size: int = 1 << 16) -> Iterator[dict]:
+    """Yield the records of an archive in order, skipping a truncated tail"""
+    decompressor = zlib.decompressobj(wbits=31)
+    buffer = b""
+    partial = False
+
+    with open(path, "rb") as f:
+        data = f.read(chunk_size)
+        while data:
+            partial = True
+            try:
+                buffer += decompressor.decompress(data)
+            except zlib.error:
+                break
+            if decompressor.eof:
+                yield _decode(buffer)
+                buffer, partial = b"", False
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(wbits=31)
+                if data:
+                    continue
+            data = f.read(chunk_size)
+
+    if partial:
+        logger.warning(f"⚠️  Ignoring truncated record at the end of {path}")
+
+
+def _decode(data: bytes) -> dict:
+    record = json.loads(data)
+    if record.get("v") != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported fetch archive version {record.get('v')}")
+    return record
+
+
+class RecordingTransport(Transport):
+    """Live transport that appends every fetch it returns to an archive"""
+
+    def __init__(self, archive_path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = FetchArchive(archive_path)
+
+    def get(self, url: str) -> FetchResult:
+        started = time.monotonic()
+        try:
+            result = super().get(url)
+        except requests.RequestException as error:
+            record = {
+                "url": url,
+                "error": type(error).__name__,
+                "message": str(error),
+                "elapsed": round(time.monotonic() - started, 4),
+            }
+            if error.response is not None:
+                # An HTTP error: keep what error categories and the quarantine look at
+                record["status"] = error.response.status_code
+                record["headers"] = dict(error.response.headers)
+            self.archive.append(record)
+            raise
+
+        self.archive.append({
+            "url": url,
+            "status": result.status_code,
+            "headers": result.headers,
+            "body": result.text,
+            "elapsed": round(result.elapsed, 4),
+            "wire_bytes": result.wire_bytes,
+            "body_bytes": result.body_bytes,
+        })
+        return result
+
+
+class ReplayTransport(Transport):
+    """Serves fetches from an archive instead of the network
+
+    Each URL replays its recorded responses in order; once they run out the
+    last one is repeated, so the same archive can drive several runs. A URL
+    that was never recorded fails like a connection error.
+    """
+
+    def __init__(self, archive_path: str, speed: float = 1.0, **kwargs):
+        kwargs.setdefault("hedge", False)
+        super().__init__(**kwargs)
+        self.speed = speed
+        self._responses: Dict[str, Deque[dict]] = defaultdict(deque)
+        count = 0
+        for record in read_archive(archive_path):
+            self._responses[record["url"]].append(record)
+            count += 1
+        logger.info(f"📼 Replaying {count} recorded fetch(es) of {len(self._responses)} URL(s) from {archive_path}")
+
+    def _next(self, url: str) -> Optional[dict]:
+        with self._lock:
+            responses = self._responses.get(url)
+            if not responses:
+                return None
+            return responses.popleft() if len(responses) > 1 else responses[0]
+
+    def _fetch(self, url: str, hedged: bool = False, attempt: Optional[_Attempt] = None) -> FetchResult:
+        started = time.monotonic()
+        record = self._next(url)
+        if record is None:
+            raise requests.ConnectionError(f"No recorded response for {url}")
+
+        if self.speed > 0:
+            time.sleep(record.get("elapsed", 0.0) / self.speed)
+
+        if "error" in record:
+            raise _ERRORS.get(record["error"], requests.RequestException)(
+                record["message"], response=_error_response(url, record)
+            )
+
+        body = record["body"]
+        return FetchResult(
+            url=url,
+            status_code=record["status"],
+            text=body,
+            headers=record["headers"],
+            elapsed=time.monotonic() - started,
+            wire_bytes=record.get("wire_bytes", len(body)),
+            body_bytes=record.get("body_bytes", len(body)),
+            hedged=hedged,
+        )
+
+
+def _error_response(url: str, record: dict) -> Optional[requests.Response]:
+    """The response a recorded HTTP error carried, rebuilt without its body"""
+    if "status" not in record:
+        return None
+    response = requests.Response()
+    response.url = url
+    response.status_code = record["status"]
+    response.headers.update(record.get("headers") or {})
+    response._content = b""
+    return response
@@ -0,0 +1,194 @@
+"""Per-user keyword filters over new ads, answered by SQLite FTS5
+
+A user's ``keyword_filters`` is a comma-separated list of rules::
+
+    garden, "en suite"|ensuite, -couples, -student*
+
+Every plain rule must be mentioned by an ad (``|`` separates alternatives),
+a rule starting with ``-`` must not be, and a trailing ``*`` matches any
+word starting with the rule. Matching is case-insensitive and stemmed, so
+"garden" also finds "gardens".
+
+Rules compile to FTS5 phrases. Each ad a run sees goes into an in-memory
+FTS5 table as the diff stage reaches it, and each distinct phrase is
+looked up once for the rows added since it was last asked: a thousand
+users filtering on "garden" share one lookup, not a thousand passes over
+their ads. A user's rules then combine the phrases' matching IDs with set
+operations. Nothing is indexed in a run without a user who has filters,
+and nothing is written to the database.
+"""
+
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import config
+from .models import SpareRoomAd, User
+from .logger import logger
+
+# Case-insensitive, accent-folding and stemmed ("gardens" matches "garden")
+FTS_TOKENIZER = "porter unicode61 remove_diacritics 2"
+
+# (groups of which every one needs a matching phrase, phrases that must not match)
+Rules = Tuple[Tuple[Tuple[str, ...], ...], Tuple[str, ...]]
+
+
+def _phrase(term: str) -> Optional[str]:
+    """One rule alternative as an FTS5 phrase ("couple*" → '"couple" *')"""
+    prefix = term.endswith("*")
+    text = term.rstrip("*").strip().strip('"').strip()
+    if not text:
+        return None
+    return '"' + text.replace('"', '""') + '"' + (" *" if prefix else "")
+
+
+@lru_cache(maxsize=4096)
+def compile_filters(text: Optional[str]) -> Optional[Rules]:
+    """Compile a ``keyword_filters`` value into FTS5 phrases (None when there are no rules)"""
+    required: List[Tuple[str, ...]] = []
+    excluded: List[str] = []
+    for rule in (text or "").split(","):
+        rule = rule.strip()
+        phrases = tuple(phrase for phrase in map(_phrase, rule.lstrip("-").split("|")) if phrase)
+        if not phrases:
+            continue
+        if rule.startswith("-"):
+            excluded.extend(phrases)
+        else:
+            required.append(phrases)
+    if not required and not excluded:
+        return None
+    return tuple(required), tuple(excluded)
+
+
+def fts5_available() -> bool:
+    """Whether this SQLite build includes FTS5"""
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE probe USING fts5(text)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+class KeywordIndex:
+    """Indexes the text of a run's ads and filters users' new ads by keyword
+
+    The index is only built once the run has a user with filters: ``start``
+    turns it on when one of the run's users has some, and ``filter`` does
+    for a user who gains them mid-run (the daemon's reloads).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.start()
+
+    def start(self, users: Iterable[User] = ()) -> None:
+        """Begin a new run, indexing its ads only if one of ``users`` has filters"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            # Ad ID → rowid in ``run_text``, and back (rowid n is ``_ad_ids[n - 1]``)
+            self._rowids: Dict[int, int] = {}
+            self._ad_ids: List[int] = []
+            # Phrase → (IDs of this run's ads that match, highest rowid looked at)
+            self._phrases: Dict[str, Tuple[Set[int], int]] = {}
+            self.users = self.dropped = self.lookups = 0
+            self.filter_seconds = 0.0
+            if any(compile_filters(user.keyword_filters) for user in users):
+                self._activate()
+
+    def _activate(self) -> None:
+        # Used from the diff worker and the main thread, never at once (see the lock)
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._conn.execute(f"CREATE VIRTUAL TABLE run_text USING fts5(title, raw_text, tokenize='{FTS_TOKENIZER}')")
+
+    @property
+    def active(self) -> bool:
+        """Whether this run's ads are being indexed"""
+        return self._conn is not None
+
+    def observe(self, ads: Iterable[SpareRoomAd]) -> None:
+        """Index ads seen now for this run's filters (nothing while inactive)"""
+        with self._lock:
+            if self._conn is None:
+                return
+            for ad in ads:
+                ad_id = int(ad.id)
+                if ad_id in self._rowids:
+                    continue
+                self._conn.execute("INSERT INTO run_text (rowid, title, raw_text) VALUES (?, ?, ?)",
+                                   (len(self._ad_ids) + 1, ad.title or "", ad.raw_text or ""))
+                self._ad_ids.append(ad_id)
+                self._rowids[ad_id] = len(self._ad_ids)
+
+    def _matches(self, phrase: str, needed: int) -> Set[int]:
+        """IDs of this run's ads matching ``phrase``, caught up to at least rowid ``needed``"""
+        hits, through = self._phrases.get(phrase, (set(), 0))
+        if through < needed:
+            last = len(self._ad_ids)
+            rowids = self._conn.execute(
+                "SELECT rowid FROM run_text WHERE run_text MATCH ? AND rowid > ? AND rowid <= ?",
+                (phrase, through, last),
+            ).fetchall()
+            hits = hits | {self._ad_ids[rowid - 1] for (rowid,) in rowids}
+            self._phrases[phrase] = (hits, last)
+            self.lookups += 1
+        return hits
+
+    def filter(self, user: User, ads: List[SpareRoomAd]) -> List[SpareRoomAd]:
+        """The ``ads`` that pass the user's keyword filters, in order"""
+        rules = compile_filters(user.keyword_filters)
+        if rules is None or not ads:
+            return ads
+
+        required, excluded = rules
+        with self._lock:
+            if self._conn is None:
+                self._activate()
+        self.observe(ads)
+        started = time.perf_counter()
+        with self._lock:
+            ids = {int(ad.id) for ad in ads}
+            needed = max(self._rowids[ad_id] for ad_id in ids)
+            try:
+                keep = set(ids)
+                for group in required:
+                    keep &= set().union(*(self._matches(phrase, needed) for phrase in group))
+                for phrase in excluded:
+                    keep -= self._matches(phrase, needed)
+            except sqlite3.Error as error:
+                # Better to send an unfiltered ad than to lose one
+                logger.warning(f"⚠️  Ignoring keyword filters for {user.email} ({user.keyword_filters!r}): {error}")
+                return ads
+            self.filter_seconds += time.perf_counter() - started
+            self.users += 1
+            self.dropped += len(ids) - len(keep)
+        return [ad for ad in ads if int(ad.id) in keep]
+
+    def finish(self) -> dict:
+        """The run's counters"""
+        with self._lock:
+            return {
+                "indexed": len(self._ad_ids),
+                "filtered_users": self.users,
+                "filtered_out": self.dropped,
+                "phrase_lookups": self.lookups,
+                "filter_ms": round(self.filter_seconds * 1000, 2),
+            }
+
+
+def _create_index() -> Optional[KeywordIndex]:
+    if not config.KEYWORD_FILTERS:
+        return None
+    if not fts5_available():
+        logger.warning("⚠️  Keyword filters disabled: this SQLite build has no FTS5")
+        return None
+    return KeywordIndex()
+
+
+# Singleton instance (None when KEYWORD_FILTERS is off or FTS5 is missing)
+keyword_index = _create_index()
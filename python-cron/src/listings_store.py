@@ -0,0 +1,354 @@
+"""Append-only columnar store of captured listings, queried with NumPy
+
+With ``LISTINGS_STORE_DIR`` set, every ad a run sees is recorded once per
+run as a row of normalised numbers (see ``normalize``). Each field is its
+own file of fixed-width little-endian values::
+
+    LISTINGS_STORE_DIR/
+        meta.json            row count and column types
+        ad_id.col            int64
+        seen_at.col          uint32, Unix seconds
+        price_pence.col      int32, monthly
+        ...
+
+Rows are appended under an ``fcntl`` lock and only become visible when
+``meta.json`` is atomically replaced with the new row count, so a writer
+that dies halfway leaves a tail that the next append overwrites. Readers
+memory-map the columns: a query over millions of rows touches only the
+columns it uses, and every filter and aggregate is a vectorised NumPy
+operation rather than a Python loop over ads::
+
+    listings = ListingsStore("listings").read()
+    recent = listings.where(seen_at=(time.time() - 30 * 86400, None), bills_included=1)
+    recent.group_by("district", "price_pence", "median")   # {"NW1": 95000.0, ...}
+    recent.where(district=["NW1", "N1"]).time_to_let()     # days each ad stayed up
+
+NumPy is only needed when the store is used.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from . import normalize
+from .config import config
+from .models import SpareRoomAd
+from .logger import logger
+
+VERSION = 1
+# Column name → NumPy dtype; -1 marks a missing value in the signed columns
+COLUMNS = {
+    "ad_id": "<i8",
+    "seen_at": "<u4",
+    "price_pence": "<i4",
+    "min_term_months": "<i2",
+    "max_term_months": "<i2",
+    "available_day": "<i4",
+    "district": "<i4",
+    "property_type": "<i1",
+    "bedrooms": "<i1",
+    "bills_included": "<i1",
+}
+AGGREGATES = ("count", "sum", "mean", "median", "min", "max")
+
+
+def normalize_ads(ads: Iterable[SpareRoomAd], seen_at: float) -> Dict[str, list]:
+    """Column-wise numeric values for ``ads`` seen at ``seen_at``"""
+    columns: Dict[str, list] = {name: [] for name in COLUMNS}
+    for ad in ads:
+        columns["ad_id"].append(int(ad.id))
+        columns["seen_at"].append(int(seen_at))
+        columns["price_pence"].append(normalize.price_pence(ad.price))
+        columns["min_term_months"].append(normalize.term_months(ad.min_term))
+        columns["max_term_months"].append(normalize.term_months(ad.max_term))
+        columns["available_day"].append(normalize.available_day(ad.availability, seen_at))
+        columns["district"].append(normalize.district_code(ad.location))
+        columns["property_type"].append(normalize.property_type_code(ad.property_type))
+        columns["bedrooms"].append(normalize.bedrooms(ad.property_type))
+        columns["bills_included"].append(int(ad.bills_included))
+    return columns
+
+
+class Listings:
+    """A set of rows (all of the store, or a filtered subset) as NumPy columns"""
+
+    def __init__(self, columns: Dict[str, "np.ndarray"]):
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns["ad_id"])
+
+    def __getitem__(self, name: str) -> "np.ndarray":
+        return self.columns[name]
+
+    def mask(self, **conditions) -> "np.ndarray":
+        """Boolean row mask for ``where`` conditions"""
+        keep = np.ones(len(self), dtype=bool)
+        for name, condition in conditions.items():
+            values = self.columns[name]
+            if name == "district":
+                condition = _district_codes(condition)
+            if isinstance(condition, tuple):
+                low, high = condition
+                if low is not None:
+                    keep &= values >= low
+                if high is not None:
+                    keep &= values <= high
+            elif isinstance(condition, (list, set, frozenset)):
+                keep &= np.isin(values, list(condition))
+            else:
+                keep &= values == condition
+        return keep
+
+    def where(self, mask: Optional["np.ndarray"] = None, **conditions) -> "Listings":
+        """Rows matching every condition
+
+        A condition is a value (equality), a list (any of) or a
+        ``(low, high)`` tuple (inclusive range, ``None`` for open ends).
+        ``district`` also accepts names such as ``"NW1"``.
+        """
+        keep = self.mask(**conditions)
+        if mask is not None:
+            keep &= mask
+        return Listings({name: values[keep] for name, values in self.columns.items()})
+
+    def aggregate(self, column: str, how: str = "mean") -> float:
+        """One aggregate over a column, ignoring missing (-1) values"""
+        values = _present(self.columns[column])
+        if how == "count":
+            return float(len(values))
+        if len(values) == 0:
+            return float("nan")
+        return float(getattr(np, how)(values))
+
+    def group_by(self, key: str, column: str, how: str = "median") -> Dict[Union[str, int], float]:
+        """``how`` of ``column`` per distinct ``key`` (districts by name)
+
+        Rows are sorted by (key, value) once and every group is reduced with
+        one ``reduceat`` call; medians are read off the sorted values.
+        """
+        if how not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{how}' (use one of {', '.join(AGGREGATES)})")
+        keys, values = self.columns[key], self.columns[column]
+        present = (values != normalize.MISSING) & (keys != normalize.MISSING)
+        keys, values = _sort_pairs(keys[present], values[present])
+        if len(keys) == 0:
+            return {}
+
+        values = values.astype(np.float64)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+
+        if how == "count":
+            result = counts.astype(np.float64)
+        elif how == "sum":
+            result = np.add.reduceat(values, starts)
+        elif how == "mean":
+            result = np.add.reduceat(values, starts) / counts
+        elif how == "min":
+            result = np.minimum.reduceat(values, starts)
+        elif how == "max":
+            result = np.maximum.reduceat(values, starts)
+        else:
+            # Values are sorted within each group, so the median is the middle one(s)
+            low = starts + (counts - 1) // 2
+            high = starts + counts // 2
+            result = (values[low] + values[high]) / 2
+
+        labels = keys[starts]
+        if key == "district":
+            return {normalize.district_name(code): float(value) for code, value in zip(labels, result)}
+        return {int(label): float(value) for label, value in zip(labels, result)}
+
+    def latest(self) -> "Listings":
+        """The most recent row of each ad"""
+        if len(self) == 0:
+            return self
+        ids, seen = self.columns["ad_id"], self.columns["seen_at"]
+        if _packable(ids, seen):
+            order = np.argsort(_pack(ids, seen))
+        else:
+            order = np.lexsort((seen, ids))
+        ids = ids[order]
+        last = order[np.r_[ids[1:] != ids[:-1], True]]
+        return Listings({name: values[last] for name, values in self.columns.items()})
+
+    def time_to_let(self) -> Tuple["np.ndarray", "np.ndarray"]:
+        """(ad IDs, days between each ad's first and last sighting)
+
+        An ad that stops appearing has most likely been let, so for ads no
+        longer seen this is how long they were on the market.
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ids, seen = _sort_pairs(self.columns["ad_id"], self.columns["seen_at"])
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:], len(ids)] - 1
+        return ids[starts], (seen[ends].astype(np.int64) - seen[starts]) / 86400
+
+
+def _packable(keys: "np.ndarray", values: "np.ndarray") -> bool:
+    """Whether (key, value) pairs fit in one int64 sort key"""
+    return (
+        keys.dtype.kind == "i"
+        and values.dtype.kind in "iu"
+        and len(keys) > 0
+        and 0 <= keys.min() and keys.max() < 2**31
+        and 0 <= values.min() and values.max() < 2**32
+    )
+
+
+def _pack(keys: "np.ndarray", values: "np.ndarray") -> "np.ndarray":
+    return (keys.astype(np.int64) << 32) | values.astype(np.int64)
+
+
+def _sort_pairs(keys: "np.ndarray", values: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """``keys`` and ``values`` sorted by key, then value
+
+    Integer pairs are packed into one int64 and sorted in place, which is
+    several times faster than an indirect ``lexsort``.
+    """
+    if _packable(keys, values):
+        packed = np.sort(_pack(keys, values))
+        return packed >> 32, packed & 0xFFFFFFFF
+    order = np.lexsort((values, keys))
+    return keys[order], values[order]
+
+
+def _present(values: "np.ndarray") -> "np.ndarray":
+    return values[values != normalize.MISSING] if values.dtype.kind == "i" else values
+
+
+def _district_codes(condition):
+    if isinstance(condition, str):
+        return normalize.district_code(condition)
+    if isinstance(condition, (list, set, frozenset)):
+        return [normalize.district_code(item) if isinstance(item, str) else item for item in condition]
+    return condition
+
+
+class ListingsStore:
+    """Directory of memory-mapped column files, appended to once per run"""
+
+    def __init__(self, path: str, flush_rows: Optional[int] = None):
+        if np is None:
+            raise RuntimeError("The listings store needs NumPy (pip install numpy)")
+        self.path = path
+        self.flush_rows = flush_rows or config.LISTINGS_FLUSH_ROWS
+        self._lock = threading.Lock()
+        # Ads seen since the last flush, by ID, so each is stored once per run
+        self._buffer: Dict[str, SpareRoomAd] = {}
+        self._buffer_seen_at = time.time()
+        os.makedirs(path, exist_ok=True)
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.col")
+
+    def rows(self) -> int:
+        """Committed rows"""
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return 0
+        if meta.get("version") != VERSION or meta.get("columns") != COLUMNS:
+            raise ValueError(f"{self.path} was written with another listings store layout")
+        return int(meta["rows"])
+
+    def observe(self, ads: Iterable[SpareRoomAd]) -> None:
+        """Buffer ads seen now; written out by ``flush`` (or once the buffer fills)"""
+        with self._lock:
+            if not self._buffer:
+                self._buffer_seen_at = time.time()
+            for ad in ads:
+                self._buffer.setdefault(ad.id, ad)
+            full = len(self._buffer) >= self.flush_rows
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Append the buffered ads; returns rows written"""
+        with self._lock:
+            ads, self._buffer = list(self._buffer.values()), {}
+            seen_at = self._buffer_seen_at
+        if not ads:
+            return 0
+        try:
+            return self.append(ads, seen_at)
+        except Exception as error:
+            logger.warning(f"⚠️  Could not append {len(ads)} listing(s) to {self.path}: {error}")
+            return 0
+
+    def append(self, ads: List[SpareRoomAd], seen_at: Optional[float] = None) -> int:
+        """Normalise ``ads`` and append them as rows"""
+        columns = normalize_ads(ads, time.time() if seen_at is None else seen_at)
+        with self._file_lock():
+            rows = self.rows()
+            for name, dtype in COLUMNS.items():
+                data = np.asarray(columns[name], dtype=dtype)
+                with open(self._column_path(name), "ab") as f:
+                    # Drop any tail left by a writer that died before committing
+                    f.truncate(rows * data.itemsize)
+                    f.write(data.tobytes())
+
+            tmp_path = f"{self._meta_path()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": VERSION, "rows": rows + len(ads), "columns": COLUMNS}, f)
+            os.replace(tmp_path, self._meta_path())
+        logger.debug("Appended %d listing(s) to %s", len(ads), self.path)
+        return len(ads)
+
+    def read(self) -> Listings:
+        """Memory-mapped view of every committed row"""
+        rows = self.rows()
+        columns = {}
+        for name, dtype in COLUMNS.items():
+            if rows == 0:
+                columns[name] = np.empty(0, dtype=dtype)
+            else:
+                columns[name] = np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(rows,))
+        return Listings(columns)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock serialising writers across processes"""
+        if fcntl is None:
+            yield
+            return
+
+        with open(os.path.join(self.path, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _create_store() -> Optional[ListingsStore]:
+    if not config.LISTINGS_STORE_DIR:
+        return None
+    try:
+        return ListingsStore(config.LISTINGS_STORE_DIR)
+    except RuntimeError as error:
+        logger.warning(f"⚠️  Listings store disabled: {error}")
+        return None
+
+
+# Singleton instance (None unless LISTINGS_STORE_DIR is set)
+listings_store = _create_store()
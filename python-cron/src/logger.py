@@ -1,28 +1,215 @@
-"""Logging configuration for SpareRoom Monitor"""
+"""Logging configuration for SpareRoom Monitor
 
+Records are handed to a background thread through a queue, so a slow
+stdout (a pipe, a log shipper) never stalls a pipeline worker. Per-user
+lines use ``%s`` arguments instead of f-strings: nothing is formatted for
+a level that is switched off, and enabled lines are formatted on the
+logging thread.
+
+``LOG_FORMAT=json`` writes one JSON object per line, with the structured
+fields passed as ``extra`` (``user_id``, ``search``, ``stage``,
+``duration``) next to the message. ``LOG_SAMPLE_RATE`` caps how many lines
+per second each message template may log at INFO or below; the next line
+that gets through reports how many were suppressed.
+"""
+
+import atexit
+import hashlib
+import json
 import logging
+import os
+import queue
 import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, TextIO
+
 from .config import config
 
+# Structured fields copied into JSON lines when a record carries them
+FIELDS = ("user_id", "search", "stage", "duration", "suppressed")
+# Message templates the sampling filter keeps buckets for
+MAX_TEMPLATES = 1024
+
+
+def search_key(url: Optional[str]) -> Optional[str]:
+    """Short stable key for a search URL, to group lines without logging the URL"""
+    if not url:
+        return None
+    return hashlib.blake2b(url.encode(), digest_size=6).hexdigest()
+
+
+class TextFormatter(logging.Formatter):
+    """The classic ``time - LEVEL - message`` line"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{line} (+{suppressed} similar suppressed)" if suppressed else line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, structured fields included"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        for name in FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = round(value, 4) if name == "duration" else value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Token bucket per message template for INFO and below
+
+    Each template may log ``rate`` lines per second on average, with bursts
+    of ``burst``. Warnings and errors always pass.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self._lock = threading.Lock()
+        # template → [tokens, last refill, suppressed since last line]
+        self._buckets: Dict[str, List[float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.msg)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TEMPLATES:
+                    # Pre-formatted messages are all distinct; start over
+                    self._buckets.clear()
+                bucket = self._buckets[record.msg] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = int(bucket[2])
+                bucket[2] = 0
+        return True
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room rather than fail when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+
+class BackgroundHandler(QueueHandler):
+    """Queues records for a listener thread without formatting them first
+
+    The stdlib handler formats every record in the caller's thread; here
+    the record is queued as it is and formatted when it is written, so
+    log arguments should be values that are not modified afterwards.
+    When the queue is full, INFO and DEBUG records are dropped (and
+    counted) rather than slowing the caller down. Records logged in a
+    forked child (parse workers) are written directly, since the listener
+    thread only exists in the parent.
+    """
+
+    def __init__(self, log_queue: queue.Queue, target: logging.Handler):
+        super().__init__(log_queue)
+        self.target = target
+        self.pid = os.getpid()
+        self.dropped = 0
+        self.listener = _Listener(log_queue, target, respect_handler_level=True)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno > logging.INFO:
+                # Never lose warnings and errors; wait for room instead
+                self.queue.put(record)
+            else:
+                self.dropped += 1
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if os.getpid() != self.pid:
+            self.target.handle(record)
+        else:
+            super().emit(record)
+
+
+_handlers: List[BackgroundHandler] = []
+
+
+def _stop_listeners() -> None:
+    """Write out everything still queued (registered with atexit)"""
+    while _handlers:
+        handler = _handlers.pop()
+        handler.listener.stop()
+        if handler.dropped:
+            handler.target.handle(logging.makeLogRecord({
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"⚠️  {handler.dropped} log line(s) dropped while the log queue was full",
+            }))
+
+
+atexit.register(_stop_listeners)
+
+
+def setup_logger(
+    name: str = "spareroom_monitor",
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    background: Optional[bool] = None,
+    sample_rate: Optional[float] = None,
+    stream: Optional[TextIO] = None,
+) -> logging.Logger:
+    """Configure and return a logger instance (arguments default to the config)"""
+    level = getattr(logging, (level or config.LOG_LEVEL).upper())
+    fmt = (fmt or config.LOG_FORMAT).lower()
+    background = config.LOG_ASYNC if background is None else background
+    sample_rate = config.LOG_SAMPLE_RATE if sample_rate is None else sample_rate
 
-def setup_logger(name: str = "spareroom_monitor") -> logging.Logger:
-    """Configure and return a logger instance"""
     logger = logging.getLogger(name)
-    logger.setLevel(getattr(logging, config.LOG_LEVEL.upper()))
+    logger.setLevel(level)
 
     # Console handler
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(getattr(logging, config.LOG_LEVEL.upper()))
-
-    # Format with emoji for better readability
-    formatter = logging.Formatter(
-        "%(asctime)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-    handler.setFormatter(formatter)
-
-    # Remove existing handlers and add our handler
-    logger.handlers = []
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setLevel(level)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    handler: logging.Handler = output
+    if background:
+        handler = BackgroundHandler(queue.Queue(config.LOG_QUEUE_SIZE), output)
+        handler.listener.start()
+        _handlers.append(handler)
+
+    if sample_rate > 0:
+        handler.addFilter(SamplingFilter(sample_rate, config.LOG_SAMPLE_BURST))
+
+    # Remove existing handlers (flushing a previous background one) and add ours
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+        if old in _handlers:
+            _handlers.remove(old)
+            old.listener.stop()
     logger.addHandler(handler)
 
     return logger
@@ -1,7 +1,13 @@
 """Data models for SpareRoom Monitor"""
 
-from dataclasses import dataclass
-from typing import Optional
+import heapq
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+# Messages kept per error category (counts are always exact)
+ERROR_SAMPLES = 3
+# Slowest searches kept per run
+SLOWEST_SEARCHES = 10
 
 
 @dataclass
@@ -12,6 +18,15 @@ class User:
     spareroom_url: Optional[str]
     last_checked_ad_id: Optional[str]
     active: bool
+    updated_at: Optional[str] = None
+    # Minutes to collect new ads into one digest email; 0 = immediately,
+    # None = DIGEST_WINDOW_MINUTES
+    digest_minutes: Optional[int] = None
+    # Comma-separated notification channels; None = NOTIFY_CHANNELS
+    notify_channels: Optional[str] = None
+    webhook_url: Optional[str] = None
+    # Comma-separated keywords new ads must (or, prefixed with "-", must not) mention
+    keyword_filters: Optional[str] = None
 
 
 @dataclass
@@ -29,6 +44,27 @@ class SpareRoomAd:
     max_term: Optional[str] = None
     raw_text: str = ""
 
+    def to_record(self) -> Tuple:
+        """Compact tuple form, cheap to pickle between processes"""
+        return (
+            self.id,
+            self.url,
+            self.title,
+            self.price,
+            self.location,
+            self.property_type,
+            self.availability,
+            self.bills_included,
+            self.min_term,
+            self.max_term,
+            self.raw_text,
+        )
+
+    @classmethod
+    def from_record(cls, record: Tuple) -> "SpareRoomAd":
+        """Rebuild an ad from ``to_record`` output"""
+        return cls(*record)
+
     def format_for_email(self) -> str:
         """Format the ad details for email display"""
         lines = [
@@ -61,6 +97,29 @@ class SpareRoomAd:
         return "\n".join(lines)
 
 
+@dataclass
+class UserJob:
+    """A user's subscription as it moves through the pipeline stages"""
+    user: User
+    html: Optional[str] = None
+    ads: List[SpareRoomAd] = field(default_factory=list)
+    new_ads: List[SpareRoomAd] = field(default_factory=list)
+    notified: bool = False
+    error: Optional[str] = None
+    # Set for area-feed jobs: ads already matched, so fetch and parse are skipped
+    matched: bool = False
+    newest_ad_id: Optional[str] = None
+    # Encoded seen-ad set to store for the user (None when unchanged or already stored)
+    seen_ads: Optional[bytes] = None
+    error_category: Optional[str] = None
+    fetch_seconds: Optional[float] = None
+
+    def fail(self, error: str, category: str = "error") -> None:
+        """Mark the job as failed with a short reason"""
+        self.error = error
+        self.error_category = category
+
+
 @dataclass
 class CronResult:
     """Represents the result of a cron job run"""
@@ -69,10 +128,56 @@ class CronResult:
     failed: int = 0
     notifications: int = 0
     errors: list[str] = None
+    stats: dict = None
+    # Category → {"count": n, "samples": [first ERROR_SAMPLES messages]}
+    error_categories: dict = None
+    # (seconds, url) of the slowest search fetches, a min-heap
+    slowest_searches: list = None
+    # User ID → whether the user's check succeeded
+    outcomes: dict = None
 
     def __post_init__(self):
         if self.errors is None:
             self.errors = []
+        if self.stats is None:
+            self.stats = {}
+        if self.error_categories is None:
+            self.error_categories = {}
+        if self.slowest_searches is None:
+            self.slowest_searches = []
+        if self.outcomes is None:
+            self.outcomes = {}
+
+    def add_error(self, category: str, message: str) -> None:
+        """Count an error under ``category``, keeping the first few messages"""
+        entry = self.error_categories.setdefault(category, {"count": 0, "samples": []})
+        entry["count"] += 1
+        if len(entry["samples"]) < ERROR_SAMPLES:
+            entry["samples"].append(message)
+            self.errors.append(message)
+
+    def fail_user(self, user_id: int) -> None:
+        """Count a user as failed after their check, e.g. when a background delivery failed"""
+        if self.outcomes.get(user_id) is False:
+            return
+        if self.outcomes.get(user_id):
+            self.successful -= 1
+        self.failed += 1
+        self.outcomes[user_id] = False
+
+    def record_search(self, url: str, seconds: float) -> None:
+        """Remember a search fetch if it is among the slowest of the run"""
+        if len(self.slowest_searches) < SLOWEST_SEARCHES:
+            heapq.heappush(self.slowest_searches, (seconds, url))
+        elif seconds > self.slowest_searches[0][0]:
+            heapq.heapreplace(self.slowest_searches, (seconds, url))
+
+    def slowest(self) -> List[dict]:
+        """The slowest search fetches, slowest first"""
+        return [
+            {"url": url, "seconds": round(seconds, 3)}
+            for seconds, url in sorted(self.slowest_searches, reverse=True)
+        ]
 
     def to_dict(self) -> dict:
         """Convert to dictionary for JSON serialization"""
@@ -82,4 +187,7 @@ class CronResult:
             "failed": self.failed,
             "notifications": self.notifications,
             "errors": self.errors,
+            "error_categories": self.error_categories,
+            "slowest_searches": self.slowest(),
+            "stats": self.stats,
         }
@@ -0,0 +1,151 @@
+"""Numeric forms of the scraped ad fields, for analytics
+
+The scraper keeps prices, terms and dates as the strings shown on the page
+("£850 pcm", "6 months", "Available 1 Jun"). These helpers turn them into
+plain integers once, when a listing is captured, so queries never have to
+re-parse text:
+
+- price → monthly pence (weekly prices × 52 / 12);
+- terms → months;
+- availability → days since 1970-01-01 ("Now" is the day it was seen);
+- postcode district → an integer code (``district_code("NW1")``).
+
+Missing or unparseable values become ``MISSING`` (-1).
+"""
+
+import re
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Optional
+
+MISSING = -1
+
+_PRICE = re.compile(r"£\s*([\d,]+(?:\.\d+)?)\s*(pcm|pw|per\s+month|per\s+week)", re.IGNORECASE)
+_TERM = re.compile(r"(\d+)\s*(month|year|week)", re.IGNORECASE)
+_AVAILABLE = re.compile(r"(\d{1,2})\s+([A-Za-z]{3,})\.?(?:\s+(\d{4}))?")
+_DISTRICT = re.compile(r"\b([A-Z]{1,2})(\d{1,2})([A-Z]?)\b")
+_MONTHS = {name: number for number, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1
+)}
+_EPOCH = date(1970, 1, 1)
+# The same few hundred strings recur across millions of ads
+_CACHE_SIZE = 4096
+
+# Property types by code; bedrooms are a column of their own
+PROPERTY_TYPES = ["", "double room", "single room", "studio", "flat", "house", "apartment"]
+_BEDS = re.compile(r"(\d+)\s+bed\s+(flat|house|apartment)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def price_pence(price: Optional[str]) -> int:
+    """Monthly price in pence, e.g. "£850 pcm" → 85000 and "£200 pw" → 86667"""
+    match = _PRICE.search(price or "")
+    if not match:
+        return MISSING
+    amount = float(match.group(1).replace(",", ""))
+    if match.group(2).lower() in ("pw", "per week"):
+        amount = amount * 52 / 12
+    return int(round(amount * 100))
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def term_months(term: Optional[str]) -> int:
+    """Term in whole months, e.g. "6 months" → 6 and "1 year" → 12"""
+    match = _TERM.search(term or "")
+    if not match:
+        return MISSING
+    count, unit = int(match.group(1)), match.group(2).lower()
+    if unit == "year":
+        return count * 12
+    if unit == "week":
+        return max(1, round(count * 7 / 30))
+    return count
+
+
+def day_number(day: date) -> int:
+    return (day - _EPOCH).days
+
+
+def available_day(availability: Optional[str], seen_at: float) -> int:
+    """Days since 1970-01-01 an ad is available from
+
+    "Available Now" is the day it was seen. A date without a year is taken
+    as the next one on or after the month before it was seen, since ads
+    rarely stay up for long past their availability date.
+    """
+    if not availability:
+        return MISSING
+    return _available_day(availability, int(seen_at // 86400))
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _available_day(availability: str, seen_day: int) -> int:
+    seen = datetime.fromtimestamp(seen_day * 86400, timezone.utc).date()
+    if "now" in availability.lower():
+        return day_number(seen)
+
+    match = _AVAILABLE.search(availability)
+    month = _MONTHS.get(match.group(2)[:3].lower()) if match else None
+    if month is None:
+        return MISSING
+    try:
+        if match.group(3):
+            return day_number(date(int(match.group(3)), month, int(match.group(1))))
+        for year in (seen.year, seen.year + 1):
+            candidate = date(year, month, int(match.group(1)))
+            if day_number(candidate) >= day_number(seen) - 31:
+                return day_number(candidate)
+    except ValueError:
+        pass
+    return MISSING
+
+
+def _letter(char: str) -> int:
+    return ord(char) - ord("A") + 1
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def district_code(text: Optional[str]) -> int:
+    """Integer code of the postcode district in ``text`` ("Camden (NW1)" or "NW1")
+
+    Codes keep districts of the same area together and in order:
+    ``((area letter 1 × 27 + area letter 2) × 100 + number) × 27 + suffix``.
+    """
+    match = _DISTRICT.search((text or "").upper())
+    if not match:
+        return MISSING
+    area, number, suffix = match.groups()
+    first = _letter(area[0])
+    second = _letter(area[1]) if len(area) > 1 else 0
+    return ((first * 27 + second) * 100 + int(number)) * 27 + (_letter(suffix) if suffix else 0)
+
+
+def district_name(code: int) -> Optional[str]:
+    """The district a ``district_code`` stands for (None for ``MISSING``)"""
+    if code < 0:
+        return None
+    rest, suffix = divmod(int(code), 27)
+    area, number = divmod(rest, 100)
+    first, second = divmod(area, 27)
+    letters = chr(ord("A") + first - 1) + (chr(ord("A") + second - 1) if second else "")
+    return f"{letters}{number}{chr(ord('A') + suffix - 1) if suffix else ''}"
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def property_type_code(property_type: Optional[str]) -> int:
+    """Index into ``PROPERTY_TYPES`` (0 when unknown)"""
+    text = (property_type or "").lower()
+    beds = _BEDS.search(text)
+    if beds:
+        return PROPERTY_TYPES.index(beds.group(2).lower())
+    return PROPERTY_TYPES.index(text) if text in PROPERTY_TYPES else 0
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def bedrooms(property_type: Optional[str]) -> int:
+    """Bedrooms of an "N bed flat/house" type, 1 for rooms and studios, else ``MISSING``"""
+    text = (property_type or "").lower()
+    beds = _BEDS.search(text)
+    if beds:
+        return int(beds.group(1))
+    return 1 if property_type_code(text) in (1, 2, 3) else MISSING
@@ -0,0 +1,356 @@
+"""Notification channels and concurrent, non-blocking dispatch
+
+A batch of new ads is delivered to each of the user's channels:
+
+- ``email``: Resend, as before;
+- ``webhook``: a JSON POST to the user's ``webhook_url`` (or ``WEBHOOK_URL``),
+  signed with ``WEBHOOK_SECRET`` when one is set;
+- ``file``: JSON lines appended to ``NOTIFY_FILE_PATH`` (``-`` for stdout),
+  for local testing.
+
+Users pick channels in an optional ``notify_channels`` column
+(comma-separated); everyone else gets ``NOTIFY_CHANNELS``. Each channel has
+its own worker pool, whose size is its concurrency limit, and its own
+timeout, so a slow channel only queues behind itself. ``dispatch`` returns
+at once and the batch's callback runs when every channel has finished, with
+the channels that accepted it and the errors of those that failed, so a
+retry can skip the channels that already have it.
+"""
+
+import hashlib
+import hmac
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Callable, Collection, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import config
+from .enrichment import enricher
+from .models import SpareRoomAd, User
+from .logger import logger
+
+# Hosts a webhook may be sent to over plain HTTP (local stand-in endpoints)
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+def _payload(user: User, ads: List[SpareRoomAd], idempotency_key: str) -> dict:
+    return {
+        "batch_id": idempotency_key,
+        "user": {"id": user.id, "email": user.email},
+        "ads": [{k: v for k, v in asdict(ad).items() if k != "raw_text"} for ad in ads],
+    }
+
+
+class Notifier:
+    """A delivery channel; ``send`` raises unless the batch was delivered"""
+
+    name = ""
+
+    def __init__(self, timeout: float, concurrency: int):
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+
+    def accepts(self, user: User) -> bool:
+        """Whether the channel has what it needs to reach ``user``"""
+        return True
+
+    def send(self, user: User, ads: List[SpareRoomAd], idempotency_key: str) -> None:
+        raise NotImplementedError
+
+
+class EmailNotifier(Notifier):
+    """Email via Resend"""
+
+    name = "email"
+
+    def __init__(self, timeout: Optional[float] = None, concurrency: Optional[int] = None):
+        super().__init__(timeout or config.EMAIL_TIMEOUT, concurrency or config.EMAIL_CONCURRENCY)
+        import resend
+
+        # Imported here: the service needs RESEND_API_KEY, other channels don't
+        from .email_service import email_service
+
+        resend.default_http_client = resend.RequestsClient(timeout=self.timeout)
+        self.service = email_service
+
+    def send(self, user: User, ads: List[SpareRoomAd], idempotency_key: str) -> None:
+        self.service.send_new_listings_email(
+            user.email, ads, idempotency_key=idempotency_key, search_url=user.spareroom_url
+        )
+
+
+class WebhookNotifier(Notifier):
+    """JSON POST of the batch to an HTTPS endpoint
+
+    The body is signed as ``X-Signature: sha256=<hex HMAC>`` when a secret
+    is configured, and carries the batch ID as ``Idempotency-Key`` so the
+    receiver can drop a retried batch.
+    """
+
+    name = "webhook"
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        secret: Optional[str] = None,
+        timeout: Optional[float] = None,
+        concurrency: Optional[int] = None,
+    ):
+        super().__init__(timeout or config.WEBHOOK_TIMEOUT, concurrency or config.WEBHOOK_CONCURRENCY)
+        self.url = config.WEBHOOK_URL if url is None else url
+        self.secret = config.WEBHOOK_SECRET if secret is None else secret
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url_for(self, user: User) -> Optional[str]:
+        return user.webhook_url or self.url or None
+
+    def accepts(self, user: User) -> bool:
+        return bool(self.url_for(user))
+
+    def send(self, user: User, ads: List[SpareRoomAd], idempotency_key: str) -> None:
+        url = self.url_for(user)
+        parts = urlparse(url)
+        if parts.scheme != "https" and not (parts.scheme == "http" and parts.hostname in LOCAL_HOSTS):
+            raise ValueError(f"Webhook URL must use https: {url}")
+
+        body = json.dumps(_payload(user, ads, idempotency_key), separators=(",", ":")).encode()
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "SpareRoom-Monitor",
+            "Idempotency-Key": idempotency_key,
+        }
+        if self.secret:
+            digest = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Signature"] = f"sha256={digest}"
+
+        response = self.session.post(
+            url, data=body, headers=headers, timeout=(min(config.CONNECT_TIMEOUT, self.timeout), self.timeout)
+        )
+        response.raise_for_status()
+
+
+class FileNotifier(Notifier):
+    """Appends each batch as a JSON line to a file, or stdout for ``-``"""
+
+    name = "file"
+
+    def __init__(self, path: Optional[str] = None, timeout: Optional[float] = None, concurrency: Optional[int] = None):
+        # Writes are serialised anyway, so one worker by default
+        super().__init__(timeout or config.NOTIFY_TIMEOUT, concurrency or 1)
+        self.path = path or config.NOTIFY_FILE_PATH
+        self._lock = threading.Lock()
+
+    def send(self, user: User, ads: List[SpareRoomAd], idempotency_key: str) -> None:
+        line = json.dumps({"sent_at": time.time(), **_payload(user, ads, idempotency_key)}) + "\n"
+        with self._lock:
+            if self.path == "-":
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+
+
+NOTIFIERS: Dict[str, Callable[[], Notifier]] = {
+    "email": EmailNotifier,
+    "webhook": WebhookNotifier,
+    "file": FileNotifier,
+}
+
+
+def parse_channels(value: Optional[str]) -> List[str]:
+    """Channel names from a comma-separated list"""
+    return [name.strip().lower() for name in (value or "").split(",") if name.strip()]
+
+
+class _Delivery:
+    """One batch on its way to several channels"""
+
+    def __init__(
+        self,
+        user: User,
+        ads: List[SpareRoomAd],
+        key: str,
+        on_done: Callable[[List[str], Dict[str, str]], None],
+        skip: Collection[str] = (),
+    ):
+        self.user = user
+        self.ads = ads
+        self.key = key
+        self.on_done = on_done
+        self.skip = set(skip)
+        self.sent: List[str] = []
+        self.errors: Dict[str, str] = {}
+        self.remaining = 0
+
+
+class NotificationDispatcher:
+    """Delivers batches to every channel of a user concurrently, in the background"""
+
+    def __init__(self, channels: Optional[Dict[str, Notifier]] = None, workers: Optional[int] = None):
+        self.workers = max(1, workers or config.PIPELINE_NOTIFY_WORKERS)
+        self._channels: Dict[str, Notifier] = dict(channels or {})
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._prepare: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Start fresh per-channel counters (called at the start of each run)"""
+        with self._lock:
+            self._stats: Dict[str, dict] = {}
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                name: {
+                    "sent": s["sent"],
+                    "failed": s["failed"],
+                    "timeouts": s["timeouts"],
+                    "avg_seconds": round(s["seconds"] / max(s["sent"] + s["failed"], 1), 4),
+                    "max_in_flight": s["max_in_flight"],
+                }
+                for name, s in self._stats.items()
+            }
+
+    def channels_for(self, user: User) -> List[str]:
+        return parse_channels(user.notify_channels) or config.NOTIFY_CHANNELS
+
+    def channel(self, name: str) -> Notifier:
+        """The named channel, created on first use"""
+        with self._lock:
+            notifier = self._channels.get(name)
+            if notifier is None:
+                if name not in NOTIFIERS:
+                    raise ValueError(f"Unknown notification channel '{name}'")
+                notifier = self._channels[name] = NOTIFIERS[name]()
+            if name not in self._pools:
+                self._pools[name] = ThreadPoolExecutor(
+                    max_workers=notifier.concurrency, thread_name_prefix=f"notify-{name}"
+                )
+            return notifier
+
+    def dispatch(
+        self,
+        user: User,
+        ads: List[SpareRoomAd],
+        idempotency_key: str,
+        on_done: Callable[[List[str], Dict[str, str]], None],
+        skip: Collection[str] = (),
+    ) -> None:
+        """Deliver ``ads`` to the user's channels without waiting
+
+        Channels in ``skip`` (those that already accepted this batch) are
+        left out. ``on_done`` is called once every channel has finished, with
+        the channels that accepted the batch and the error of each channel
+        that failed (empty when all succeeded).
+        """
+        delivery = _Delivery(user, ads, idempotency_key, on_done, skip)
+        with self._lock:
+            self._pending += 1
+            if self._prepare is None:
+                self._prepare = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="notify")
+            prepare = self._prepare
+        prepare.submit(self._fan_out, delivery)
+
+    def _fan_out(self, delivery: _Delivery) -> None:
+        targets = []
+        try:
+            for name in self.channels_for(delivery.user):
+                if name in delivery.skip:
+                    continue
+                try:
+                    notifier = self.channel(name)
+                except Exception as error:
+                    delivery.errors[name] = str(error)
+                    continue
+                if notifier.accepts(delivery.user):
+                    targets.append(notifier)
+                else:
+                    delivery.errors[name] = "channel not configured for this user"
+            if targets and enricher:
+                # Detail pages are fetched only for ads actually being sent
+                delivery.ads = enricher.enrich(delivery.ads)
+        except Exception as error:
+            targets = []
+            delivery.errors["dispatch"] = str(error)
+
+        if not targets:
+            self._finish(delivery)
+            return
+
+        delivery.remaining = len(targets)
+        for notifier in targets:
+            self._pools[notifier.name].submit(self._send, notifier, delivery)
+
+    def _send(self, notifier: Notifier, delivery: _Delivery) -> None:
+        name = notifier.name
+        with self._lock:
+            stats = self._stats.setdefault(
+                name, {"sent": 0, "failed": 0, "timeouts": 0, "seconds": 0.0, "in_flight": 0, "max_in_flight": 0}
+            )
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+
+        started = time.monotonic()
+        error: Optional[Exception] = None
+        try:
+            notifier.send(delivery.user, delivery.ads, delivery.key)
+        except Exception as send_error:
+            error = send_error
+        elapsed = time.monotonic() - started
+
+        with self._lock:
+            stats["in_flight"] -= 1
+            stats["seconds"] += elapsed
+            if error is None:
+                stats["sent"] += 1
+                delivery.sent.append(name)
+            else:
+                stats["failed"] += 1
+                if isinstance(error, requests.Timeout) or elapsed >= notifier.timeout:
+                    stats["timeouts"] += 1
+                delivery.errors[name] = str(error) or type(error).__name__
+            delivery.remaining -= 1
+            last = delivery.remaining == 0
+
+        if last:
+            self._finish(delivery)
+
+    def _finish(self, delivery: _Delivery) -> None:
+        try:
+            delivery.on_done(delivery.sent, delivery.errors)
+        except Exception as error:
+            logger.error(f"❌ Notification callback failed for {delivery.user.email}: {error}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._idle.notify_all()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until no batch is in flight; False if ``timeout`` ran out first"""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def log_stats(self) -> None:
+        for name, s in self.stats().items():
+            logger.info(
+                f"   📣 {name}: {s['sent']} sent, {s['failed']} failed ({s['timeouts']} timed out), "
+                f"avg {s['avg_seconds']:.2f}s, max {s['max_in_flight']} in flight"
+            )
+
+
+# Singleton instance
+dispatcher = NotificationDispatcher()
@@ -0,0 +1,349 @@
+"""Content-addressed cache of parsed results pages, shared between processes
+
+Identical result pages (the same search fetched for several users, or a page
+that has not changed since the last run) are parsed once. The cache is a
+single memory-mapped file::
+
+    header | hash table of fixed-size slots | append-only payload region
+
+A slot holds a 16-byte BLAKE2b digest of the page body, the offset and
+length of its payload (the page's ads as compact JSON records) and when it
+was stored. A lookup hashes the body, probes a few slots and decodes only
+the one payload it needs, so any number of processes can read the file
+without loading the whole cache. Writers append under an ``fcntl`` lock.
+Entries older than the TTL are ignored and overwritten; when the file
+outgrows its size budget it is compacted to the newest live entries and
+atomically swapped in. A file that is too short, has the wrong header or
+fails to decode is discarded and recreated rather than failing the run.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from .config import config
+from .models import SpareRoomAd
+from .logger import logger
+
+MAGIC = b"SRPC"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIId8x")  # magic, version, reserved, slots, generation, created
+SLOT = struct.Struct("<16sQId4x")  # digest, payload offset, payload length, stored at
+EMPTY = bytes(16)
+MAX_PROBE = 8
+
+
+class ParseCache:
+    """On-disk, memory-mapped map of page-body digest → parsed ads"""
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        slots: Optional[int] = None,
+    ):
+        self.path = path
+        self.ttl = config.PARSE_CACHE_TTL if ttl is None else ttl
+        self.max_bytes = max_bytes or config.PARSE_CACHE_MAX_BYTES
+        self.slots = slots or config.PARSE_CACHE_SLOTS
+        self.data_start = HEADER.size + self.slots * SLOT.size
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._inode: Optional[int] = None
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Start fresh counters (called at the start of each run)"""
+        self.hits = self.misses = self.stores = self.evictions = 0
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> dict:
+        """Hit/miss counters since the last reset and the current file size"""
+        lookups = self.hits + self.misses
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "bytes": size,
+        }
+
+    @staticmethod
+    def key_for(body: str) -> bytes:
+        """Digest identifying a page body"""
+        return hashlib.blake2b(body.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def get(self, body: str) -> Optional[List[SpareRoomAd]]:
+        """Return the cached ads for ``body``, or None on a miss"""
+        key = self.key_for(body)
+        try:
+            with self._lock:
+                self._refresh()
+                payload = self._lookup(key)
+        except (struct.error, ValueError) as error:
+            self._discard(error)
+            payload = None
+        except OSError as error:
+            logger.warning(f"⚠️  Parse cache read failed: {error}")
+            payload = None
+
+        if payload is None:
+            self._count("misses")
+            return None
+
+        try:
+            ads = [SpareRoomAd.from_record(record) for record in json.loads(payload)]
+        except (ValueError, TypeError):
+            # A torn or stale payload is just a miss; the next put replaces it
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return ads
+
+    def put(self, body: str, ads: List[SpareRoomAd]) -> None:
+        """Store the parsed ads for ``body``"""
+        key = self.key_for(body)
+        payload = json.dumps([ad.to_record() for ad in ads], separators=(",", ":")).encode()
+
+        try:
+            with self._lock, self._file_lock():
+                self._refresh()
+                end = os.fstat(self._fd).st_size
+                if end + len(payload) > self.max_bytes:
+                    self._compact()
+                    self._refresh()
+                    end = os.fstat(self._fd).st_size
+
+                slot = self._choose_slot(key)
+                os.pwrite(self._fd, payload, end)
+                position = HEADER.size + slot * SLOT.size
+                # Clear the digest while the slot is rewritten so concurrent
+                # readers never pair the new digest with the old payload
+                os.pwrite(self._fd, SLOT.pack(EMPTY, end, len(payload), time.time()), position)
+                os.pwrite(self._fd, key, position)
+                self._count("stores")
+        except (struct.error, ValueError) as error:
+            self._discard(error)
+        except OSError as error:
+            logger.warning(f"⚠️  Parse cache write failed: {error}")
+
+    def close(self) -> None:
+        """Release the mapping and file descriptor"""
+        with self._lock:
+            self._close()
+
+    def _lookup(self, key: bytes) -> Optional[bytes]:
+        now = time.time()
+        base = int.from_bytes(key[:8], "little") % self.slots
+
+        for probe in range(MAX_PROBE):
+            digest, offset, length, stored_at = SLOT.unpack_from(
+                self._map, HEADER.size + ((base + probe) % self.slots) * SLOT.size
+            )
+            if digest == EMPTY:
+                return None
+            if digest != key:
+                continue
+            if now - stored_at > self.ttl:
+                return None
+            if offset + length > len(self._map):
+                self._remap()
+                if offset + length > len(self._map):
+                    return None
+            return self._map[offset:offset + length]
+
+        return None
+
+    def _choose_slot(self, key: bytes) -> int:
+        """Slot for ``key``: its own, an empty or expired one, else the oldest"""
+        now = time.time()
+        base = int.from_bytes(key[:8], "little") % self.slots
+        oldest, oldest_at = base, float("inf")
+
+        for probe in range(MAX_PROBE):
+            index = (base + probe) % self.slots
+            digest, _, _, stored_at = SLOT.unpack_from(self._map, HEADER.size + index * SLOT.size)
+            if digest in (key, EMPTY):
+                return index
+            if now - stored_at > self.ttl:
+                self._count("evictions")
+                return index
+            if stored_at < oldest_at:
+                oldest, oldest_at = index, stored_at
+
+        self._count("evictions")
+        return oldest
+
+    def _compact(self) -> None:
+        """Rewrite the file keeping the newest live entries within half the budget"""
+        now = time.time()
+        entries = []
+        for index in range(self.slots):
+            digest, offset, length, stored_at = SLOT.unpack_from(self._map, HEADER.size + index * SLOT.size)
+            if digest != EMPTY and now - stored_at <= self.ttl:
+                entries.append((stored_at, digest, offset, length))
+        entries.sort(reverse=True)
+
+        _, _, _, _, generation, _ = HEADER.unpack_from(self._map, 0)
+        table = bytearray(self.slots * SLOT.size)
+        used = set()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        kept = 0
+
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, self.slots, generation + 1, now))
+            f.write(table)
+            end = self.data_start
+            budget = self.max_bytes // 2
+
+            for stored_at, digest, offset, length in entries:
+                if end + length > budget:
+                    break
+                base = int.from_bytes(digest[:8], "little") % self.slots
+                for probe in range(MAX_PROBE):
+                    index = (base + probe) % self.slots
+                    if index not in used:
+                        used.add(index)
+                        f.write(self._map[offset:offset + length])
+                        SLOT.pack_into(table, index * SLOT.size, digest, end, length, stored_at)
+                        end += length
+                        kept += 1
+                        break
+
+            f.seek(HEADER.size)
+            f.write(table)
+
+        os.replace(tmp_path, self.path)
+        with self._stats_lock:
+            self.evictions += len(entries) - kept
+        logger.debug(f"Compacted parse cache: kept {kept} of {len(entries)} live entries")
+
+    def _refresh(self) -> None:
+        """(Re)open the file if needed and make sure the mapping covers it"""
+        if self._fd is None:
+            self._open()
+            return
+
+        stat = os.stat(self.path) if os.path.exists(self.path) else None
+        if stat is None or stat.st_ino != self._inode:
+            # Another process compacted (replaced) the file
+            self._close()
+            self._open()
+        elif stat.st_size < len(self._map) or self._map[:len(MAGIC)] != MAGIC:
+            # Truncated or overwritten in place: reading the mapping past the
+            # end would fault, so reopen (and reset) it
+            self._close()
+            self._open()
+        elif stat.st_size > len(self._map):
+            self._remap()
+
+    def _open(self, retry: bool = True) -> None:
+        if not os.path.exists(self.path):
+            self._create()
+
+        self._fd = os.open(self.path, os.O_RDWR)
+        stat = os.fstat(self._fd)
+        # Check the header before mapping: an empty file cannot be mapped and
+        # a short or foreign one cannot be unpacked
+        if stat.st_size < self.data_start or not self._header_ok(os.pread(self._fd, HEADER.size, 0)):
+            # Different layout (or garbage): start over with a fresh file
+            logger.warning(f"⚠️  Resetting incompatible parse cache {self.path}")
+            self._close()
+            self._remove()
+            if not retry:
+                raise ValueError(f"cannot create a valid parse cache at {self.path}")
+            self._open(retry=False)
+            return
+
+        self._inode = stat.st_ino
+        self._map = mmap.mmap(self._fd, stat.st_size, access=mmap.ACCESS_READ)
+
+    def _header_ok(self, header: bytes) -> bool:
+        if len(header) < HEADER.size:
+            return False
+        magic, version, _, slots, _, _ = HEADER.unpack(header)
+        return magic == MAGIC and version == VERSION and slots == self.slots
+
+    def _discard(self, error: Exception) -> None:
+        """Drop a file that failed to decode; the next access creates a fresh one"""
+        logger.warning(f"⚠️  Resetting corrupt parse cache {self.path}: {error}")
+        with self._lock:
+            self._close()
+            self._remove()
+
+    def _remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _create(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, self.slots, 0, time.time()))
+            f.write(bytes(self.slots * SLOT.size))
+        try:
+            # link() fails if another process created the file first
+            os.link(tmp_path, self.path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def _remap(self) -> None:
+        self._map.close()
+        self._map = mmap.mmap(self._fd, os.fstat(self._fd).st_size, access=mmap.ACCESS_READ)
+
+    def _close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._inode = None
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock serialising writers across processes"""
+        if fcntl is None:
+            yield
+            return
+
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Singleton instance (None when PARSE_CACHE_PATH is not set)
+parse_cache = ParseCache(config.PARSE_CACHE_PATH) if config.PARSE_CACHE_PATH else None
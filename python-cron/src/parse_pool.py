@@ -0,0 +1,145 @@
+"""Process pool for parsing results pages on every core
+
+Workers only import ``src.parsing``, which has no import-time side effects,
+so starting one never builds the scraper, its transport or (in replay mode)
+the fetch archive.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from .config import config
+from .models import SpareRoomAd
+from .parsing import parse_chunk, parse_listings, warm_up
+from .logger import logger
+
+
+def _context() -> multiprocessing.context.BaseContext:
+    """Never fork: the parent already runs logging, timer and stage threads,
+    and a forked child could inherit one of their locks held forever"""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # Preload the parser rather than the main module, which would
+        # import the whole app into the fork server
+        context.set_forkserver_preload([parse_chunk.__module__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class ParsePool:
+    """Offloads BeautifulSoup parsing to worker processes
+
+    Pages smaller than ``inline_below`` bytes are parsed in the calling
+    thread, since shipping them to a worker costs more than parsing them.
+    Larger pages submitted by concurrent callers within ``linger`` seconds
+    are grouped into chunks of up to ``chunk_size`` pages per task, and ads
+    come back as plain tuples rather than pickled dataclasses.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        inline_below: Optional[int] = None,
+        linger: float = 0.005,
+    ):
+        self.workers = workers or config.PIPELINE_PARSE_WORKERS
+        self.chunk_size = max(1, chunk_size or config.PARSE_CHUNK_SIZE)
+        self.inline_below = config.PARSE_INLINE_BELOW_BYTES if inline_below is None else inline_below
+        self.linger = linger
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, Future]] = []
+        self._timer: Optional[threading.Timer] = None
+
+    def start(self) -> "ParsePool":
+        """Spawn and warm up every worker before the first real page arrives"""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=_context(),
+                initializer=warm_up,
+            )
+            pids = {f.result() for f in [self.executor.submit(os.getpid) for _ in range(self.workers)]}
+            logger.debug(f"Parse pool warmed up ({len(pids)} worker process(es))")
+        return self
+
+    def shutdown(self) -> None:
+        """Flush pending pages and stop the workers"""
+        self._flush()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self) -> "ParsePool":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+    def parse(self, html: str) -> List[SpareRoomAd]:
+        """Parse one page, batching it with pages from other threads"""
+        if len(html) < self.inline_below or self.executor is None:
+            return parse_listings(html)
+
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((html, future))
+            if len(self._pending) >= self.chunk_size:
+                batch = self._take_pending()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.linger, self._flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+        if batch:
+            self._submit(batch)
+        return future.result()
+
+    def parse_many(self, pages: List[str]) -> List[List[SpareRoomAd]]:
+        """Parse a list of pages, ``chunk_size`` pages per worker task"""
+        if self.executor is None:
+            return [parse_listings(html) for html in pages]
+
+        chunks = [pages[i:i + self.chunk_size] for i in range(0, len(pages), self.chunk_size)]
+        results = []
+        for records in self.executor.map(parse_chunk, chunks):
+            results.extend([SpareRoomAd.from_record(r) for r in page] for page in records)
+        return results
+
+    def _take_pending(self) -> List[Tuple[str, Future]]:
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush(self) -> None:
+        with self._lock:
+            batch = self._take_pending()
+        if batch:
+            self._submit(batch)
+
+    def _submit(self, batch: List[Tuple[str, Future]]) -> None:
+        futures = [future for _, future in batch]
+        try:
+            task = self.executor.submit(parse_chunk, [html for html, _ in batch])
+        except Exception as error:
+            for future in futures:
+                future.set_exception(error)
+            return
+
+        def deliver(task: Future) -> None:
+            error = task.exception()
+            for i, future in enumerate(futures):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result([SpareRoomAd.from_record(r) for r in task.result()[i]])
+
+        task.add_done_callback(deliver)
@@ -0,0 +1,151 @@
+"""Parsing of SpareRoom results pages into ads
+
+Kept free of import-time side effects (no config, logging, transport or
+scraper singleton) so parse pool workers can import it without building
+any of them.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from .models import SpareRoomAd
+
+# Tiny page used to import BeautifulSoup and warm the regex cache in workers
+_WARMUP_HTML = (
+    '<ul><li><a href="/flatshare/flatshare_detail.pl?flatshare_id=1">Warm-up listing title</a>'
+    " £500 pcm Somewhere (AB1) Double room Available Now Min term: 1 month</li></ul>"
+)
+
+
+def parse_ads(html: str) -> List[SpareRoomAd]:
+    """Parse HTML and extract all ads"""
+    soup = BeautifulSoup(html, "html.parser")
+    ads = {}
+
+    # Find all listing items
+    for li in soup.find_all("li"):
+        # Collect all text from the listing
+        raw_text_parts = [el.get_text().strip() for el in li.find_all(string=True) if el.strip()]
+        raw_text = " ".join(raw_text_parts)
+
+        # Look for the main ad link
+        for anchor in li.find_all("a", href=True):
+            href = anchor["href"]
+
+            if "flatshare_detail.pl" in href and "flatshare_id=" in href:
+                match = re.search(r"flatshare_id=(\d+)", href)
+                if match:
+                    ad_id = match.group(1)
+
+                    # Build full URL
+                    if href.startswith("/"):
+                        full_url = f"https://www.spareroom.co.uk{href}"
+                    else:
+                        full_url = href
+
+                    # Extract title
+                    title = anchor.get_text().strip() or "No title found"
+                    if len(title) <= 15:
+                        title = "No title found"
+
+                    ad = SpareRoomAd(
+                        id=ad_id,
+                        url=full_url,
+                        title=title,
+                        price=extract_price(raw_text),
+                        location=extract_location(raw_text),
+                        property_type=extract_property_type(raw_text),
+                        availability=extract_availability(raw_text),
+                        bills_included=extract_bills_included(raw_text),
+                        min_term=extract_min_term(raw_text),
+                        max_term=extract_max_term(raw_text),
+                        raw_text=raw_text,
+                    )
+
+                    ads[ad_id] = ad
+
+    return list(ads.values())
+
+
+def extract_price(text: str) -> Optional[str]:
+    """Extract price from text"""
+    match = re.search(r"£[\d,]+\s*(?:pcm|pw|per month|per week)", text, re.IGNORECASE)
+    return match.group(0) if match else None
+
+
+def extract_location(text: str) -> Optional[str]:
+    """Extract location from text (looks for postcode patterns)"""
+    match = re.search(r"([A-Za-z\s]+)\s*\(([A-Z]{1,2}\d{1,2}[A-Z]?)\)", text)
+    if match:
+        return f"{match.group(1).strip()} ({match.group(2)})"
+    return None
+
+
+def extract_property_type(text: str) -> Optional[str]:
+    """Extract property type from text"""
+    patterns = [
+        r"\d+\s+bed\s+(?:flat|house|apartment)",
+        r"Double\s+room",
+        r"Single\s+room",
+        r"Studio",
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group(0)
+    return None
+
+
+def extract_availability(text: str) -> Optional[str]:
+    """Extract availability date from text"""
+    match = re.search(
+        r"Available\s+(?:Now|(?:\d{1,2}\s+\w+(?:\s+\d{4})?))",
+        text,
+        re.IGNORECASE,
+    )
+    return match.group(0) if match else None
+
+
+def extract_bills_included(text: str) -> bool:
+    """Check if bills are included"""
+    return bool(
+        re.search(r"bills?\s+included", text, re.IGNORECASE)
+        or re.search(r"\(all[- ]in\)", text, re.IGNORECASE)
+    )
+
+
+def extract_min_term(text: str) -> Optional[str]:
+    """Extract minimum rental term"""
+    match = re.search(r"Min(?:imum)?\s+(?:term|let)[:\s]+(\d+)\s+months?", text, re.IGNORECASE)
+    return f"{match.group(1)} months" if match else None
+
+
+def extract_max_term(text: str) -> Optional[str]:
+    """Extract maximum rental term"""
+    match = re.search(r"Max(?:imum)?\s+(?:term|let)[:\s]+(\d+)\s+months?", text, re.IGNORECASE)
+    return f"{match.group(1)} months" if match else None
+
+
+def parse_listings(html: str) -> List[SpareRoomAd]:
+    """Parse a results page into ads sorted newest first
+
+    A plain module-level function so it can be sent to a process pool.
+    """
+    ads = parse_ads(html)
+
+    # Sort by ID (descending) to get newest first
+    ads.sort(key=lambda ad: int(ad.id), reverse=True)
+    return ads
+
+
+def parse_chunk(pages: List[str]) -> List[List[Tuple]]:
+    """Parse several pages in one task, returning compact ad records"""
+    return [[ad.to_record() for ad in parse_listings(html)] for html in pages]
+
+
+def warm_up() -> None:
+    """Process initializer: pay import and regex compilation costs up front"""
+    parse_listings(_WARMUP_HTML)
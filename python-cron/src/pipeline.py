@@ -0,0 +1,189 @@
+"""Staged processing pipeline connected by bounded queues"""
+
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional
+
+from .logger import logger
+
+# Marks the end of the input for one worker of a stage
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Counters for one pipeline stage"""
+    name: str
+    workers: int
+    processed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    blocked_seconds: float = 0.0
+    max_queue_depth: int = 0
+    queue_depth: int = 0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+    @property
+    def wall_seconds(self) -> float:
+        end = self.finished_at or time.monotonic()
+        return max(end - self.started_at, 0.0) if self.started_at else 0.0
+
+    @property
+    def utilisation(self) -> float:
+        """Fraction of the stage's worker time spent working"""
+        capacity = self.wall_seconds * self.workers
+        return self.busy_seconds / capacity if capacity else 0.0
+
+    def to_dict(self) -> dict:
+        """Convert to dictionary for JSON serialization"""
+        wall = self.wall_seconds
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "avg_seconds": round(self.busy_seconds / self.processed, 4) if self.processed else 0.0,
+            "throughput_per_second": round(self.processed / wall, 2) if wall else 0.0,
+            "utilisation": round(self.utilisation, 3),
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+        }
+
+
+class Stage:
+    """One step of the pipeline
+
+    ``func`` receives a job and returns True to hand it to the next stage or
+    False when the job is finished. Every stage has a bounded input queue, so
+    a slow stage makes its producers block (backpressure) instead of letting
+    work pile up in memory.
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], bool], workers: int = 1, queue_size: int = 0):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size or self.workers * 2)
+        self.stats = StageStats(name=name, workers=self.workers)
+        self._lock = threading.Lock()
+        self._remaining = self.workers
+
+    def put(self, item: Any) -> None:
+        """Enqueue an item, recording how long the producer was blocked"""
+        started = time.monotonic()
+        self.queue.put(item)
+        waited = time.monotonic() - started
+
+        depth = self.queue.qsize()
+        with self._lock:
+            self.stats.blocked_seconds += waited
+            self.stats.queue_depth = depth
+            self.stats.max_queue_depth = max(self.stats.max_queue_depth, depth)
+
+    def worker_exited(self) -> bool:
+        """Record a worker exit, returning True for the last one"""
+        with self._lock:
+            self._remaining -= 1
+            return self._remaining == 0
+
+
+class Pipeline:
+    """Runs jobs through a list of stages, each with its own worker threads
+
+    ``on_done`` is called exactly once per job, from whichever stage finished
+    it; ``on_error`` is called first when a stage raised. Both may be called
+    from several threads at once.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        on_done: Callable[[Any], None],
+        on_error: Optional[Callable[[Any, str, Exception], None]] = None,
+    ):
+        if not stages:
+            raise ValueError("a pipeline needs at least one stage")
+        self.stages = stages
+        self.on_done = on_done
+        self.on_error = on_error
+
+    def run(self, jobs: Iterable[Any]) -> None:
+        """Feed ``jobs`` through every stage and wait for them to drain"""
+        threads = []
+        started = time.monotonic()
+        for index, stage in enumerate(self.stages):
+            stage.stats.started_at = started
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(index,),
+                    name=f"pipeline-{stage.name}-{n}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0]
+        for job in jobs:
+            first.put(job)
+        for _ in range(first.workers):
+            first.put(_DONE)
+
+        for thread in threads:
+            thread.join()
+
+    def _work(self, index: int) -> None:
+        stage = self.stages[index]
+        downstream = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            job = stage.queue.get()
+            with stage._lock:
+                stage.stats.queue_depth = stage.queue.qsize()
+
+            if job is _DONE:
+                if stage.worker_exited():
+                    stage.stats.finished_at = time.monotonic()
+                    if downstream:
+                        for _ in range(downstream.workers):
+                            downstream.put(_DONE)
+                return
+
+            started = time.monotonic()
+            try:
+                forward = stage.func(job)
+            except Exception as error:
+                forward = False
+                with stage._lock:
+                    stage.stats.failed += 1
+                if self.on_error:
+                    self.on_error(job, stage.name, error)
+                else:
+                    logger.error(f"❌ Stage {stage.name} failed: {error}")
+            finally:
+                with stage._lock:
+                    stage.stats.processed += 1
+                    stage.stats.busy_seconds += time.monotonic() - started
+
+            if forward and downstream:
+                downstream.put(job)
+            else:
+                self.on_done(job)
+
+    def stats(self) -> dict:
+        """Per-stage statistics keyed by stage name"""
+        return {stage.name: stage.stats.to_dict() for stage in self.stages}
+
+    def log_stats(self) -> None:
+        """Log one line per stage, slowest (most utilised) stage first"""
+        for stage in sorted(self.stages, key=lambda s: s.stats.utilisation, reverse=True):
+            data = stage.stats.to_dict()
+            logger.info(
+                f"   ⏱️  {stage.name:<8} x{data['workers']}: {data['processed']} job(s), "
+                f"avg {data['avg_seconds']:.3f}s, {data['utilisation']:.0%} busy, "
+                f"max queue {data['max_queue_depth']}, blocked {data['blocked_seconds']:.2f}s"
+            )
@@ -0,0 +1,310 @@
+"""Run profiling: CPU profile plus tracemalloc allocation snapshot
+
+Two CPU profilers are available:
+
+- ``sample`` (default) polls every thread's stack every ``interval`` seconds
+  from a background thread. Overhead is a small, fixed cost per sample, so
+  it can stay on for sampled production runs. Times are wall clock, so a
+  worker waiting on the network counts, but idle workers waiting on their
+  queue are left out. Writes collapsed stacks (``<label>.collapsed``) that
+  flame graph tools read directly.
+- ``cprofile`` installs a deterministic ``cProfile`` profiler in every thread
+  started during the run. Exact call counts, noticeably slower. Writes a
+  ``pstats`` dump (``<label>.prof``) for ``snakeviz`` or ``python -m pstats``.
+
+Either way a ``tracemalloc`` snapshot of the run's allocations is written to
+``<label>.tracemalloc`` (load it with ``tracemalloc.Snapshot.load``), and a
+summary of the top functions and allocation sites is logged.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from .config import config
+from .logger import logger
+
+# Leaf functions of a thread that is parked rather than doing work
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+}
+
+# Modules whose frames only show threads being started or parked
+_PLUMBING = {"threading.py", "queue.py"}
+
+Frame = Tuple[str, int, str]
+
+
+def should_profile(rate: Optional[float] = None) -> bool:
+    """Whether this run is one of the sampled ``rate`` fraction to profile"""
+    rate = config.PROFILE_SAMPLE_RATE if rate is None else rate
+    return rate > 0 and random.random() < rate
+
+
+class SamplingProfiler:
+    """Statistical wall-clock profiler over all threads"""
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval or config.PROFILE_INTERVAL
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                if stack and (os.path.basename(stack[0][0]), stack[0][2]) not in _IDLE_LEAVES:
+                    self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def top(self, limit: int) -> List[Tuple[str, float, float]]:
+        """(function, cumulative seconds, own seconds), by cumulative time"""
+        cumulative: Counter = Counter()
+        own: Counter = Counter()
+        for stack, count in self.stacks.items():
+            for frame in set(stack):
+                if not _is_plumbing(frame):
+                    cumulative[frame] += count
+            own[stack[-1]] += count
+
+        return [
+            (_describe(frame), count * self.interval, own[frame] * self.interval)
+            for frame, count in cumulative.most_common(limit)
+        ]
+
+    def dump(self, path: str) -> None:
+        """Write collapsed stacks ("outer;inner count" per line)"""
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(";".join(_describe(frame) for frame in stack) + f" {count}\n")
+
+
+class ThreadedCProfiler:
+    """``cProfile`` in the calling thread and every thread started while active"""
+
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _bootstrap(self, *args) -> None:
+        # Runs as the profile hook on a new thread's first call: replace
+        # ourselves with a real profiler for that thread
+        sys.setprofile(None)
+        self._enable()
+
+    def _enable(self) -> None:
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def start(self) -> None:
+        threading.setprofile(self._bootstrap)
+        self._enable()
+
+    def stop(self) -> None:
+        threading.setprofile(None)
+        # disable() only unhooks the calling thread; the pipeline's worker
+        # threads have exited by now, so their profiles are complete
+        for profile in self.profiles:
+            profile.disable()
+
+    def stats(self) -> Optional[pstats.Stats]:
+        profiles = [p for p in self.profiles if p.getstats()]
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0], stream=io.StringIO())
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def top(self, limit: int) -> List[Tuple[str, float, float]]:
+        """(function, cumulative seconds, own seconds), by cumulative time"""
+        stats = self.stats()
+        if stats is None:
+            return []
+        rows = sorted(
+            (item for item in stats.stats.items() if not _is_plumbing(item[0])),
+            key=lambda item: item[1][3],
+            reverse=True,
+        )
+        return [
+            (_describe((filename, line, name)), cumtime, tottime)
+            for (filename, line, name), (_, _, tottime, cumtime, _) in rows[:limit]
+        ]
+
+    def dump(self, path: str) -> None:
+        stats = self.stats()
+        if stats is not None:
+            stats.dump_stats(path)
+
+
+class RunProfiler:
+    """Profile one run and write the results to ``output_dir``"""
+
+    def __init__(
+        self,
+        label: str,
+        output_dir: Optional[str] = None,
+        mode: Optional[str] = None,
+        top: Optional[int] = None,
+        trace_frames: Optional[int] = None,
+    ):
+        self.label = label
+        self.output_dir = output_dir or config.PROFILE_DIR
+        self.mode = (mode or config.PROFILE_MODE).lower()
+        self.top_count = top or config.PROFILE_TOP
+        self.trace_frames = config.PROFILE_TRACEMALLOC_FRAMES if trace_frames is None else trace_frames
+        self.cpu = ThreadedCProfiler() if self.mode == "cprofile" else SamplingProfiler()
+        self.files: Dict[str, str] = {}
+        self.summary: dict = {}
+        self._started = 0.0
+        self._tracing = False
+
+    def start(self) -> "RunProfiler":
+        if self.trace_frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self._tracing = True
+        self._started = time.perf_counter()
+        self.cpu.start()
+        return self
+
+    def stop(self) -> dict:
+        """Stop profiling, write the files and log a summary; returns the summary"""
+        self.cpu.stop()
+        wall = time.perf_counter() - self._started
+
+        snapshot = None
+        peak = 0
+        if self._tracing:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self._tracing = False
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, self.label)
+        cpu_path = f"{base}.prof" if self.mode == "cprofile" else f"{base}.collapsed"
+        self.cpu.dump(cpu_path)
+        self.files["cpu"] = cpu_path
+
+        allocations = []
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ])
+            snapshot.dump(f"{base}.tracemalloc")
+            self.files["allocations"] = f"{base}.tracemalloc"
+            allocations = [
+                {"site": _describe_site(stat.traceback[0]), "kib": round(stat.size / 1024, 1), "blocks": stat.count}
+                for stat in snapshot.statistics("lineno")[:self.top_count]
+            ]
+
+        self.summary = {
+            "mode": self.mode,
+            "wall_seconds": round(wall, 3),
+            "peak_traced_kib": round(peak / 1024, 1),
+            "functions": [
+                {"function": name, "cumulative_seconds": round(cum, 3), "own_seconds": round(own, 3)}
+                for name, cum, own in self.cpu.top(self.top_count)
+            ],
+            "allocations": allocations,
+            "files": self.files,
+        }
+        self.log_summary()
+        return self.summary
+
+    def log_summary(self) -> None:
+        summary = self.summary
+        logger.info(
+            f"🔬 Profile ({summary['mode']}) of {summary['wall_seconds']:.2f}s run, "
+            f"peak traced memory {summary['peak_traced_kib']:.0f} KiB"
+        )
+        for row in summary["functions"]:
+            logger.info(
+                f"   {row['cumulative_seconds']:8.3f}s cum {row['own_seconds']:8.3f}s own  {row['function']}"
+            )
+        if summary["allocations"]:
+            logger.info("   Top allocation sites:")
+            for row in summary["allocations"]:
+                logger.info(f"   {row['kib']:10.1f} KiB {row['blocks']:7d} blocks  {row['site']}")
+        logger.info(f"   Written to {', '.join(summary['files'].values())}")
+
+
+@contextmanager
+def profile_run(label: str, enabled: bool = True):
+    """Profile the block when ``enabled``; yields the RunProfiler or None"""
+    if not enabled:
+        yield None
+        return
+
+    profiler = RunProfiler(label).start()
+    try:
+        yield profiler
+    finally:
+        try:
+            profiler.stop()
+        except Exception as error:
+            # Never fail a run because its profile could not be written
+            logger.warning(f"⚠️  Failed to write profile {label}: {error}")
+
+
+def _is_plumbing(frame: Frame) -> bool:
+    """Thread start-up and lock/queue waits, left out of the top functions"""
+    filename, _, name = frame
+    if filename == "~":
+        return "acquire" in name
+    return os.path.basename(filename) in _PLUMBING
+
+
+def _describe(frame: Frame) -> str:
+    filename, line, name = frame
+    if filename == "~":
+        # cProfile's entries for built-ins
+        return name
+    return f"{name} ({_short_path(filename)}:{line})"
+
+
+def _describe_site(frame: tracemalloc.Frame) -> str:
+    return f"{_short_path(frame.filename)}:{frame.lineno}"
+
+
+def _short_path(filename: str) -> str:
+    """Path relative to the project or site-packages, for readable summaries"""
+    for marker in ("site-packages" + os.sep, "python-cron" + os.sep):
+        index = filename.rfind(marker)
+        if index != -1:
+            return filename[index + len(marker):]
+    return os.path.basename(filename)
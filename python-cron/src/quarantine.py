@@ -0,0 +1,187 @@
+"""Quarantine with exponential backoff for searches that keep failing
+
+A search URL that is malformed, expired or blocked fails the same way on
+every run, and each attempt costs a fetch, a rate-limiter slot and a log
+line. Failures are classified per URL:
+
+- ``malformed``: the URL cannot be requested at all;
+- ``http_4xx``: SpareRoom answered 4xx (expired or invalid search);
+- ``timeout``: the fetch hit its connect/read timeout or total deadline;
+- ``no_ads``: the page parsed to zero listings.
+
+Other errors (5xx, refused connections) are usually site-wide and are not
+held against a search. After ``QUARANTINE_AFTER`` consecutive classified
+failures (0 turns quarantine off), the search is only retried after
+``QUARANTINE_BASE_INTERVAL`` seconds, doubling with every further failure
+up to ``QUARANTINE_MAX_INTERVAL``. The first success releases it. State
+lives in the ``search_quarantine`` table, so it carries across runs.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .config import config
+from .database import db
+from .models import User, UserJob
+from .logger import logger
+
+# Error categories (see ``runner.error_category``) and what they count as
+_MALFORMED = ("MissingSchema", "InvalidSchema", "InvalidURL", "URLRequired")
+_TIMEOUTS = ("Timeout", "ConnectTimeout", "ReadTimeout", "DeadlineExceeded")
+
+
+def classify(job: UserJob) -> Optional[str]:
+    """Quarantine category of a finished job's failure, "" for a success, None otherwise"""
+    if job.matched or not job.user.spareroom_url:
+        return None
+    category = job.error_category or ""
+    if not category.startswith("fetch:"):
+        if job.error:
+            # Parse, notify and persist errors say nothing about the search
+            return None
+        return "" if job.ads else "no_ads"
+
+    reason = category[len("fetch:"):]
+    if reason.startswith("HTTP 4"):
+        return "http_4xx"
+    if reason in _TIMEOUTS:
+        return "timeout"
+    if reason in _MALFORMED:
+        return "malformed"
+    return None
+
+
+class SearchQuarantine:
+    """Tracks failing searches and decides which ones to skip"""
+
+    def __init__(
+        self,
+        after: Optional[int] = None,
+        base_interval: Optional[float] = None,
+        max_interval: Optional[float] = None,
+        categories: Optional[List[str]] = None,
+    ):
+        self.after = max(1, after or config.QUARANTINE_AFTER)
+        self.base_interval = config.QUARANTINE_BASE_INTERVAL if base_interval is None else base_interval
+        self.max_interval = config.QUARANTINE_MAX_INTERVAL if max_interval is None else max_interval
+        self.categories = set(config.QUARANTINE_CATEGORIES if categories is None else categories)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        # Failures at or after this time were already counted (one per URL per run)
+        self._run_started: Optional[float] = None
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.skipped = self.released = self.quarantined = 0
+
+    def load(self) -> None:
+        """Read the failing searches from the database"""
+        entries = db.get_search_failures()
+        with self._lock:
+            self._entries = entries
+
+    def is_due(self, url: Optional[str], now: Optional[float] = None) -> bool:
+        """Whether a search should be fetched now"""
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None or entry["retry_at"] is None:
+            return True
+        return entry["retry_at"] <= (time.time() if now is None else now)
+
+    def plan(self, users: List[User]) -> Tuple[List[User], List[User]]:
+        """Split a run's users into (to check, skipped while quarantined)"""
+        now = time.time()
+        self._run_started = now
+        due, skipped = [], []
+        for user in users:
+            (due if self.is_due(user.spareroom_url, now) else skipped).append(user)
+        with self._lock:
+            self.skipped += len(skipped)
+        if skipped:
+            logger.info(
+                f"🚧 Skipping {len(skipped)} user(s) on {len({user.spareroom_url for user in skipped})} "
+                f"quarantined search(es)"
+            )
+        return due, skipped
+
+    def interval(self, failures: int) -> float:
+        """Seconds until a search with ``failures`` consecutive failures is retried"""
+        return min(self.base_interval * 2 ** max(failures - self.after, 0), self.max_interval)
+
+    def record(self, job: UserJob) -> None:
+        """Count a finished job's outcome against its search"""
+        outcome = classify(job)
+        if outcome is None:
+            return
+        url = job.user.spareroom_url
+        if outcome == "":
+            self._release(url)
+        elif outcome in self.categories:
+            self._fail(url, outcome, job.error or "no ads on the page")
+
+    def _release(self, url: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is None:
+                return
+            if entry["retry_at"] is not None:
+                self.released += 1
+        db.clear_search_failure(url)
+        if entry["retry_at"] is not None:
+            logger.info(f"✅ Released search from quarantine after {entry['failures']} failure(s): {url}")
+
+    def _fail(self, url: str, category: str, error: str) -> None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry and self._run_started is not None and entry["last_failed_at"] >= self._run_started:
+                # Another user on the same search already failed this run
+                return
+            if entry is None:
+                entry = self._entries[url] = {"url": url, "failures": 0, "first_failed_at": now, "retry_at": None}
+            entry.update(category=category, last_error=error[:500], last_failed_at=now)
+            entry["failures"] += 1
+            newly = entry["failures"] == self.after
+            if entry["failures"] >= self.after:
+                entry["retry_at"] = now + self.interval(entry["failures"])
+            if newly:
+                self.quarantined += 1
+            row = dict(entry)
+        db.record_search_failure(row)
+        if newly:
+            logger.warning(
+                f"🚧 Quarantined search after {row['failures']} {category} failure(s), "
+                f"next try in {self.interval(row['failures']) / 60:.0f} min: {url}"
+            )
+
+    def stats(self, now: Optional[float] = None) -> dict:
+        """Counters for this run and every quarantined search"""
+        now = time.time() if now is None else now
+        with self._lock:
+            searches = sorted(
+                (
+                    {
+                        "url": entry["url"],
+                        "category": entry["category"],
+                        "failures": entry["failures"],
+                        "last_error": entry["last_error"],
+                        "retry_in_seconds": max(round(entry["retry_at"] - now), 0),
+                    }
+                    for entry in self._entries.values()
+                    if entry["retry_at"] is not None
+                ),
+                key=lambda search: search["failures"],
+                reverse=True,
+            )
+            return {
+                "skipped_users": self.skipped,
+                "newly_quarantined": self.quarantined,
+                "released": self.released,
+                "searches": searches,
+            }
+
+
+# Singleton instance (None when QUARANTINE_AFTER is 0)
+quarantine = SearchQuarantine() if config.QUARANTINE_AFTER > 0 else None
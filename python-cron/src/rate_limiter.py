@@ -0,0 +1,46 @@
+"""Shared rate limiter for requests to SpareRoom"""
+
+import threading
+import time
+
+from .config import config
+
+
+class RateLimiter:
+    """Spaces calls at least ``min_interval`` seconds apart across threads
+
+    Each caller reserves the next free slot under a lock and sleeps outside
+    it, so concurrent fetch workers queue up fairly without holding the lock.
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = max(0.0, min_interval)
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self) -> float:
+        """Block until the caller may proceed, returning the seconds waited"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def export_state(self) -> dict:
+        """The next free slot as wall-clock time, for a warm start"""
+        with self._lock:
+            return {"next_slot": time.time() + (self._next_slot - time.monotonic())}
+
+    def import_state(self, state: dict) -> None:
+        """Keep spacing calls from where a previous process left off"""
+        remaining = min(max(state.get("next_slot", 0.0) - time.time(), 0.0), self.min_interval)
+        with self._lock:
+            self._next_slot = max(self._next_slot, time.monotonic() + remaining)
+
+
+# Singleton instance (the old per-user delay now spaces fetches instead)
+rate_limiter = RateLimiter(config.DELAY_BETWEEN_USERS)
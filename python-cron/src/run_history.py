@@ -0,0 +1,172 @@
+"""Run history in the ``cron_runs`` table, and trends over it
+
+Every one-shot run (CLI or serverless) stores its start and end time,
+counts, stage timings, errors by category and its slowest searches. Runs
+skipped because another held the run lock are stored too: they are the
+first sign that runs no longer fit the cron interval.
+
+``python main.py report`` summarises the history: runs and duration
+percentiles per day against ``CRON_INTERVAL``, failure rates by error
+category, and the searches that keep showing up as the slowest.
+"""
+
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .config import config
+from .database import db
+from .models import CronResult
+from .logger import logger
+
+
+def record_run(run_id: str, trigger: str, status: str, started_at: float, result: CronResult) -> None:
+    """Store a finished run; never lets history problems fail the run"""
+    finished_at = time.time()
+    try:
+        db.record_cron_run(
+            {
+                "run_id": run_id,
+                "trigger": trigger,
+                "status": status,
+                "started_at": started_at,
+                "finished_at": finished_at,
+                "duration": finished_at - started_at,
+                "processed": result.processed,
+                "successful": result.successful,
+                "failed": result.failed,
+                "notifications": result.notifications,
+                "stages": result.stats.get("stages"),
+                "errors": result.error_categories,
+                "slowest_searches": result.slowest(),
+            },
+            keep_days=config.RUN_HISTORY_DAYS,
+        )
+    except Exception as error:
+        logger.warning(f"⚠️  Could not record run history: {error}")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (0 for no values)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(q / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def build_report(days: float = 7, top: int = 10, now: Optional[float] = None) -> dict:
+    """Trends over the runs of the last ``days`` days"""
+    now = time.time() if now is None else now
+    runs = db.get_cron_runs(now - days * 86400)
+    ran = [run for run in runs if run["status"] != "skipped"]
+
+    by_day: Dict[str, List[dict]] = defaultdict(list)
+    for run in runs:
+        by_day[datetime.fromtimestamp(run["started_at"]).strftime("%Y-%m-%d")].append(run)
+
+    daily = []
+    for day, day_runs in sorted(by_day.items()):
+        durations = [run["duration"] for run in day_runs if run["status"] != "skipped"]
+        processed = sum(run["processed"] for run in day_runs)
+        daily.append({
+            "day": day,
+            "runs": len(durations),
+            "skipped": sum(1 for run in day_runs if run["status"] == "skipped"),
+            "failed_runs": sum(1 for run in day_runs if run["status"] == "failed"),
+            "max_users": max((run["processed"] for run in day_runs), default=0),
+            "p50_seconds": percentile(durations, 50),
+            "p95_seconds": percentile(durations, 95),
+            "max_seconds": max(durations, default=0.0),
+            "user_failure_rate": sum(run["failed"] for run in day_runs) / processed if processed else 0.0,
+            "seconds_per_user": sum(durations) / processed if processed else 0.0,
+        })
+
+    errors: Dict[str, dict] = {}
+    for run in ran:
+        for category, entry in (run["errors"] or {}).items():
+            total = errors.setdefault(category, {"count": 0, "runs": 0, "sample": None})
+            total["count"] += entry["count"]
+            total["runs"] += 1
+            total["sample"] = total["sample"] or (entry["samples"] or [None])[0]
+
+    searches: Dict[str, List[float]] = defaultdict(list)
+    for run in ran:
+        for search in run["slowest_searches"] or []:
+            searches[search["url"]].append(search["seconds"])
+    slowest = sorted(
+        (
+            {"url": url, "runs": len(times), "avg_seconds": sum(times) / len(times), "max_seconds": max(times)}
+            for url, times in searches.items()
+        ),
+        key=lambda search: (search["avg_seconds"], search["runs"]),
+        reverse=True,
+    )[:top]
+
+    stage_busy: Dict[str, List[float]] = defaultdict(list)
+    for run in ran:
+        for name, stage in (run["stages"] or {}).items():
+            stage_busy[name].append(stage.get("utilisation", 0.0))
+
+    p95 = percentile([run["duration"] for run in ran], 95)
+    return {
+        "days": days,
+        "runs": len(ran),
+        "skipped": len(runs) - len(ran),
+        "failed_runs": sum(1 for run in ran if run["status"] == "failed"),
+        "interval_seconds": config.CRON_INTERVAL,
+        "p95_seconds": p95,
+        "interval_used": p95 / config.CRON_INTERVAL if config.CRON_INTERVAL else 0.0,
+        "daily": daily,
+        "errors": dict(sorted(errors.items(), key=lambda item: item[1]["count"], reverse=True)),
+        "slowest_searches": slowest,
+        "stage_utilisation": {name: sum(values) / len(values) for name, values in stage_busy.items()},
+    }
+
+
+def format_report(report: dict) -> str:
+    """Plain-text rendering of ``build_report`` for the terminal"""
+    lines = [
+        f"📈 Last {report['days']:g} day(s): {report['runs']} run(s), "
+        f"{report['failed_runs']} failed, {report['skipped']} skipped (lock held)"
+    ]
+    if not report["runs"] and not report["skipped"]:
+        lines.append("No runs recorded yet.")
+        return "\n".join(lines)
+
+    used = report["interval_used"]
+    marker = "⚠️ " if used > 0.8 or report["skipped"] else "✅"
+    lines.append(
+        f"{marker} p95 run duration {report['p95_seconds']:.1f}s = {used:.0%} of the "
+        f"{report['interval_seconds']:.0f}s cron interval"
+    )
+
+    lines += ["", f"{'day':<11} {'runs':>5} {'skip':>5} {'users':>6} {'p50':>7} {'p95':>7} {'max':>7} {'s/user':>7} {'failed':>7}"]
+    for day in report["daily"]:
+        lines.append(
+            f"{day['day']:<11} {day['runs']:>5} {day['skipped']:>5} {day['max_users']:>6} "
+            f"{day['p50_seconds']:>6.1f}s {day['p95_seconds']:>6.1f}s {day['max_seconds']:>6.1f}s "
+            f"{day['seconds_per_user']:>7.2f} {day['user_failure_rate']:>7.1%}"
+        )
+
+    if report["stage_utilisation"]:
+        busiest = sorted(report["stage_utilisation"].items(), key=lambda item: item[1], reverse=True)
+        lines += ["", "Stage utilisation: " + ", ".join(f"{name} {busy:.0%}" for name, busy in busiest)]
+
+    if report["errors"]:
+        lines += ["", "Errors by category:"]
+        for category, entry in report["errors"].items():
+            share = entry["runs"] / report["runs"] if report["runs"] else 0.0
+            lines.append(f"  {category:<24} {entry['count']:>6} in {entry['runs']} run(s) ({share:.0%} of runs)")
+            if entry["sample"]:
+                lines.append(f"    e.g. {entry['sample'][:120]}")
+
+    if report["slowest_searches"]:
+        lines += ["", "Slowest searches:", f"  {'avg':>7} {'max':>7} {'runs':>5}  url"]
+        for search in report["slowest_searches"]:
+            lines.append(
+                f"  {search['avg_seconds']:>6.2f}s {search['max_seconds']:>6.2f}s {search['runs']:>5}  {search['url']}"
+            )
+
+    return "\n".join(lines)
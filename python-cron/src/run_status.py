@@ -0,0 +1,207 @@
+"""Run IDs, the run queue, live progress and the run lock for cron runs
+
+Each run gets an ID and a status row in the ``cron_run_status`` table that
+is rewritten as users finish, so a status request can report progress
+while the run is still going, whichever instance serves it. A run can also
+be queued (a row in the ``queued`` state) for the next worker to claim;
+at most one run is queued at a time. The run lock (a ``cron_locks`` row)
+expires ``RUN_LOCK_TTL`` seconds after it was taken or last renewed; a
+tracker holding the lock renews it as progress comes in, so a long run
+keeps it while a crashed one loses it.
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from .config import config
+from .database import db
+from .models import CronResult
+from .logger import logger
+
+LOCK_NAME = "cron-run"
+KEEP_RUNS = 50
+
+
+class RunLockHeld(Exception):
+    """Another run holds the run lock"""
+
+    def __init__(self, owner: str):
+        super().__init__(f"Run {owner} is already in progress")
+        self.owner = owner
+
+
+def new_run_id() -> str:
+    """Sortable, unique run ID"""
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def acquire_run_lock(run_id: str) -> None:
+    """Take the run lock for ``run_id`` or raise RunLockHeld"""
+    owner = db.acquire_lock(LOCK_NAME, run_id, config.RUN_LOCK_TTL)
+    if owner is not None:
+        raise RunLockHeld(owner)
+
+
+def renew_run_lock(run_id: str) -> bool:
+    """Extend the run lock held by ``run_id``; False if it has been lost"""
+    return db.renew_lock(LOCK_NAME, run_id, config.RUN_LOCK_TTL)
+
+
+def release_run_lock(run_id: str) -> None:
+    """Release the run lock held by ``run_id``"""
+    try:
+        db.release_lock(LOCK_NAME, run_id)
+    except Exception as error:
+        # An unreleased lock expires after RUN_LOCK_TTL anyway
+        logger.warning(f"⚠️  Failed to release run lock for {run_id}: {error}")
+
+
+def queue_run() -> str:
+    """Queue a run for the next worker and return its ID
+
+    While a run is already queued its ID is returned instead, so triggers
+    arriving before a worker gets to it share one run.
+    """
+    run_id = new_run_id()
+    return db.queue_run(run_id, _initial_status(run_id))
+
+
+def claim_run() -> "RunTracker":
+    """Take the run lock for the oldest queued run, or for a new run if none
+    is queued, and return its tracker; raise RunLockHeld if another run
+    holds the lock. The caller releases the lock when the run is over."""
+    while True:
+        queued = db.get_queued_run_id()
+        run_id = queued or new_run_id()
+        acquire_run_lock(run_id)
+        status = load_status(run_id) if queued else None
+        if queued is None or (status is not None and status["state"] == "queued"):
+            break
+        # Another worker ran it between the two reads
+        release_run_lock(run_id)
+    return RunTracker(run_id, holds_lock=True, queued_at=status["queued_at"] if status else None)
+
+
+def _initial_status(run_id: str, queued_at: Optional[str] = None) -> dict:
+    return {
+        "run_id": run_id,
+        "state": "queued",
+        "queued_at": queued_at or datetime.now().isoformat(),
+        "started_at": None,
+        "finished_at": None,
+        "users_total": None,
+        "users_done": 0,
+        "notifications": 0,
+        "failed": 0,
+        "stages": {},
+    }
+
+
+class RunTracker:
+    """Writes a run's state and progress to the database
+
+    With ``holds_lock``, the run lock taken for ``run_id`` is renewed at
+    least every third of ``RUN_LOCK_TTL`` while progress keeps coming.
+    """
+
+    def __init__(
+        self,
+        run_id: Optional[str] = None,
+        interval: float = 0.5,
+        holds_lock: bool = False,
+        queued_at: Optional[str] = None,
+    ):
+        self.run_id = run_id or new_run_id()
+        self.interval = interval
+        self.holds_lock = holds_lock
+        self.renew_every = config.RUN_LOCK_TTL / 3
+        self.lock_lost = False
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self._last_renewal = time.monotonic()
+        self.status = _initial_status(self.run_id, queued_at)
+        self._write()
+
+    def start(self, users_total: int) -> None:
+        """Mark the run as started with ``users_total`` users to check"""
+        with self._lock:
+            self.status.update(
+                state="running", started_at=datetime.now().isoformat(), users_total=users_total
+            )
+            self._write()
+
+    def update(self, result: CronResult, stages: Optional[dict] = None, force: bool = False) -> None:
+        """Record progress, writing at most once per ``interval`` unless forced"""
+        with self._lock:
+            self.status.update(
+                users_done=result.processed, notifications=result.notifications, failed=result.failed
+            )
+            if stages is not None:
+                self.status["stages"] = stages
+
+            now = time.monotonic()
+            if force or now - self._last_write >= self.interval:
+                self._write()
+            if self.holds_lock and not self.lock_lost and now - self._last_renewal >= self.renew_every:
+                self._renew(now)
+
+    def finish(self, result: CronResult) -> None:
+        """Mark the run as completed with its final result"""
+        self.update(result, result.stats.get("stages"))
+        with self._lock:
+            self.status.update(
+                state="completed", finished_at=datetime.now().isoformat(), result=result.to_dict()
+            )
+            if self.status["started_at"] is None:
+                # Nothing to process: the run never got going
+                self.status.update(started_at=self.status["finished_at"], users_total=0)
+            self._write()
+        self.prune()
+
+    def fail(self, error: Exception) -> None:
+        """Mark the run as failed"""
+        with self._lock:
+            self.status.update(state="failed", finished_at=datetime.now().isoformat(), error=str(error))
+            self._write()
+        self.prune()
+
+    def _write(self) -> None:
+        self._last_write = time.monotonic()
+        try:
+            db.save_run_status(self.run_id, self.status)
+        except Exception as error:
+            logger.warning(f"⚠️  Failed to write run status for {self.run_id}: {error}")
+
+    def _renew(self, now: float) -> None:
+        self._last_renewal = now
+        try:
+            held = renew_run_lock(self.run_id)
+        except Exception as error:
+            # Try again on the next update; the lock is still good until its TTL
+            logger.warning(f"⚠️  Failed to renew run lock for {self.run_id}: {error}")
+            return
+        if not held:
+            self.lock_lost = True
+            logger.error(
+                f"❌ Run {self.run_id} lost the run lock (no progress for {config.RUN_LOCK_TTL:.0f}s); "
+                "another run may now overlap it"
+            )
+
+    def prune(self, keep: int = KEEP_RUNS) -> None:
+        """Forget the status of all but the ``keep`` most recent runs"""
+        try:
+            db.prune_run_status(keep)
+        except Exception as error:
+            logger.debug(f"Failed to prune run status: {error}")
+
+
+def load_status(run_id: Optional[str] = None) -> Optional[dict]:
+    """Status of ``run_id`` (or the latest run), or None if unknown"""
+    try:
+        return db.get_run_status(run_id)
+    except Exception as error:
+        logger.warning(f"⚠️  Failed to read run status: {error}")
+        return None
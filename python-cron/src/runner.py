@@ -0,0 +1,443 @@
+"""Shared cron run logic used by the CLI, the daemon and the serverless handler
+
+A user's check is split into stages (fetch → parse → diff → notify →
+persist). ``process_user`` runs them inline for one user; ``execute_run``
+runs every active user through a ``Pipeline`` so a slow stage for one user
+does not stall the others.
+"""
+
+import threading
+import time
+from datetime import datetime
+from itertools import chain
+from typing import Callable, List, Optional
+
+from .area_feed import AreaFeeds
+from .coalescer import coalescer
+from .config import config
+from .database import db
+from .scraper import scraper, parse_listings, get_new_ads
+from .seen_ads import SeenSet
+from .enrichment import enricher
+from .keyword_filter import keyword_index
+from .listings_store import listings_store
+from .models import CronResult, User, UserJob
+from .notifiers import dispatcher
+from .parse_cache import parse_cache
+from .parse_pool import ParsePool
+from .pipeline import Pipeline, Stage
+from .profiling import profile_run
+from .quarantine import quarantine
+from .rate_limiter import rate_limiter
+from .run_history import record_run
+from .run_status import RunLockHeld, RunTracker, claim_run, new_run_id, release_run_lock
+from .user_sync import UserSync
+from . import warm_start
+from .logger import logger, search_key
+
+
+def log_fields(job: UserJob, stage: str, duration: Optional[float] = None) -> Optional[dict]:
+    """Structured fields of a per-user log line, only built for LOG_FORMAT=json"""
+    if config.LOG_FORMAT != "json":
+        return None
+    return {"user_id": job.user.id, "search": search_key(job.user.spareroom_url), "stage": stage, "duration": duration}
+
+
+def fetch_stage(job: UserJob) -> bool:
+    """Download the user's search results page"""
+    user = job.user
+    if job.matched:
+        # Ads were already matched from an area feed
+        return True
+
+    # Skip users without a Spareroom URL
+    if not user.spareroom_url:
+        logger.warning("⚠️  User %s has no Spareroom URL, skipping", user.email, extra=log_fields(job, "fetch"))
+        job.fail("No Spareroom URL", "no_url")
+        return False
+
+    # Space out requests to avoid rate limiting
+    rate_limiter.wait()
+    started = time.monotonic()
+    job.html = scraper.fetch_html(user.spareroom_url)
+    job.fetch_seconds = time.monotonic() - started
+
+    logger.info("🔍 Checked listings for %s", user.email, extra=log_fields(job, "fetch", job.fetch_seconds))
+    return True
+
+
+def make_parse_stage(parse_pool: Optional[ParsePool] = None) -> Callable[[UserJob], bool]:
+    """Build the parse stage, optionally offloading parsing to a process pool"""
+
+    def parse_stage(job: UserJob) -> bool:
+        """Extract ads from the fetched page, reusing cached results for identical pages"""
+        if job.matched:
+            return True
+
+        started = time.monotonic()
+        html, job.html = job.html, None
+        ads = parse_cache.get(html) if parse_cache else None
+
+        if ads is None:
+            ads = parse_pool.parse(html) if parse_pool is not None else parse_listings(html)
+            if parse_cache:
+                parse_cache.put(html, ads)
+
+        job.ads = ads
+
+        fields = log_fields(job, "parse", time.monotonic() - started)
+        logger.info("   Found %d total ads for %s", len(job.ads), job.user.email, extra=fields)
+
+        if len(job.ads) == 0:
+            logger.info("   No ads found for %s", job.user.email, extra=fields)
+            return False
+        return True
+
+    return parse_stage
+
+
+def diff_stage(job: UserJob) -> bool:
+    """Find the ads the user has not seen, checking the whole page at once"""
+    if listings_store:
+        listings_store.observe(job.ads)
+
+    stored = db.get_seen_ads(job.user.id, search_key(job.user.spareroom_url))
+    if stored is None:
+        # No seen-ad set for this search yet: judge the page by the watermark, then start one
+        job.new_ads = get_new_ads(job.ads, job.user.last_checked_ad_id)
+        seen = SeenSet()
+    else:
+        seen = SeenSet.decode(stored)
+        job.new_ads = seen.new_ads(job.ads)
+
+    if seen.add(int(ad.id) for ad in job.ads):
+        job.seen_ads = seen.encode()
+
+    if keyword_index:
+        keyword_index.observe(job.ads)
+        if job.new_ads and job.user.keyword_filters:
+            # Filtered-out ads still count as seen, so they are not checked again
+            kept = keyword_index.filter(job.user, job.new_ads)
+            if len(kept) < len(job.new_ads):
+                logger.info(
+                    "   🔎 Keyword filters left out %d of %d new ad(s) for %s",
+                    len(job.new_ads) - len(kept), len(job.new_ads), job.user.email, extra=log_fields(job, "diff"),
+                )
+            job.new_ads = kept
+
+    if len(job.new_ads) == 0:
+        logger.info("   No new ads for %s", job.user.email, extra=log_fields(job, "diff"))
+    else:
+        logger.info("   🆕 %d new ad(s) for %s", len(job.new_ads), job.user.email, extra=log_fields(job, "diff"))
+    return True
+
+
+def newest_ad_id(job: UserJob) -> Optional[str]:
+    """Highest ad ID seen so far, kept in ``last_checked_ad_id`` for the web app"""
+    candidates = [int(ad.id) for ad in job.ads]
+    for ad_id in (job.newest_ad_id, job.user.last_checked_ad_id):
+        if ad_id:
+            candidates.append(int(ad_id))
+    return str(max(candidates)) if candidates else None
+
+
+def notify_stage(job: UserJob) -> bool:
+    """Queue new ads for the user and dispatch them if their digest is due
+
+    Delivery runs in the background, so a slow channel never holds up the
+    pipeline; failed deliveries stay queued and are reported at the end.
+    """
+    user = job.user
+    if job.new_ads:
+        # Queued together with marking them seen, so nothing is lost or repeated
+        coalescer.queue(user, job.new_ads, newest_ad_id(job), job.seen_ads)
+        job.seen_ads = None
+
+    try:
+        sent = coalescer.flush(user)
+    except Exception as notify_error:
+        logger.error("   ❌ Failed to notify %s: %s", user.email, notify_error, extra=log_fields(job, "notify"))
+        job.fail("Notification failed", "notify")
+        # The ads stay queued and are retried on the next run
+        logger.warning("   ⚠️  Keeping %s's ads queued for retry", user.email, extra=log_fields(job, "notify"))
+        return False
+
+    if sent:
+        job.notified = True
+    elif job.new_ads:
+        logger.info("   📥 Queued %d ad(s) for %s's digest", len(job.new_ads), user.email, extra=log_fields(job, "notify"))
+    return True
+
+
+def persist_stage(job: UserJob) -> bool:
+    """Store the user's seen-ad set and watermark if this check changed them"""
+    newest = newest_ad_id(job)
+    if newest is None or (newest == job.user.last_checked_ad_id and job.seen_ads is None):
+        # Nothing seen, or already stored when new ads were queued
+        return False
+
+    db.update_last_checked_ad_id(job.user.id, newest, job.seen_ads, search_key(job.user.spareroom_url))
+    job.user.last_checked_ad_id = newest
+    job.seen_ads = None
+    logger.info("   Updated seen ads (newest %s) for %s", newest, job.user.email, extra=log_fields(job, "persist"))
+    return False
+
+
+def error_category(stage: str, error: Exception) -> str:
+    """Short grouping key for an error, e.g. ``fetch:HTTP 403`` or ``parse:ValueError``"""
+    stage = stage.removesuffix("_stage")
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "status_code", None):
+        return f"{stage}:HTTP {response.status_code}"
+    return f"{stage}:{type(error).__name__}"
+
+
+def record_error(job: UserJob, stage: str, error: Exception) -> None:
+    """Turn an unexpected stage exception into a failed job"""
+    logger.error("❌ Error processing user %s (%s): %s", job.user.email, stage, error, extra=log_fields(job, stage.removesuffix("_stage")))
+    job.fail(str(error), error_category(stage, error))
+
+
+def finish_job(job: UserJob, result: CronResult) -> None:
+    """Account a finished job in the run result"""
+    result.processed += 1
+    if job.fetch_seconds is not None:
+        result.record_search(job.user.spareroom_url, job.fetch_seconds)
+
+    if job.error:
+        result.failed += 1
+        result.add_error(job.error_category or "error", f"{job.user.email}: {job.error}")
+    else:
+        result.successful += 1
+    result.outcomes[job.user.id] = not job.error
+
+    if quarantine:
+        try:
+            quarantine.record(job)
+        except Exception as error:
+            logger.warning("⚠️  Could not update quarantine for %s: %s", job.user.spareroom_url, error)
+
+
+def process_user(user: User, result: CronResult) -> None:
+    """Process a single user's subscription, running every stage inline"""
+    job = UserJob(user=user)
+    stages = [fetch_stage, make_parse_stage(), diff_stage, notify_stage, persist_stage]
+
+    for stage in stages:
+        try:
+            if not stage(job):
+                break
+        except Exception as error:
+            record_error(job, stage.__name__, error)
+            break
+
+    finish_job(job, result)
+
+
+def build_pipeline(
+    result: CronResult,
+    parse_pool: Optional[ParsePool] = None,
+    on_progress: Optional[Callable[[], None]] = None,
+) -> Pipeline:
+    """Wire the stages together with the configured worker counts"""
+    lock = threading.Lock()
+
+    def on_done(job: UserJob) -> None:
+        with lock:
+            finish_job(job, result)
+        if on_progress is not None:
+            on_progress()
+
+    size = config.PIPELINE_QUEUE_SIZE
+    return Pipeline(
+        [
+            Stage("fetch", fetch_stage, config.PIPELINE_FETCH_WORKERS, size),
+            Stage("parse", make_parse_stage(parse_pool), config.PIPELINE_PARSE_WORKERS, size),
+            Stage("diff", diff_stage, 1, size),
+            Stage("notify", notify_stage, config.PIPELINE_NOTIFY_WORKERS, size),
+            # SQLite writes are serialised anyway, so one persist worker
+            Stage("persist", persist_stage, 1, size),
+        ],
+        on_done=on_done,
+        on_error=record_error,
+    )
+
+
+def log_summary(result: CronResult) -> None:
+    """Log the counters of a finished run"""
+    logger.info(f"   Processed: {result.processed}")
+    logger.info(f"   Successful: {result.successful}")
+    logger.info(f"   Failed: {result.failed}")
+    logger.info(f"   Notifications sent: {result.notifications}")
+
+
+def execute_run(result: CronResult, tracker: Optional[RunTracker] = None) -> None:
+    """Process every active subscriber into ``result``, raising on fatal errors
+
+    When a ``tracker`` is given, progress and stage timings are written to
+    the run's status row as users finish (renewing the run lock it holds).
+    """
+    # Validate configuration
+    config.validate()
+
+    # Get all active subscribers, incrementally when a snapshot is kept
+    user_sync = UserSync() if config.USER_SNAPSHOT_PATH or config.WARM_START else None
+    if config.WARM_START:
+        result.stats["warm_start"] = warm_start.restore(user_sync)
+    if user_sync:
+        user_sync.sync()
+        active_users: List[User] = user_sync.active_users()
+    else:
+        active_users = db.get_active_users()
+
+    if len(active_users) == 0:
+        logger.info("No active users to process")
+        return
+
+    # Searches that keep failing are only retried once their backoff has passed
+    if quarantine:
+        quarantine.reset_stats()
+        quarantine.load()
+        active_users, _ = quarantine.plan(active_users)
+
+    if tracker:
+        tracker.start(len(active_users))
+
+    scraper.transport.reset_stats()
+    if parse_cache:
+        parse_cache.reset_stats()
+    if enricher:
+        enricher.reset_stats()
+    if keyword_index:
+        keyword_index.start(active_users)
+    dispatcher.reset_stats()
+    delivered = coalescer.delivered
+
+    # Users matched from area feeds skip their own fetch
+    area_feeds = AreaFeeds() if config.AREA_FEEDS else None
+    matched_jobs: List[UserJob] = []
+    if area_feeds:
+        matched_jobs, active_users = area_feeds.plan(active_users)
+    parse_pool = ParsePool().start() if config.PARSE_EXECUTOR == "process" else None
+
+    try:
+        progress = (lambda: tracker.update(result, pipeline.stats())) if tracker else None
+        pipeline = build_pipeline(result, parse_pool, progress)
+        pipeline.run(chain(matched_jobs, (UserJob(user=user) for user in active_users)))
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
+
+    # Digests that came due for users with nothing new this run
+    coalescer.flush_due()
+
+    # Deliveries still in flight; anything unfinished stays queued for the next run
+    if not coalescer.drain(config.NOTIFY_DRAIN_TIMEOUT):
+        logger.warning(f"⚠️  Notifications still in flight after {config.NOTIFY_DRAIN_TIMEOUT:.0f}s")
+    result.notifications = coalescer.delivered - delivered
+    # Failed deliveries fail their user, as when emails were sent inline
+    for user_id, category, message in coalescer.take_failures():
+        result.add_error(category, message)
+        result.fail_user(user_id)
+
+    result.stats["stages"] = pipeline.stats()
+    result.stats["transport"] = scraper.transport.stats()
+    result.stats["notifiers"] = dispatcher.stats()
+    if area_feeds:
+        result.stats["area_feeds"] = area_feeds.stats
+    if enricher:
+        result.stats["enrichment"] = enricher.stats()
+    if parse_cache:
+        result.stats["parse_cache"] = parse_cache.stats()
+    if listings_store:
+        result.stats["listings_stored"] = listings_store.flush()
+    if keyword_index and keyword_index.active:
+        result.stats["keyword_filters"] = keyword_index.finish()
+    if quarantine:
+        result.stats["quarantine"] = quarantine.stats()
+
+    if user_sync:
+        # Persist the watermarks advanced by this run
+        user_sync.save()
+    if config.WARM_START:
+        warm_start.save(user_sync)
+
+    logger.info("✅ Cron job completed")
+    log_summary(result)
+    pipeline.log_stats()
+    dispatcher.log_stats()
+    transport = result.stats["transport"]
+    logger.info(
+        f"   🌐 {transport['requests']} fetch(es), {transport['wire_bytes'] / 1024:.0f} KiB on the wire "
+        f"({transport['body_bytes'] / 1024:.0f} KiB decoded), p95 {transport['p95_seconds']:.2f}s, "
+        f"{transport['hedges']} hedge(s) ({transport['hedges_skipped']} skipped), "
+        f"{transport['not_modified']} unchanged (304)"
+    )
+    if parse_cache:
+        cache = result.stats["parse_cache"]
+        logger.info(
+            f"   🗃️  Parse cache: {cache['hits']} hit(s), {cache['misses']} miss(es), "
+            f"{cache['evictions']} eviction(s), {cache['bytes'] / 1024:.0f} KiB"
+        )
+    if quarantine:
+        held = result.stats["quarantine"]
+        logger.info(
+            f"   🚧 Quarantine: {len(held['searches'])} search(es) held, {held['skipped_users']} user(s) skipped, "
+            f"{held['newly_quarantined']} new, {held['released']} released"
+        )
+    if "keyword_filters" in result.stats:
+        keywords = result.stats["keyword_filters"]
+        logger.info(
+            f"   🔎 Keyword filters: {keywords['filtered_out']} ad(s) left out for {keywords['filtered_users']} user(s) "
+            f"in {keywords['filter_ms']:.1f} ms ({keywords['phrase_lookups']} phrase lookup(s), "
+            f"{keywords['indexed']} ad(s) indexed)"
+        )
+    if listings_store:
+        logger.info(f"   🏠 Stored {result.stats['listings_stored']} listing(s) in {listings_store.path}")
+    if enricher:
+        enrichment = result.stats["enrichment"]
+        logger.info(
+            f"   🔎 Detail pages: {enrichment['fetches']} fetched, {enrichment['hits']} cached, "
+            f"{enrichment['shared']} shared, {enrichment['failures']} failed"
+        )
+
+
+def run_cron_job(profile: bool = False) -> CronResult:
+    """Main cron job execution, optionally profiled"""
+    logger.info(f"🔄 Cron job started at {datetime.now().isoformat()}")
+
+    result = CronResult()
+    run_id = new_run_id()
+    started_at = time.time()
+    status = "completed"
+    tracker: Optional[RunTracker] = None
+
+    try:
+        # Run the queued run if there is one, and never overlap another run
+        tracker = claim_run()
+        run_id = tracker.run_id
+        try:
+            with profile_run(run_id, enabled=profile) as profiler:
+                execute_run(result, tracker)
+            if profiler:
+                result.stats["profile"] = profiler.summary
+            tracker.finish(result)
+        finally:
+            release_run_lock(run_id)
+        return result
+
+    except RunLockHeld as held:
+        logger.warning(f"⏭️  Skipping: {held}")
+        status = "skipped"
+        return result
+
+    except Exception as error:
+        logger.error(f"❌ Cron job failed: {error}")
+        if tracker:
+            tracker.fail(error)
+        result.add_error("fatal", f"Fatal error: {str(error)}")
+        status = "failed"
+        return result
+
+    finally:
+        record_run(run_id, "cli", status, started_at, result)
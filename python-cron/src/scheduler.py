@@ -0,0 +1,77 @@
+"""In-process timer wheel for scheduling recurring searches"""
+
+import math
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class TimerWheel:
+    """Hashed timer wheel
+
+    Timers are bucketed into ``slots`` buckets of ``tick`` seconds each, so
+    scheduling, cancelling and advancing are O(1) per timer regardless of how
+    many searches are scheduled. Timers further out than one revolution keep
+    a round counter and are skipped until it reaches zero.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512, now: Optional[float] = None):
+        if tick <= 0:
+            raise ValueError("tick must be positive")
+        self.tick = tick
+        self.slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        self._cursor = 0
+        self._last_tick = time.monotonic() if now is None else now
+        self._slot_of: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot_of
+
+    def schedule(self, key: Hashable, delay: float) -> None:
+        """Schedule ``key`` to fire after ``delay`` seconds, replacing any existing timer"""
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self._cursor + ticks) % len(self.slots)
+        rounds = (ticks - 1) // len(self.slots)
+        self.slots[slot][key] = rounds
+        self._slot_of[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        """Remove a pending timer, returning whether one existed"""
+        slot = self._slot_of.pop(key, None)
+        if slot is None:
+            return False
+        self.slots[slot].pop(key, None)
+        return True
+
+    def advance(self, now: Optional[float] = None) -> List[Hashable]:
+        """Move the wheel forward to ``now`` and return the keys that fired"""
+        now = time.monotonic() if now is None else now
+        fired = []
+
+        while now - self._last_tick >= self.tick:
+            self._last_tick += self.tick
+            self._cursor = (self._cursor + 1) % len(self.slots)
+            bucket = self.slots[self._cursor]
+
+            for key, rounds in list(bucket.items()):
+                if rounds > 0:
+                    bucket[key] = rounds - 1
+                else:
+                    del bucket[key]
+                    del self._slot_of[key]
+                    fired.append(key)
+
+        return fired
+
+    def pending(self) -> List[Tuple[Hashable, float]]:
+        """Return ``(key, seconds_until_due)`` for every pending timer"""
+        size = len(self.slots)
+        result = []
+        for key, slot in self._slot_of.items():
+            rounds = self.slots[slot][key]
+            ticks = (slot - self._cursor) % size or size
+            result.append((key, (ticks + rounds * size) * self.tick))
+        return result
@@ -0,0 +1,126 @@
+"""Per-user set of ad IDs already seen, replacing the single-ID watermark
+
+The watermark assumed IDs only grow: a bumped or re-listed ad with a lower
+ID was never reported, and ads above it that had already been emailed by a
+partly failed run were reported again. A ``SeenSet`` instead remembers the
+newest ``SEEN_ADS_WINDOW`` IDs a user's search has shown. An ad is new when
+its ID is not in the set and is above the set's floor, the highest ID that
+has rolled out of the window, so storage stays bounded however busy the
+search is.
+
+Stored form (the ``seen_ads`` table, one row per user)::
+
+    format byte | varint floor | varint count | varint deltas of the sorted IDs
+
+Consecutive IDs on a results page are close together, so most deltas fit
+in one or two bytes: a full window of 1000 IDs takes a couple of KB.
+"""
+
+from array import array
+from bisect import bisect_left
+from typing import Iterable, List, Optional, Tuple
+
+from .config import config
+from .models import SpareRoomAd
+
+FORMAT = 1
+
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class SeenSet:
+    """Sorted window of the highest ad IDs a user has seen"""
+
+    def __init__(self, ids: Iterable[int] = (), floor: int = 0, capacity: Optional[int] = None):
+        self.capacity = max(1, capacity or config.SEEN_ADS_WINDOW)
+        self.floor = floor
+        self._ids = array("q", sorted(set(ad_id for ad_id in ids if ad_id > floor)))
+        self._trim()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, ad_id: int) -> bool:
+        index = bisect_left(self._ids, ad_id)
+        return index < len(self._ids) and self._ids[index] == ad_id
+
+    def unseen(self, ids: Iterable[int]) -> List[int]:
+        """The IDs in ``ids`` (e.g. one results page) not seen before, in one pass
+
+        The page's IDs are sorted and each lookup resumes where the last
+        one stopped, so a page costs one walk over the window at most.
+        """
+        found = []
+        lo = 0
+        for ad_id in sorted(set(ids)):
+            if ad_id <= self.floor:
+                continue
+            lo = bisect_left(self._ids, ad_id, lo)
+            if lo == len(self._ids) or self._ids[lo] != ad_id:
+                found.append(ad_id)
+        return found
+
+    def new_ads(self, ads: List[SpareRoomAd]) -> List[SpareRoomAd]:
+        """The ads not seen before, in page order"""
+        unseen = set(self.unseen(int(ad.id) for ad in ads))
+        return [ad for ad in ads if int(ad.id) in unseen]
+
+    def add(self, ids: Iterable[int]) -> bool:
+        """Mark ``ids`` as seen; returns whether the set changed"""
+        fresh = self.unseen(ids)
+        if not fresh:
+            return False
+        self._ids = array("q", sorted(self._ids.tolist() + fresh))
+        self._trim()
+        return True
+
+    def _trim(self) -> None:
+        excess = len(self._ids) - self.capacity
+        if excess > 0:
+            # The oldest IDs roll out; anything at or below them counts as seen
+            self.floor = self._ids[excess - 1]
+            self._ids = self._ids[excess:]
+
+    def encode(self) -> bytes:
+        out = bytearray([FORMAT])
+        _put_varint(out, self.floor)
+        _put_varint(out, len(self._ids))
+        previous = self.floor
+        for ad_id in self._ids:
+            _put_varint(out, ad_id - previous)
+            previous = ad_id
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data: bytes, capacity: Optional[int] = None) -> "SeenSet":
+        if not data or data[0] != FORMAT:
+            raise ValueError("unknown seen-set format")
+        floor, pos = _get_varint(data, 1)
+        count, pos = _get_varint(data, pos)
+        ids = array("q")
+        previous = floor
+        for _ in range(count):
+            delta, pos = _get_varint(data, pos)
+            previous += delta
+            ids.append(previous)
+
+        seen = cls(capacity=capacity, floor=floor)
+        seen._ids = ids
+        seen._trim()
+        return seen
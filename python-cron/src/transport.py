@@ -0,0 +1,441 @@
+"""HTTP transport for SpareRoom fetches: pooled, compressed, deadline-bound and hedged"""
+
+import base64
+import socket
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.request import ACCEPT_ENCODING
+
+from .config import config
+from .logger import logger
+
+
+class DeadlineExceeded(requests.Timeout):
+    """The whole fetch took longer than the total deadline"""
+
+
+class _Cancelled(requests.RequestException):
+    """A hedged attempt lost the race and was abandoned"""
+
+
+# The attempt being made by each fetching thread, for the pools below
+_current = threading.local()
+
+
+class _Attempt:
+    """One fetch attempt, which another thread can abort at any stage
+
+    The connection pool hands the attempt every connection it checks out
+    (and again once a new one has connected), so aborting shuts that socket
+    down whether the request is waiting for headers or streaming the body.
+    """
+
+    def __init__(self):
+        self.expired = False
+        self.cancelled = False
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def attach(self, connection) -> None:
+        with self._lock:
+            self._connection = connection
+            aborted = self.expired or self.cancelled
+        if aborted:
+            _shutdown(connection)
+
+    def detach(self) -> None:
+        """The attempt is over: its connection may go back to the pool"""
+        with self._lock:
+            self._connection = None
+
+    def abort(self, expired: bool = False) -> None:
+        with self._lock:
+            if expired:
+                self.expired = True
+            else:
+                self.cancelled = True
+            connection = self._connection
+        _shutdown(connection)
+
+
+def _attach(connection) -> None:
+    attempt = getattr(_current, "attempt", None)
+    if attempt is not None:
+        attempt.attach(connection)
+
+
+class _TrackedConnection:
+    def connect(self):
+        super().connect()
+        _attach(self)
+
+
+class _TrackedHTTPConnection(_TrackedConnection, HTTPConnection):
+    pass
+
+
+class _TrackedHTTPSConnection(_TrackedConnection, HTTPSConnection):
+    pass
+
+
+class _TrackedPool:
+    def _get_conn(self, timeout=None):
+        connection = super()._get_conn(timeout)
+        _attach(connection)
+        return connection
+
+
+class _TrackedHTTPPool(_TrackedPool, HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+
+class _TrackedHTTPSPool(_TrackedPool, HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+
+class _TrackingAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools attach each connection to the current attempt"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TrackedHTTPPool, "https": _TrackedHTTPSPool}
+
+
+@dataclass
+class FetchResult:
+    """One completed fetch"""
+    url: str
+    status_code: int
+    text: str
+    headers: Dict[str, str]
+    elapsed: float
+    wire_bytes: int
+    body_bytes: int
+    hedged: bool = False
+
+
+class Transport:
+    """Wraps a ``requests.Session`` tuned for concurrent fetch workers
+
+    - The connection pool holds ``pool_size`` keep-alive connections so every
+      fetch worker (plus a hedge) can reuse one instead of reconnecting.
+    - ``Accept-Encoding`` advertises every codec urllib3 can decode: gzip,
+      deflate and brotli (``brotli`` is in requirements.txt; a warning is
+      logged if it is missing), plus zstd when that package is installed.
+    - Connect and read timeouts are separate, and a watchdog started before
+      the request aborts any fetch still connecting, waiting for headers or
+      streaming its body ``total_timeout`` seconds after it began.
+    - With hedging on, once enough latencies are known a second attempt is
+      fired when the first has not answered within the observed p95, and the
+      first response wins and aborts the other. The first attempt runs in
+      the caller's thread and backups in their own pool of ``hedge_workers``
+      threads; while those are all busy, hedges are skipped rather than
+      queued. ``hedge_budget`` caps hedges as a fraction of requests so a
+      slow upstream is not hit twice as hard.
+    - Pages served with an ``ETag`` or ``Last-Modified`` are remembered
+      (compressed, up to ``validator_cache_size`` URLs) and re-requested
+      conditionally; a ``304`` is answered from the stored body.
+    """
+
+    def __init__(
+        self,
+        pool_size: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        total_timeout: Optional[float] = None,
+        hedge: Optional[bool] = None,
+        hedge_min_samples: Optional[int] = None,
+        hedge_budget: Optional[float] = None,
+        hedge_workers: Optional[int] = None,
+        validator_cache_size: Optional[int] = None,
+    ):
+        self.pool_size = pool_size or config.HTTP_POOL_SIZE
+        self.connect_timeout = connect_timeout or config.CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or config.READ_TIMEOUT
+        self.total_timeout = total_timeout or config.TOTAL_TIMEOUT
+        self.hedge = config.HEDGE_REQUESTS if hedge is None else hedge
+        self.hedge_min_samples = hedge_min_samples or config.HEDGE_MIN_SAMPLES
+        self.hedge_budget = config.HEDGE_BUDGET if hedge_budget is None else hedge_budget
+        self.hedge_workers = hedge_workers or config.HEDGE_WORKERS
+        self.validator_cache_size = (
+            config.HTTP_VALIDATOR_CACHE_SIZE if validator_cache_size is None else validator_cache_size
+        )
+
+        self.session = requests.Session()
+        adapter = _TrackingAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": config.USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING})
+        if "br" not in ACCEPT_ENCODING:
+            logger.warning("⚠️  brotli is not installed: fetches will not accept brotli-compressed pages")
+
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._hedge_slots = threading.BoundedSemaphore(self.hedge_workers)
+        # URL → (ETag, Last-Modified, zlib-compressed body)
+        self._validators: "OrderedDict[str, Tuple[Optional[str], Optional[str], bytes]]" = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Start a fresh set of counters (called at the start of each run)"""
+        with self._lock:
+            self._stats = {
+                "requests": 0,
+                "wire_bytes": 0,
+                "body_bytes": 0,
+                "seconds": 0.0,
+                "hedges": 0,
+                "hedge_wins": 0,
+                "hedges_skipped": 0,
+                "deadline_exceeded": 0,
+                "not_modified": 0,
+            }
+
+    def stats(self) -> dict:
+        """Counters since the last reset plus current latency percentiles"""
+        with self._lock:
+            data = dict(self._stats)
+            latencies = sorted(self._latencies)
+        data["seconds"] = round(data["seconds"], 3)
+        data["p50_seconds"] = round(_percentile(latencies, 0.50), 3)
+        data["p95_seconds"] = round(_percentile(latencies, 0.95), 3)
+        return data
+
+    def export_state(self) -> dict:
+        """Cookies, cached validators and recent latencies, as JSON-serialisable data"""
+        with self._lock:
+            validators = [
+                [url, etag, modified, base64.b64encode(body).decode()]
+                for url, (etag, modified, body) in self._validators.items()
+            ]
+            latencies = list(self._latencies)
+        cookies = [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "expires": cookie.expires,
+                "secure": cookie.secure,
+            }
+            for cookie in self.session.cookies
+            if not cookie.is_expired()
+        ]
+        return {"cookies": cookies, "validators": validators, "latencies": latencies}
+
+    def import_state(self, state: dict) -> None:
+        """Restore ``export_state`` output (e.g. from a warm-start snapshot)"""
+        for cookie in state.get("cookies", []):
+            self.session.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie["domain"],
+                path=cookie["path"],
+                expires=cookie["expires"],
+                secure=cookie["secure"],
+            )
+        with self._lock:
+            for url, etag, modified, body in state.get("validators", [])[-self.validator_cache_size:]:
+                self._validators[url] = (etag, modified, base64.b64decode(body))
+            self._latencies.extend(state.get("latencies", []))
+
+    def _remember(self, url: str, headers: Dict[str, str], body: bytes) -> None:
+        etag, modified = headers.get("ETag"), headers.get("Last-Modified")
+        if not (etag or modified) or self.validator_cache_size <= 0:
+            return
+        with self._lock:
+            self._validators[url] = (etag, modified, zlib.compress(body, 6))
+            self._validators.move_to_end(url)
+            while len(self._validators) > self.validator_cache_size:
+                self._validators.popitem(last=False)
+
+    def _conditional_headers(self, url: str) -> Tuple[Dict[str, str], Optional[bytes]]:
+        with self._lock:
+            cached = self._validators.get(url)
+        if cached is None:
+            return {}, None
+        etag, modified, body = cached
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+        return headers, body
+
+    def hedge_after(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None when hedging is off"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            if self._stats["hedges"] >= self.hedge_budget * max(self._stats["requests"], 1):
+                return None
+            return _percentile(sorted(self._latencies), 0.95)
+
+    def get(self, url: str) -> FetchResult:
+        """GET ``url``, raising ``requests.RequestException`` subclasses on failure"""
+        delay = self.hedge_after()
+        result = self._fetch(url) if delay is None else self._hedged(url, delay)
+
+        with self._lock:
+            self._latencies.append(result.elapsed)
+            self._stats["requests"] += 1
+            self._stats["wire_bytes"] += result.wire_bytes
+            self._stats["body_bytes"] += result.body_bytes
+            self._stats["seconds"] += result.elapsed
+            if result.hedged:
+                self._stats["hedge_wins"] += 1
+
+        logger.debug(
+            "Fetched %s in %.3fs: %d B on the wire, %d B decoded%s",
+            url, result.elapsed, result.wire_bytes, result.body_bytes, " (hedge won)" if result.hedged else "",
+        )
+        return result
+
+    def _hedged(self, url: str, delay: float) -> FetchResult:
+        primary, backup = _Attempt(), _Attempt()
+        lock = threading.Lock()
+        state = {"settled": False, "backup": None}
+
+        def fire() -> None:
+            with lock:
+                if state["settled"]:
+                    return
+                if not self._hedge_slots.acquire(blocking=False):
+                    with self._lock:
+                        self._stats["hedges_skipped"] += 1
+                    return
+                with self._lock:
+                    self._stats["hedges"] += 1
+                    if self._hedge_pool is None:
+                        self._hedge_pool = ThreadPoolExecutor(
+                            max_workers=self.hedge_workers, thread_name_prefix="hedge"
+                        )
+                future = self._hedge_pool.submit(self._fetch, url, True, backup)
+                future.add_done_callback(backup_done)
+                state["backup"] = future
+
+        def backup_done(future: Future) -> None:
+            self._hedge_slots.release()
+            if future.exception() is None:
+                primary.abort()
+
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        timer.start()
+        try:
+            result = self._fetch(url, False, primary)
+        except requests.RequestException as error:
+            with lock:
+                state["settled"] = True
+                timer.cancel()
+                future = state["backup"]
+            if future is None:
+                raise
+            # Aborted because the backup won, or failed while it is still going
+            try:
+                return future.result()
+            except requests.RequestException:
+                raise error
+
+        with lock:
+            state["settled"] = True
+            timer.cancel()
+        backup.abort()
+        return result
+
+    def _fetch(self, url: str, hedged: bool = False, attempt: Optional[_Attempt] = None) -> FetchResult:
+        started = time.monotonic()
+        attempt = attempt or _Attempt()
+        conditional, cached = self._conditional_headers(url)
+
+        # Neither headers sent slowly nor a body trickled byte by byte trip
+        # the read timeout, so a watchdog shuts the connection down once the
+        # total deadline passes, wherever the request has got to
+        watchdog = threading.Timer(self.total_timeout, attempt.abort, (True,))
+        watchdog.daemon = True
+        watchdog.start()
+        _current.attempt = attempt
+        response = None
+
+        try:
+            response = self.session.get(
+                url,
+                headers=conditional,
+                timeout=(min(self.connect_timeout, self.total_timeout), self.read_timeout),
+                stream=True,
+            )
+            response.raise_for_status()
+            chunks = []
+            for chunk in response.iter_content(chunk_size=16384):
+                chunks.append(chunk)
+                if attempt.cancelled:
+                    break
+            if attempt.expired or attempt.cancelled:
+                raise requests.ConnectionError(f"aborted fetch of {url}")
+
+            body = b"".join(chunks)
+            wire_bytes = response.raw.tell() or len(body)
+            if response.status_code == 304 and cached is not None:
+                # Unchanged since the stored copy
+                body = zlib.decompress(cached)
+                with self._lock:
+                    self._stats["not_modified"] += 1
+            else:
+                self._remember(url, response.headers, body)
+            response._content = body
+            return FetchResult(
+                url=url,
+                status_code=response.status_code,
+                text=response.text,
+                headers=dict(response.headers),
+                elapsed=time.monotonic() - started,
+                wire_bytes=wire_bytes,
+                body_bytes=len(body),
+                hedged=hedged,
+            )
+        except (requests.RequestException, OSError) as error:
+            if attempt.cancelled:
+                raise _Cancelled(f"abandoned hedged fetch of {url}") from error
+            if attempt.expired:
+                with self._lock:
+                    self._stats["deadline_exceeded"] += 1
+                raise DeadlineExceeded(
+                    f"Fetching {url} exceeded the {self.total_timeout:.0f}s deadline"
+                ) from error
+            raise
+        finally:
+            watchdog.cancel()
+            attempt.detach()
+            _current.attempt = None
+            if response is not None:
+                response.close()
+
+
+def _shutdown(connection) -> None:
+    """Unblock a request stuck on a slow or stalled connection"""
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
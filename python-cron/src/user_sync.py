@@ -0,0 +1,168 @@
+"""Incremental sync of active subscribers using the users.updated_at watermark"""
+
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from .config import config
+from .database import db
+from .models import User
+from .logger import logger
+
+SNAPSHOT_VERSION = 1
+
+
+@dataclass
+class UserChanges:
+    """Subscriptions that changed during a sync"""
+    added: List[User] = field(default_factory=list)
+    removed: List[int] = field(default_factory=list)
+    updated: List[User] = field(default_factory=list)
+    url_changed: List[User] = field(default_factory=list)
+    full: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.updated)
+
+
+class UserSync:
+    """Keeps an in-memory (optionally on-disk) snapshot of active users
+
+    The first sync, and one every ``USER_FULL_SYNC_INTERVAL`` seconds, reads
+    the whole table. In between only rows whose ``updated_at`` is at or past
+    the watermark are pulled, so deactivations and URL changes are picked up
+    without a full scan. The periodic full sync catches hard deletes. Tables
+    without an ``updated_at`` column always fall back to a full sync.
+
+    ``last_checked_ad_id`` is written by this process and does not bump
+    ``updated_at``, so the snapshot keeps the in-memory value callers update
+    on the shared ``User`` objects.
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None, full_sync_interval: Optional[float] = None):
+        self.snapshot_path = snapshot_path if snapshot_path is not None else config.USER_SNAPSHOT_PATH
+        self.full_sync_interval = (
+            full_sync_interval if full_sync_interval is not None else config.USER_FULL_SYNC_INTERVAL
+        )
+        self.users: Dict[int, User] = {}
+        self.watermark: Optional[str] = None
+        self.last_full_sync = 0.0
+
+        if self.snapshot_path:
+            self.load()
+
+    def active_users(self) -> List[User]:
+        """Active users ordered by ID, as ``get_active_users`` returns them"""
+        return [self.users[user_id] for user_id in sorted(self.users)]
+
+    def sync(self) -> UserChanges:
+        """Bring the snapshot up to date and return what changed"""
+        due_full = time.time() - self.last_full_sync >= self.full_sync_interval
+        if self.watermark is None or due_full or not db.supports_incremental_sync():
+            changes = self._full_sync()
+        else:
+            changes = self._apply(db.get_users_changed_since(self.watermark))
+
+        if changes:
+            logger.info(
+                f"🔁 User sync{' (full)' if changes.full else ''}: "
+                f"+{len(changes.added)} -{len(changes.removed)} ~{len(changes.updated)} "
+                f"({len(self.users)} active)"
+            )
+        self.save()
+        return changes
+
+    def _full_sync(self) -> UserChanges:
+        fresh = {user.id: user for user in db.get_active_users()}
+        changes = UserChanges(full=True)
+
+        for user_id in list(self.users):
+            if user_id not in fresh:
+                del self.users[user_id]
+                changes.removed.append(user_id)
+
+        self._apply(list(fresh.values()), changes)
+        self.last_full_sync = time.time()
+        return changes
+
+    def _apply(self, rows: List[User], changes: Optional[UserChanges] = None) -> UserChanges:
+        if changes is None:
+            changes = UserChanges()
+
+        for user in rows:
+            if user.updated_at and (self.watermark is None or user.updated_at > self.watermark):
+                self.watermark = user.updated_at
+
+            current = self.users.get(user.id)
+            if not user.active:
+                if current is not None:
+                    del self.users[user.id]
+                    changes.removed.append(user.id)
+                continue
+
+            if current is None:
+                self.users[user.id] = user
+                changes.added.append(user)
+            elif current != user:
+                self._replace(current, user, changes)
+
+        return changes
+
+    def _replace(self, current: User, user: User, changes: UserChanges) -> None:
+        if user.spareroom_url != current.spareroom_url:
+            # A new search starts from whatever watermark the app stored
+            changes.url_changed.append(user)
+        elif user.updated_at is not None and current.updated_at == user.updated_at:
+            # Same row version: only our own last_checked_ad_id can differ
+            return
+
+        self.users[user.id] = user
+        changes.updated.append(user)
+
+    def to_state(self) -> dict:
+        """The snapshot as JSON-serialisable data"""
+        return {
+            "version": SNAPSHOT_VERSION,
+            "watermark": self.watermark,
+            "last_full_sync": self.last_full_sync,
+            "users": [asdict(user) for user in self.active_users()],
+        }
+
+    def restore(self, data: dict) -> None:
+        """Replace the snapshot with ``to_state`` output, raising if it is unusable"""
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {data.get('version')}")
+        self.users = {item["id"]: User(**item) for item in data["users"]}
+        self.watermark = data.get("watermark")
+        self.last_full_sync = float(data.get("last_full_sync", 0.0))
+
+    def load(self) -> bool:
+        """Load the on-disk snapshot, returning whether it was usable"""
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                self.restore(json.load(f))
+        except FileNotFoundError:
+            return False
+        except Exception as error:
+            logger.warning(f"⚠️  Ignoring unreadable user snapshot {self.snapshot_path}: {error}")
+            self.users, self.watermark, self.last_full_sync = {}, None, 0.0
+            return False
+
+        logger.debug(f"Loaded {len(self.users)} user(s) from {self.snapshot_path}")
+        return True
+
+    def save(self) -> None:
+        """Write the snapshot atomically when a snapshot path is configured"""
+        if not self.snapshot_path:
+            return
+
+        data = self.to_state()
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as error:
+            logger.warning(f"⚠️  Could not save user snapshot: {error}")
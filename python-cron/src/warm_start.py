@@ -0,0 +1,160 @@
+"""Warm-start snapshot of in-process state, carried between one-shot runs
+
+Serverless instances are reused for later invocations and keep their temp
+directory. With ``WARM_START`` on, a run saves what it has built up to
+``WARM_START_PATH`` when it finishes, and the next run on the same
+instance restores it instead of starting cold:
+
+- session cookies, HTTP validators (``ETag``/``Last-Modified`` with the
+  stored page) and recent fetch latencies, which drive hedging;
+- cached detail-page lookups;
+- the user snapshot with its ``updated_at`` watermark, so only changed
+  rows are read;
+- the rate limiter's next free slot.
+
+The parse cache is a file already; with warm start on it defaults to one
+next to the snapshot.
+
+The file is ``MAGIC | version | payload length | SHA-256 | payload``, the
+payload being zlib-compressed JSON. A snapshot is only used when its
+version matches, its digest checks out, it is younger than
+``WARM_START_MAX_AGE``, it was written for the same database and no other
+instance has run since it was saved. It is deleted as it is loaded, so a
+run that dies halfway leaves the next one to start cold. Anything
+unusable is logged and ignored: the run just starts cold.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+from typing import Optional
+
+from .config import config
+from .database import db
+from .enrichment import enricher
+from .rate_limiter import rate_limiter
+from .scraper import scraper
+from .user_sync import UserSync
+from .logger import logger
+
+MAGIC = b"SRWS"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxI32s")  # magic, version, payload length, SHA-256 of payload
+
+
+def _database_key() -> str:
+    return hashlib.sha256(os.path.abspath(config.DATABASE_PATH).encode()).hexdigest()[:16]
+
+
+def encode(state: dict) -> bytes:
+    payload = zlib.compress(json.dumps(state, separators=(",", ":")).encode(), 6)
+    return HEADER.pack(MAGIC, VERSION, len(payload), hashlib.sha256(payload).digest()) + payload
+
+
+def decode(blob: bytes) -> dict:
+    """The state in a snapshot file, raising ``ValueError`` if it is unusable"""
+    if len(blob) < HEADER.size:
+        raise ValueError("truncated header")
+    magic, version, length, digest = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("not a warm-start snapshot")
+    if version != VERSION:
+        raise ValueError(f"unsupported version {version}")
+    payload = blob[HEADER.size:]
+    if len(payload) != length or hashlib.sha256(payload).digest() != digest:
+        raise ValueError("checksum mismatch")
+    return json.loads(zlib.decompress(payload))
+
+
+def load(path: Optional[str] = None, max_age: Optional[float] = None) -> Optional[dict]:
+    """Read and remove the snapshot; None (a cold start) unless it is usable"""
+    path = path or config.WARM_START_PATH
+    max_age = config.WARM_START_MAX_AGE if max_age is None else max_age
+    try:
+        with open(path, "rb") as f:
+            blob = f.read()
+    except FileNotFoundError:
+        logger.info("🧊 Cold start: no warm-start snapshot")
+        return None
+    except OSError as error:
+        logger.warning(f"⚠️  Could not read warm-start snapshot {path}: {error}; starting cold")
+        return None
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+    try:
+        state = decode(blob)
+        age = time.time() - state["saved_at"]
+        if not 0 <= age <= max_age:
+            raise ValueError(f"saved {age:.0f}s ago (limit {max_age:.0f}s)")
+        if state["database"] != _database_key():
+            raise ValueError("written for another database")
+        if any(run["status"] != "skipped" for run in db.get_cron_runs(state["saved_at"])):
+            raise ValueError("another run has finished since it was saved")
+    except Exception as error:
+        logger.warning(f"⚠️  Ignoring warm-start snapshot {path} ({error}); starting cold")
+        return None
+
+    state["age"] = age
+    return state
+
+
+def restore(user_sync: Optional[UserSync] = None) -> bool:
+    """Restore the saved state into this process; False on a cold start"""
+    state = load()
+    if state is None:
+        return False
+
+    sections = state["sections"]
+    targets = {"transport": scraper.transport, "rate_limiter": rate_limiter, "enrichment": enricher}
+    for name, target in targets.items():
+        if target is not None and name in sections:
+            try:
+                target.import_state(sections[name])
+            except Exception as error:
+                logger.warning(f"⚠️  Could not restore {name} from the warm-start snapshot: {error}")
+
+    if user_sync is not None and "users" in sections:
+        try:
+            user_sync.restore(sections["users"])
+        except Exception as error:
+            logger.warning(f"⚠️  Could not restore users from the warm-start snapshot: {error}")
+            user_sync.users, user_sync.watermark, user_sync.last_full_sync = {}, None, 0.0
+
+    transport = sections.get("transport", {})
+    logger.info(
+        "♨️  Warm start from a %.0fs-old snapshot: %d user(s), %d cookie(s), %d stored page(s)",
+        state["age"],
+        len(user_sync.users) if user_sync is not None else 0,
+        len(transport.get("cookies", [])),
+        len(transport.get("validators", [])),
+    )
+    return True
+
+
+def save(user_sync: Optional[UserSync] = None, path: Optional[str] = None) -> None:
+    """Write the current state for the next run, atomically"""
+    path = path or config.WARM_START_PATH
+    sections = {"transport": scraper.transport.export_state(), "rate_limiter": rate_limiter.export_state()}
+    if enricher:
+        sections["enrichment"] = enricher.export_state()
+    if user_sync is not None:
+        sections["users"] = user_sync.to_state()
+
+    blob = encode({"saved_at": time.time(), "database": _database_key(), "sections": sections})
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+    except OSError as error:
+        logger.warning(f"⚠️  Could not save warm-start snapshot: {error}")
+        return
+    logger.debug("Saved %d byte warm-start snapshot to %s", len(blob), path)